@@ -35,7 +35,7 @@ document.addEventListener("DOMContentLoaded", async () => {
       
       function loadPlot(type) {
         if (plotContainer) plotContainer.classList.add('loading');
-        userPlotImg.src = `${API}/user-plot?token=${encodeURIComponent(token)}&kind=${type}&ts=${Date.now()}`;
+        userPlotImg.src = `${API}/user-plot?token=${encodeURIComponent(token)}&kind=${type}`;  // sin cache-buster: el navegador revalida con ETag (304)
       }
       
       // Click handlers para los botones de tipo de gráfica
@@ -333,6 +333,8 @@ async function initDashboard(token) {
 // FUNCIONES DE INTERFAZ
 // ==========================================
 
+let moodChartInstance = null;
+
 function renderStats(stats) {
   console.log("📈 Renderizando estadísticas:", stats);
 
@@ -346,7 +348,8 @@ function renderStats(stats) {
   if (window.Chart && stats.history) {
     const ctx = document.getElementById("moodChart");
     if (ctx) {
-      new Chart(ctx, {
+      if (moodChartInstance) moodChartInstance.destroy();
+      moodChartInstance = new Chart(ctx, {
         type: "line",
         data: {
           labels: stats.history.map((e) => e.date),
@@ -368,25 +371,62 @@ function renderStats(stats) {
 // WEBSOCKET (actualizaciones en tiempo real)
 // ==========================================
 
+let wsRetry = 0;
+let wsRefreshTimer = null;
+const wsPending = { stats: false, alerts: false };
+
+// Agrupa varias notificaciones seguidas en una sola recarga
+function scheduleRefresh(token, changes) {
+  if (changes.stats) wsPending.stats = true;
+  if (changes.alerts) wsPending.alerts = true;
+  clearTimeout(wsRefreshTimer);
+  wsRefreshTimer = setTimeout(async () => {
+    const what = { ...wsPending };
+    wsPending.stats = wsPending.alerts = false;
+    try {
+      if (what.stats) {
+        const res = await fetch(API + "/stats", { headers: { Authorization: "Bearer " + token } });
+        if (res.ok) renderStats(await res.json());
+      }
+      if (what.alerts) {
+        await loadRecommendations(token);
+        await loadAlerts(token);
+      }
+    } catch (e) {
+      console.warn("Error refrescando tras evento WS:", e);
+    }
+  }, 300);
+}
+
 function setupWebSocket(token) {
+  // Una sola conexión por pestaña: initDashboard se llama de nuevo tras cada encuesta
+  if (window.ws && window.ws.readyState <= 1) return;
   try {
-  const wsUrl = API.replace(/^http/, "ws") + `/ws/alerts?token=${token}`;
+    const wsUrl = API.replace(/^http/, "ws") + `/ws?token=${encodeURIComponent(token)}`;
     console.log("🌐 Conectando WebSocket:", wsUrl);
 
     const ws = new WebSocket(wsUrl);
     window.ws = ws;
 
-    ws.onopen = () => console.log("✅ WebSocket conectado");
-    ws.onclose = () => console.log("🔌 WebSocket cerrado");
+    ws.onopen = () => { wsRetry = 0; console.log("✅ WebSocket conectado"); };
     ws.onerror = (err) => console.error("⚠️ WebSocket error:", err);
+    ws.onclose = (event) => {
+      console.log("🔌 WebSocket cerrado", event.code);
+      // 1008 = token inválido; en otro caso reconectar con espera creciente
+      if (event.code === 1008 || !localStorage.getItem("token")) return;
+      const delay = Math.min(30000, 1000 * 2 ** wsRetry++);
+      setTimeout(() => {
+        setupWebSocket(token);
+        scheduleRefresh(token, { stats: true, alerts: true });
+      }, delay);
+    };
 
     ws.onmessage = (event) => {
-      console.log("📨 WS mensaje recibido:", event.data);
       try {
         const msg = JSON.parse(event.data);
-        if (msg.type === "stats_update") {
-          renderStats(msg.data);
-        }
+        if (msg.type === "survey_created" || msg.type === "surveys_imported") scheduleRefresh(token, { stats: true });
+        else if (msg.type === "risk_changed") scheduleRefresh(token, { alerts: true });
+        else if (msg.type === "stats_update") renderStats(msg.data);
       } catch (e) {
         console.warn("Mensaje WS no válido:", event.data);
       }
@@ -1,35 +1,61 @@
 """
 analytics.py - Data processing, risk detection and visualizations.
-Generates data/alerts.csv and returns summaries for the API.
+Generates the alerts table (data/alerts.csv with the CSV backend) and returns
+summaries for the API. Data is read through app.storage.
+
+numpy/pandas are imported by the functions that use them, and
+matplotlib/seaborn on the first plot (plotting()), so importing the API
+does not load them. EMOTRACK_PREWARM=data|all loads them at startup
+instead (prewarm()).
 """
 
-import pandas as pd
+import io, os, threading, time
 from pathlib import Path
+from app import cache, keywords, lookups, metrics, storage, table
 BASE = Path(__file__).resolve().parent.parent
-DATA_DIR = BASE / "data"
+DATA_DIR = Path(os.environ.get("EMOTRACK_DATA_DIR", BASE / "data"))
 SURVEYS_CSV = DATA_DIR / "surveys.csv"
 ALERTS_CSV = DATA_DIR / "alerts.csv"
+PREWARM = os.environ.get("EMOTRACK_PREWARM", "").lower()   # "", "data" (numpy/pandas) or "all" (+ plotting stack)
+
+_plotting = None
+_plotting_lock = threading.Lock()
+
 
-# plotting utilities
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-import io
-sns.set_style('whitegrid')
+def plotting():
+    """(pyplot, seaborn) with the Agg backend and our style, imported on first use."""
+    global _plotting
+    if _plotting is None:
+        with _plotting_lock:
+            if _plotting is None:
+                import matplotlib
+                matplotlib.use('Agg')
+                import matplotlib.pyplot as plt
+                import seaborn as sns
+                sns.set_style('whitegrid')
+                _plotting = (plt, sns)
+    return _plotting
 
-NEGATIVE_KEYWORDS = ["mal","triste","estres","depres","ansiedad","angusti","suicid","suicida","no puedo"]
+
+def prewarm(plots=True):
+    """Import the data stack (and the plotting stack) now instead of on first use."""
+    import numpy, pandas  # noqa: F401
+    if plots:
+        plotting()
 
 WEIGHTS = {"mood_score":0.40,"sleep_hours":0.25,"appetite":0.20,"concentration":0.15}
 
+# Negative trend rule over each user's latest TREND_WINDOW mood_score readings:
+# strictly decreasing by default, or a least-squares slope <= -TREND_SLOPE_THRESHOLD
+# (points per reading) when a threshold is set.
+# Readings are ordered by created_at with a stable sort: surveys sharing a
+# timestamp keep file order, so the later row counts as the newer reading.
+TREND_WINDOW = int(os.environ.get("EMOTRACK_TREND_WINDOW", 3))
+TREND_SLOPE_THRESHOLD = float(os.environ["EMOTRACK_TREND_SLOPE"]) if os.environ.get("EMOTRACK_TREND_SLOPE") else None
+
 def notes_penalty(notes):
-    if not isinstance(notes,str):
-        return 0.0
-    text = notes.lower()
-    for kw in NEGATIVE_KEYWORDS:
-        if kw in text:
-            return 0.12
-    return 0.0
+    # accent/case-insensitive, configurable keyword list (app.keywords)
+    return keywords.screen.penalty(notes)
 
 def normalize_sleep(hours):
     try:
@@ -48,6 +74,7 @@ def scale_0_10_to_0_100(v):
         return 50.0
 
 def compute_composite(row):
+    import pandas as pd
     mood = row.get("mood_score", None)
     if pd.notna(mood) and mood != "":
         try:
@@ -64,68 +91,285 @@ def compute_composite(row):
     final = base * (1 - penalty)
     return round(final,2)
 
-def trend_negative_for_user(df_user):
-    if df_user.shape[0] < 3:
-        return False
-    vals = df_user.sort_values("created_at",ascending=False)["mood_score"].head(3).tolist()
-    if len(vals) < 3:
+def _parse_floats(df, col, default):
+    """Vectorized float(v) over a column.
+
+    Returns (values, parsed): `parsed` is False where float(v) would raise
+    (None, empty or non-numeric strings), mirroring the try/except fallbacks
+    of the row-wise helpers. A missing column behaves like row.get(col, default).
+    """
+    import numpy as np, pandas as pd
+    n = len(df)
+    if col not in df.columns:
+        return np.full(n, float(default)), np.ones(n, dtype=bool)
+    s = df[col]
+    if s.dtype != object:
+        return s.to_numpy(dtype=float, na_value=np.nan), np.ones(n, dtype=bool)
+    num = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    raw = s.to_numpy()
+    missing = s.isna().to_numpy()
+    parsed = ~np.isnan(num) | (missing & ~np.equal(raw, None))
+    return num, parsed
+
+def _scale_0_10_to_0_100(values, parsed):
+    # NaN goes through min()/max() as 100 in the row-wise version, unparseable as 50
+    import numpy as np
+    scaled = np.clip((values / 10.0) * 100, 0, 100)
+    return np.where(parsed, np.where(np.isnan(values), 100.0, scaled), 50.0)
+
+def _normalize_sleep(values, parsed):
+    # NaN hours end up as 0 in the row-wise version, unparseable as 50
+    import numpy as np
+    score = np.clip(100 - np.abs(values - 7.5) * 15, 0, 100)
+    return np.where(parsed, np.where(np.isnan(values), 0.0, score), 50.0)
+
+def _notes_penalty(df):
+    import numpy as np
+    if "notes" not in df.columns or df["notes"].dtype != object:
+        return np.zeros(len(df))
+    return keywords.screen.penalties(df["notes"].tolist())
+
+def _round2(values):
+    """round(v, 2) for an array with Python's exact semantics.
+
+    np.round scales by 100 first and disagrees with round() on .xx5 ties, so
+    values close to a tie are rounded one by one.
+    """
+    import numpy as np
+    out = np.round(values, 2)
+    scaled = values * 100
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        out[near_tie] = [round(v, 2) for v in values[near_tie].tolist()]
+    return out
+
+def composite_scores(df):
+    """Columnar equivalent of df.apply(compute_composite, axis=1).
+
+    Works on any DataFrame with the survey columns and returns a float Series
+    aligned with df.index, identical to the row-wise results.
+    """
+    import numpy as np, pandas as pd
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=float)
+    ms, ms_parsed = _parse_floats(df, "mood_score", np.nan)
+    mood_fallback = _scale_0_10_to_0_100(*_parse_floats(df, "mood", 5))
+    if "mood_score" in df.columns and df["mood_score"].dtype == object:
+        ms_present = df["mood_score"].notna().to_numpy() & (df["mood_score"] != "").to_numpy()
+    else:
+        ms_present = ~np.isnan(ms)
+    mood_v = np.where(ms_present & ms_parsed, ms, mood_fallback)
+    sleep = _normalize_sleep(*_parse_floats(df, "sleep_hours", 7))
+    appetite = _scale_0_10_to_0_100(*_parse_floats(df, "appetite", 5))
+    concentration = _scale_0_10_to_0_100(*_parse_floats(df, "concentration", 5))
+    base = WEIGHTS["mood_score"]*mood_v + WEIGHTS["sleep_hours"]*sleep + WEIGHTS["appetite"]*appetite + WEIGHTS["concentration"]*concentration
+    final = base * (1 - _notes_penalty(df))
+    return pd.Series(_round2(final), index=df.index)
+
+def is_negative_trend(values, window=TREND_WINDOW, slope_threshold=TREND_SLOPE_THRESHOLD):
+    """Trend rule for one user's latest readings, oldest first."""
+    vals = list(values)[-window:]
+    if len(vals) < window or window < 2:
         return False
     try:
-        return vals[0] < vals[1] < vals[2]
-    except:
+        if slope_threshold is None:
+            return all(a > b for a, b in zip(vals, vals[1:]))
+        ys = [float(v) for v in vals]
+        xm, ym = (window - 1) / 2, sum(ys) / window
+        slope = sum((x - xm) * (y - ym) for x, y in enumerate(ys)) / sum((x - xm) ** 2 for x in range(window))
+        return slope <= -slope_threshold
+    except Exception:
         return False
 
-def compute_risk():
-    # Load surveys
-    if not SURVEYS_CSV.exists():
-        return {"message":"no surveys", "n_users":0}
-    df = pd.read_csv(SURVEYS_CSV, parse_dates=["created_at"])
+def trend_negative_for_user(df_user):
+    vals = df_user.sort_values("created_at", kind="mergesort")["mood_score"].tolist()
+    return is_negative_trend(vals)
+
+def negative_trends(df, window=TREND_WINDOW, slope_threshold=TREND_SLOPE_THRESHOLD):
+    """Negative-trend flag per user_id, computed in one sorted groupby pass.
+
+    Vectorized form of trend_negative_for_user over the whole frame: sort once
+    by (user_id, created_at), keep the latest `window` rows per user and apply
+    the rule on those. Returns a bool Series indexed by user_id.
+    """
+    import pandas as pd
+    users = pd.Index(df["user_id"].dropna().unique())
+    if window < 2 or df.empty:
+        return pd.Series(False, index=users)
+    d = df[["user_id","created_at"]].assign(mood_score=pd.to_numeric(df["mood_score"], errors="coerce"))
+    d = d.sort_values(["user_id","created_at"], kind="mergesort").groupby("user_id", sort=False).tail(window)
+    key = d["user_id"]
+    y = d["mood_score"]
+    full = y.groupby(key).count() == window
+    if slope_threshold is None:
+        falling = (y.groupby(key).diff() < 0).groupby(key).sum() == window - 1
+        flags = full & falling
+    else:
+        x = d.groupby("user_id", sort=False).cumcount().astype(float)
+        xc = x - x.groupby(key).transform("mean")
+        yc = y - y.groupby(key).transform("mean")
+        slope = (xc * yc).groupby(key).sum() / (xc * xc).groupby(key).sum()
+        flags = full & (slope <= -slope_threshold)
+    return flags.reindex(users, fill_value=False).astype(bool)
+
+def risk_label(score, trend):
+    if trend: return "ALTO"
+    if score >= 80: return "BAJO"
+    if score >= 60: return "MODERADO"
+    return "ALTO"
+
+def ensure_recommendations_file():
+    rec_file = DATA_DIR / 'recommendations.csv'
+    if not rec_file.exists():
+        with rec_file.open('w', encoding='utf-8') as rf:
+            rf.write('risk_level,recommendation\nALTO,Contactar a un profesional de salud mental\nMODERADO,Monitoreo semanal y ejercicios de relajación\nBAJO,Mantener hábitos saludables\n')
+
+def compute_risk(write_alerts=True):
+    """Full batch risk computation over every survey.
+
+    Replaces the stored alerts unless `write_alerts` is False (used by the parity
+    check in app.risk). Per-insert updates go through app.risk.engine.
+    """
+    # Surveys from the in-memory table (only the columns the scoring needs)
+    backend = storage.get()
+    df = table.surveys.frame(columns=["user_id","username","mood","mood_score","sleep_hours","appetite","concentration","notes","created_at"])
     if df.empty:
         return {"message":"no data", "n_users":0}
     # ensure columns
     for c in ["mood_score","sleep_hours","appetite","concentration","notes"]:
         if c not in df.columns:
             df[c] = None
-    # compute composite per row
-    df["composite"] = df.apply(compute_composite, axis=1)
-    # average per user
-    user_avg = df.groupby(["user_id","username"])["composite"].mean().reset_index().rename(columns={"composite":"avg_score"})
-    # trend flags
-    trend_flags = []
-    for uid in user_avg["user_id"]:
-        df_user = df[df["user_id"]==uid]
-        trend_flags.append(trend_negative_for_user(df_user))
-    user_avg["trend_negative"] = trend_flags
-    # label mapping
-    def label(score,trend):
-        if trend: return "ALTO"
-        if score >= 80: return "BAJO"
-        if score >= 60: return "MODERADO"
-        return "ALTO"
-    user_avg["risk_level"] = user_avg.apply(lambda r: label(r["avg_score"], r["trend_negative"]), axis=1)
-    # write alerts.csv
-    user_avg.to_csv(ALERTS_CSV, index=False)
+    # compute composite per row (columnar, same results as compute_composite)
+    with metrics.stage("risk.scoring"):
+        df["composite"] = composite_scores(df)
+    with metrics.stage("risk.grouping"):
+        # average per user
+        user_avg = df.groupby(["user_id","username"])["composite"].mean().reset_index().rename(columns={"composite":"avg_score"})
+        # trend flags (single sorted groupby pass)
+        trends = negative_trends(df)
+        user_avg["trend_negative"] = user_avg["user_id"].map(trends).fillna(False).astype(bool)
+        user_avg["risk_level"] = user_avg.apply(lambda r: risk_label(r["avg_score"], r["trend_negative"]), axis=1)
+    # write alerts
+    if write_alerts:
+        records = user_avg.to_dict(orient="records")
+        backend.save_alerts(records)
+        lookups.alerts.saved(records)
     counts = user_avg["risk_level"].value_counts().to_dict()
-    import csv
-    # ensure recommendations.csv exists
-    rec_file = DATA_DIR / 'recommendations.csv'
-    if not rec_file.exists():
-        with rec_file.open('w', encoding='utf-8') as rf:
-            rf.write('risk_level,recommendation\nALTO,Contactar a un profesional de salud mental\nMODERADO,Monitoreo semanal y ejercicios de relajación\nBAJO,Mantener hábitos saludables\n')
+    ensure_recommendations_file()
     return {"counts":counts, "n_users": len(user_avg), "alerts": user_avg.to_dict(orient="records")}
 
 
 def get_recommendation_for_risk(risk_level):
-    rec_file = DATA_DIR / 'recommendations.csv'
-    if not rec_file.exists():
-        return ''
-    import csv
-    with rec_file.open(encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            if r['risk_level'].strip().upper() == risk_level.strip().upper():
-                return r['recommendation']
-    return ''
+    """Recommendation text for a risk level (in-memory map, see app.lookups)."""
+    return lookups.recommendations.get(risk_level)
+
+
+PLOT_COLUMNS = ['mood','sleep_hours','appetite','concentration','created_at']
+SUMMARY_LABELS = {'mood': 'Ánimo', 'sleep_hours': 'Sueño', 'appetite': 'Apetito', 'concentration': 'Concentración'}
+
+
+def _json_floats(values, digits=3):
+    return [None if v != v else round(float(v), digits) for v in values]
+
+
+def _histogram(values, bins):
+    import numpy as np
+    if not len(values):
+        return {"edges": [], "counts": []}
+    counts, edges = np.histogram(values, bins=bins)
+    return {"edges": _json_floats(edges), "counts": counts.tolist()}
+
+
+def _kde(values, edges, gridsize=100):
+    # Gaussian KDE with Scott's bandwidth (what seaborn's kde=True drew), scaled to the histogram's counts
+    import numpy as np
+    n = len(values)
+    if n < 2 or not values.std(ddof=1):
+        return None
+    bw = values.std(ddof=1) * n ** -0.2
+    x = np.linspace(values.min(), values.max(), gridsize)
+    density = np.exp(-0.5 * ((x[:, None] - values[None, :]) / bw) ** 2).sum(axis=1) / (n * bw * np.sqrt(2 * np.pi))
+    return {"x": _json_floats(x), "y": _json_floats(density * n * (edges[1] - edges[0]))}
+
+
+def _box(values):
+    """Quartiles and 1.5·IQR whiskers, as matplotlib's boxplot computes them."""
+    import numpy as np
+    if not len(values):
+        return None
+    q1, med, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {"min": float(values.min()), "q1": float(q1), "median": float(med), "q3": float(q3), "max": float(values.max()),
+            "whislo": float(inside.min()), "whishi": float(inside.max()), "mean": round(float(values.mean()), 3),
+            "fliers": _json_floats(values[(values < inside.min()) | (values > inside.max())])}
+
+
+def _plot_data(df_user, kind):
+    """(kind, data) one /user-plot chart is drawn from, for the PNG and the JSON alike.
+
+    The metric columns are read as numbers (text counts as missing):
+
+    - evolution: 'daily' mean mood (NaN on days without surveys) and its
+      3-day 'rolling' mean (None before 3 days of data)
+    - hist: the 'mood' values
+    - sleep: the 'sleep' hours
+    - summary: the 'means' of each metric (NaN when there is none)
+    """
+    import pandas as pd
+    k = cache.normalize_kind(kind)
+    numeric = {c: pd.to_numeric(df_user[c], errors='coerce') for c in SUMMARY_LABELS if c in df_user}
+    if k == 'hist':
+        return k, {"mood": numeric['mood'].dropna()}
+    if k == 'sleep':
+        return k, {"sleep": numeric['sleep_hours'].dropna() if 'sleep_hours' in numeric else pd.Series(dtype=float)}
+    if k == 'summary':
+        return k, {"means": {c: v.mean() for c, v in numeric.items()}}
+    daily = numeric['mood'].set_axis(pd.to_datetime(df_user['created_at'])).resample('D').mean()
+    return k, {"daily": daily, "rolling": daily.rolling(window=3, min_periods=1).mean() if len(daily) >= 3 else None}
+
+
+def plot_series(df_user, kind='evolution'):
+    """The numbers behind one /user-plot chart, JSON-ready.
+
+    df_user holds one user's PLOT_COLUMNS rows; the data is _plot_data's,
+    the same generate_user_plot draws:
+
+    - evolution: daily mean mood (null on days without surveys) and its
+      3-day rolling mean (from 3 days of data on)
+    - hist: 10 mood bins (edges, counts) and the KDE curve in counts
+    - sleep: sleep-hours box statistics and 8 bins
+    - summary: mean of each metric (null when there is none)
+    """
+    k, data = _plot_data(df_user, kind)
+    out = {"kind": k, "count": int(len(df_user))}
+    if k == 'hist':
+        mood = data["mood"].to_numpy(dtype=float)
+        out.update(_histogram(mood, 10))
+        out["kde"] = _kde(mood, out["edges"]) if len(mood) else None
+    elif k == 'sleep':
+        sleep = data["sleep"].to_numpy(dtype=float)
+        out["box"] = _box(sleep)
+        out.update(_histogram(sleep, 8))
+    elif k == 'summary':
+        out["means"] = {c: (None if v != v else round(float(v), 3)) for c, v in data["means"].items()}
+    else:
+        daily, rolling = data["daily"], data["rolling"]
+        out["dates"] = [d.strftime('%Y-%m-%d') for d in daily.index]
+        out["mood"] = _json_floats(daily.to_numpy())
+        out["rolling"] = _json_floats(rolling.to_numpy()) if rolling is not None else None
+    return out
+
+
+def _read_plot_rows(username):
+    return table.surveys.view(username).frame(PLOT_COLUMNS)
+
+
+def user_plot_data(username: str, kind: str = 'evolution') -> dict:
+    """plot_series for a user: the JSON mode of /user-plot (no plotting stack involved)."""
+    df_user = _read_plot_rows(username)
+    with metrics.stage("plot.data"):
+        return plot_series(df_user, kind)
 
 
 def generate_user_plot(username: str, kind: str = 'evolution') -> bytes:
@@ -133,42 +377,27 @@ def generate_user_plot(username: str, kind: str = 'evolution') -> bytes:
 
     kind: 'evolution' | 'hist' | 'sleep' | 'summary'
     """
-    if not SURVEYS_CSV.exists():
-        # Return a small image with a message
-        fig, ax = plt.subplots(figsize=(6,2))
-        ax.text(0.5,0.5,'No hay datos de encuestas', ha='center', va='center')
-        ax.axis('off')
-        buf = io.BytesIO()
-        plt.tight_layout()
-        fig.savefig(buf, format='png', dpi=120)
-        plt.close(fig)
-        buf.seek(0)
-        return buf.read()
-
-    df = pd.read_csv(SURVEYS_CSV, parse_dates=['created_at'])
-    df_user = df[df['username'] == username].copy()
+    plt, sns = plotting()
+    df_user = _read_plot_rows(username)
+    t0 = time.perf_counter()
     if df_user.empty:
         fig, ax = plt.subplots(figsize=(6,2))
         ax.text(0.5,0.5,f'Sin datos para {username}', ha='center', va='center')
         ax.axis('off')
     else:
-        df_user['mood'] = pd.to_numeric(df_user['mood'], errors='coerce')
-        df_user['created_at'] = pd.to_datetime(df_user['created_at'])
-        df_user = df_user.set_index('created_at')
-
-        k = kind.lower() if kind else 'evolution'
+        k, data = _plot_data(df_user, kind)
         if k == 'hist':
             fig, ax = plt.subplots(figsize=(7,3))
-            sns.histplot(df_user['mood'], bins=10, kde=True, color='#2563eb', ax=ax)
+            sns.histplot(data['mood'], bins=10, kde=True, color='#2563eb', ax=ax)
             ax.set_title(f'Distribución de ánimo — {username}')
 
         elif k == 'sleep':
             fig, axs = plt.subplots(1,2, figsize=(10,3))
-            if 'sleep_hours' in df_user and not df_user['sleep_hours'].dropna().empty:
-                sns.boxplot(x=df_user['sleep_hours'], color='#059669', ax=axs[0])
+            if not data['sleep'].empty:
+                sns.boxplot(x=data['sleep'], color='#059669', ax=axs[0])
                 axs[0].set_title('Boxplot de sueño')
                 axs[0].set_xlabel('Horas')
-                sns.histplot(df_user['sleep_hours'].dropna(), bins=8, color='#059669', ax=axs[1])
+                sns.histplot(data['sleep'], bins=8, color='#059669', ax=axs[1])
                 axs[1].set_title('Histograma de sueño')
                 axs[1].set_xlabel('Horas')
             else:
@@ -179,14 +408,8 @@ def generate_user_plot(username: str, kind: str = 'evolution') -> bytes:
             fig.suptitle(f'Análisis de sueño — {username}')
 
         elif k == 'summary':
-            metrics = {
-                'Ánimo': df_user['mood'].mean(),
-                'Sueño': df_user['sleep_hours'].mean() if 'sleep_hours' in df_user else None,
-                'Apetito': df_user['appetite'].mean() if 'appetite' in df_user else None,
-                'Concentración': df_user['concentration'].mean() if 'concentration' in df_user else None
-            }
-            labels = [kk for kk,vv in metrics.items() if vv is not None]
-            values = [vv for vv in metrics.values() if vv is not None]
+            labels = [SUMMARY_LABELS[c] for c in data['means']]
+            values = list(data['means'].values())
             colors = ['#2563eb','#059669','#10b981','#f59e0b'][:len(values)]
             fig, ax = plt.subplots(figsize=(8,3))
             if values:
@@ -201,17 +424,19 @@ def generate_user_plot(username: str, kind: str = 'evolution') -> bytes:
                 ax.axis('off')
 
         else:
-            daily = df_user['mood'].resample('D').mean()
+            daily = data['daily']
             fig, ax = plt.subplots(figsize=(8,3))
             ax.plot(daily.index, daily.values, marker='o', color='#2563eb', label='Ánimo diario')
-            if len(daily) >= 3:
-                rolling = daily.rolling(window=3, min_periods=1).mean()
+            if data['rolling'] is not None:
+                rolling = data['rolling']
                 ax.plot(rolling.index, rolling.values, linestyle='--', color='#f59e0b', label='Media móvil (3d)')
             ax.set_title(f'Evolución de ánimo — {username}')
 
+    metrics.record("plot.figure", time.perf_counter() - t0)
     buf = io.BytesIO()
-    plt.tight_layout()
-    fig.savefig(buf, format='png', dpi=120)
-    plt.close(fig)
+    with metrics.stage("plot.savefig"):
+        plt.tight_layout()
+        fig.savefig(buf, format='png', dpi=120)
+        plt.close(fig)
     buf.seek(0)
     return buf.read()
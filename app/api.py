@@ -1,22 +1,24 @@
 # api.py - HTTP endpoints only. Heavy logic moved to models/utils/analytics.
-from fastapi import FastAPI, HTTPException, Header, WebSocket
-from fastapi.responses import Response
+from fastapi import Depends, FastAPI, HTTPException, Header, Query, Request, WebSocket
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
-import time
+from datetime import date
+import asyncio, json, os, time
 
 # Local utilities and modules
-from app.utils import create_access_token, decode_access_token, read_csv_rows, write_csv_rows, get_user_from_token
-from app import analytics, models
+from app.utils import create_access_token, decode_access_token, read_csv_rows, write_csv_rows, get_user_from_token, token_cache
+from app import analytics, models, store, risk, cache, render, storage, rollups, events, ingest, export, lookups, writer, metrics, cluster, table
 from app.models import Register, Login, SurveyCreate
-import pandas as pd
 
 # Paths
 BASE = Path(__file__).resolve().parent.parent
-DATA_DIR = BASE / "data"
+DATA_DIR = Path(os.environ.get("EMOTRACK_DATA_DIR", BASE / "data"))
 USERS_CSV = DATA_DIR / "users.csv"
 SURVEYS_CSV = DATA_DIR / "surveys.csv"
 ALERTS_CSV = DATA_DIR / "alerts.csv"
+WRITE_UNAVAILABLE = "No se pudo guardar ahora, intenta de nuevo"
 
 # App
 app = FastAPI(title="EmoTrack API")
@@ -27,58 +29,162 @@ FRONTEND_ORIGINS = [
     "http://localhost:5173",
 ]
 app.add_middleware(CORSMiddleware, allow_origins=FRONTEND_ORIGINS, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+# Per-route latency for /metrics; `X-Profile: 1` from an admin samples that one request
+app.add_middleware(metrics.MetricsMiddleware, profile_guard=lambda headers: (get_user_from_token(headers.get('authorization')) or {}).get('role') == 'admin')
 
-# In-memory websocket connections set
-connections = set()
+# In-memory websocket connections set (subscribers of the /ws broadcaster)
+connections = events.hub.connections
+risk.engine.listeners.append(events.hub.alert_changed)
 
 
-@app.get("/user-plot")
-def user_plot(token: str | None = None, Authorization: str | None = Header(None), kind: str = "evolution"):
-    """Return a PNG image with user's plots. Delegates plotting to app.analytics.generate_user_plot."""
-    auth_value = Authorization if Authorization else (f"Bearer {token}" if token else None)
-    user = get_user_from_token(auth_value)
+def current_user(Authorization: str | None = Header(None)):
+    """Auth dependency: the user of the Authorization header's token, or None.
+
+    Verification goes through utils.token_cache, so the same token sent by
+    several requests is only decoded once until it expires.
+    """
+    return get_user_from_token(Authorization)
+
+
+def current_user_or_query(Authorization: str | None = Header(None), token: str | None = Query(None)):
+    """current_user, falling back to ?token= for URLs the browser loads itself (<img src>).
+
+    Only /user-plot uses it (/ws reads its own ?token=): a token in a URL
+    ends up in access logs, proxies and browser history.
+    """
+    return get_user_from_token(Authorization or token)
+
+
+def _authenticated(user):
     if not user or not user.get('username'):
         raise HTTPException(status_code=401, detail="No autenticado")
+    return user
+
+
+def require_user(user: dict | None = Depends(current_user)):
+    return _authenticated(user)
+
+
+def require_user_or_query(user: dict | None = Depends(current_user_or_query)):
+    return _authenticated(user)
+
+
+@app.on_event("startup")
+def prewarm_analytics():
+    # numpy/pandas and matplotlib load on first use unless EMOTRACK_PREWARM=data|all
+    if analytics.PREWARM:
+        analytics.prewarm(plots=analytics.PREWARM != "data")
+
+
+@app.on_event("startup")
+def join_cluster():
+    # `main.py --workers N`: writes, cache invalidation and /ws events are shared with the other workers
+    if cluster.node.enabled:
+        cluster.node.listeners.append(writer.commits.replay)
+        cluster.node.start()
+
+
+@app.on_event("startup")
+def start_plot_workers():
+    render.plots.start()
+
+
+@app.on_event("shutdown")
+def stop_plot_workers():
+    render.plots.shutdown()
+    writer.commits.stop()
+    cluster.node.stop()
+
+
+@app.get("/user-plot")
+async def user_plot(user: dict = Depends(require_user_or_query), kind: str = "evolution", fmt: str = Query("png", alias="format"), If_None_Match: str | None = Header(None)):
+    """Return a PNG image with user's plots. Delegates plotting to app.analytics.generate_user_plot.
+
+    ?format=json returns the chart's data instead (analytics.plot_series,
+    the same numbers the PNG shows) for clients that draw it
+    themselves; it is computed on this worker, without the plotting stack.
+
+    Both are cached per (username, kind, format, data version) and served
+    with an ETag; a matching If-None-Match gets a 304 without rendering.
+    PNG misses are rendered by the app.render worker pool, not on this worker.
+    """
     username = user['username']
+    kind = cache.normalize_kind(kind)
+    fmt = (fmt or "png").lower()
+    if fmt not in cache.PLOT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato no soportado (png o json)")
+    version = cache.plots.version(username)
+    headers = {"ETag": cache.plots.etag(username, kind, version, fmt), "Cache-Control": "private, no-cache"}
+    if If_None_Match and headers["ETag"] in [t.strip() for t in If_None_Match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    body = cache.plots.get(username, kind, version, fmt)
+    if body is None and fmt == "json":
+        data = await run_in_threadpool(analytics.user_plot_data, username, kind)
+        body = json.dumps({"username": username, **data}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        cache.plots.put(username, kind, version, body, fmt)
+    elif body is None:
+        try:
+            body = await render.plots.render(username, kind, version)
+        except render.Overloaded:
+            raise HTTPException(status_code=503, detail="Servidor de gráficas ocupado, intenta de nuevo", headers={"Retry-After": "2"})
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Tiempo de generación de gráfica agotado")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error generando gráfica: {e}")
+        cache.plots.put(username, kind, version, body)
+
+    return Response(content=body, media_type='application/json' if fmt == "json" else 'image/png', headers=headers)
 
-    try:
-        img_bytes = analytics.generate_user_plot(username, kind=kind)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generando gráfica: {e}")
 
-    return Response(content=img_bytes, media_type='image/png')
+@app.get("/plot-cache")
+def plot_cache_stats(user: dict | None = Depends(current_user)):
+    """Counters of the /user-plot cache and render pool (admin only)."""
+    if not user or user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Solo administradores")
+    return {**cache.plots.stats(), "renderer": render.plots.stats()}
+
+
+@app.websocket("/ws")
+@app.websocket("/ws/alerts")
+async def live_events(websocket: WebSocket, token: str | None = None):
+    """Push survey and risk-level events; token via ?token= or Authorization header."""
+    user = get_user_from_token(token or websocket.headers.get('authorization'))
+    # accept before closing: a close during the handshake reaches the browser as 1006, not 1008
+    await websocket.accept()
+    if not user or not user.get('username'):
+        await websocket.close(code=1008, reason="Token inválido")
+        return
+    await events.hub.serve(websocket, user)
 
 
 @app.post("/register")
 def register(payload: Register):
-    DATA_DIR.mkdir(exist_ok=True, parents=True)
-    rows = read_csv_rows(USERS_CSV)
-    for row in rows:
-        if row["username"].lower() == payload.username.lower():
-            raise HTTPException(status_code=400, detail="Username already taken")
-        if row["email"].lower() == payload.email.lower():
-            raise HTTPException(status_code=400, detail="Email already registered")
-
-    next_id = max([int(row["id"]) for row in rows]) + 1 if rows else 1
     role = payload.role if payload.role else ('admin' if payload.username.lower() in ['admin','administrator','root'] else 'user')
     new_user = {
-        "id": next_id,
         "username": payload.username,
         "email": payload.email,
         "hashed_password": payload.password,
         "role": role,
         "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")
     }
-    rows.append(new_user)
-    write_csv_rows(USERS_CSV, rows, ["id","username","email","hashed_password","role","created_at"])
+    # Uniqueness check + append happen in the group writer, against the in-memory user index
+    try:
+        new_user = writer.wait(writer.commits.add_user(new_user))
+    except writer.Unavailable:
+        raise HTTPException(status_code=503, detail=WRITE_UNAVAILABLE, headers={"Retry-After": "2"})
+    except ValueError as e:
+        if str(e) == "username":
+            raise HTTPException(status_code=400, detail="Username already taken")
+        raise HTTPException(status_code=400, detail="Email already registered")
+    next_id = new_user["id"]
     token = create_access_token({"user_id": next_id, "username": payload.username, "role": role})
     return {"access_token": token, "token_type": "bearer", "user": {"id": next_id, "username": payload.username, "role": role}}
 
 
 @app.post("/login")
 def login(payload: Login):
-    rows = read_csv_rows(USERS_CSV)
-    for r in rows:
+    for r in store.users.by_username(payload.username):
         if r["username"] == payload.username and r["hashed_password"] == payload.password:
             token = create_access_token({"user_id": int(r["id"]), "username": r["username"], "role": r.get('role','user')})
             return {"access_token": token, "token_type":"bearer", "user_id": r["id"], "username": r["username"], "role": r.get('role','user')}
@@ -86,56 +192,121 @@ def login(payload: Login):
 
 
 @app.post("/surveys")
-def create_survey(s: SurveyCreate, Authorization: str | None = Header(None)):
-    user = get_user_from_token(Authorization)
-    if not user or not user.get('username'):
-        raise HTTPException(status_code=401, detail="No autenticado")
-    DATA_DIR.mkdir(exist_ok=True, parents=True)
-    rows = read_csv_rows(SURVEYS_CSV) if SURVEYS_CSV.exists() else []
-    next_id = max([int(r["id"]) for r in rows]) + 1 if rows else 1
+def create_survey(s: SurveyCreate, user: dict = Depends(require_user)):
     user_id = user["user_id"]
     username = user["username"]
-    mood_score = s.mood_score if s.mood_score is not None else min(100, max(0, s.mood*10))
-    if not s.mood or s.mood < 1 or s.mood > 10:
+    try:
+        row = ingest.survey_row(s, user_id, username)
+    except ValueError:
         raise HTTPException(status_code=400, detail="Invalid mood value")
-    row = {"id": next_id, "user_id": user_id, "username": username, "mood": s.mood, "mood_score": mood_score, "sleep_hours": s.sleep_hours if s.sleep_hours is not None else "", "appetite": s.appetite if s.appetite is not None else "", "concentration": s.concentration if s.concentration is not None else "", "notes": s.notes or "", "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
-    rows.append(row)
-    fieldnames = ["id","user_id","username","mood","mood_score","sleep_hours","appetite","concentration","notes","created_at"]
-    write_csv_rows(SURVEYS_CSV, rows, fieldnames)
-    # Keep analytics.compute_risk call optional but silent (it may exist)
+    # Group commit (app.writer): id assigned, appended and fsynced together with
+    # concurrent requests; rollup, risk, plot cache and events updated before we return
     try:
-        analytics.compute_risk()
-    except Exception:
-        pass
+        row = writer.wait(writer.commits.add_surveys([row]))[0]
+    except writer.Unavailable:
+        raise HTTPException(status_code=503, detail=WRITE_UNAVAILABLE, headers={"Retry-After": "2"})
     return {"status":"ok", "data":row}
 
 
+@app.post("/surveys/batch")
+async def create_surveys_batch(request: Request, user: dict = Depends(require_user)):
+    """Bulk import: a JSON array of SurveyImport rows, or NDJSON (application/x-ndjson) streamed line by line.
+
+    Invalid rows are skipped and reported in `errors` (array index, or 1-based line for NDJSON).
+    503 when the writer cannot commit a block; blocks committed before stay stored.
+    """
+    batch = ingest.BatchImport(user)
+    try:
+        if 'ndjson' in request.headers.get('content-type', ''):
+            buf, line_no = b'', 1
+            async for chunk in request.stream():
+                buf += chunk
+                *lines, buf = buf.split(b'\n')
+                if lines:
+                    await run_in_threadpool(batch.feed_lines, line_no, lines)
+                    line_no += len(lines)
+            await run_in_threadpool(batch.feed_lines, line_no, [buf])
+        else:
+            try:
+                items = json.loads(await request.body())
+            except ValueError:
+                raise HTTPException(status_code=400, detail="JSON inválido")
+            if not isinstance(items, list):
+                raise HTTPException(status_code=400, detail="Se esperaba un arreglo JSON de encuestas")
+            await run_in_threadpool(batch.feed_all, items)
+        await run_in_threadpool(batch.flush)
+    except writer.Unavailable:
+        raise HTTPException(status_code=503, detail=f"{WRITE_UNAVAILABLE} ({batch.inserted} guardadas, último id {batch.last_id})", headers={"Retry-After": "2"})
+    return batch.result()
+
+
 @app.get("/me")
-def me(Authorization: str | None = Header(None)):
-    if not Authorization or not Authorization.startswith('Bearer '):
+def me(user: dict | None = Depends(current_user)):
+    if not user:
         raise HTTPException(status_code=401, detail='Not authenticated')
-    token = Authorization.split(' ',1)[1]
-    payload = decode_access_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail='Invalid token')
-    return { 'user_id': payload.get('user_id'), 'username': payload.get('username') }
+    return { 'user_id': user['user_id'], 'username': user['username'] }
+
+
+@app.get("/auth-cache")
+def auth_cache_stats(user: dict | None = Depends(current_user)):
+    """Verified-token cache counters: hit rate and jwt.decode time (admin only)."""
+    if not user or user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Solo administradores")
+    return token_cache.stats()
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text format: route latencies, stage timings, CSV I/O and component counters."""
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/profiles/{profile_id}")
+def get_profile(profile_id: str, user: dict | None = Depends(current_user)):
+    """Collapsed stacks of a request sent with `X-Profile: 1` (id from its X-Profile-Id header; admin only)."""
+    if not user or user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Solo administradores")
+    text = metrics.profiles.get(profile_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return Response(text, media_type="text/plain")
+
+
+@metrics.registry.collector
+def component_metrics():
+    t, p, r, w, e, s = token_cache.stats(), cache.plots.stats(), render.plots.stats(), writer.commits.stats(), events.hub.stats(), table.surveys.stats()
+    yield "emotrack_token_cache_lookups_total", "counter", "Verified-token cache lookups.", {("hit",): t["hits"], ("miss",): t["misses"]}, ("result",)
+    yield "emotrack_plot_cache_lookups_total", "counter", "Plot cache lookups.", {("hit",): p["hits"], ("miss",): p["misses"]}, ("result",)
+    yield "emotrack_plot_cache_bytes", "gauge", "PNG bytes held by the plot cache.", {(): p["bytes"]}, ()
+    yield "emotrack_plot_renders_in_flight", "gauge", "Plot renders running or queued.", {(): r["in_flight"]}, ()
+    yield "emotrack_plot_renders_rejected_total", "counter", "Plot renders refused with 503/504.", {("overloaded",): r["rejected"], ("timeout",): r["timeouts"]}, ("reason",)
+    yield "emotrack_plot_pools_recycled_total", "counter", "Render pools killed and replaced after a hung job or a dead worker.", {(): r["recycled"]}, ()
+    yield "emotrack_writer_groups_total", "counter", "Group commits.", {(): w["groups"]}, ()
+    yield "emotrack_writer_requests_total", "counter", "Write requests committed.", {(): w["requests"]}, ()
+    yield "emotrack_writer_failures_total", "counter", "Group commits whose lock or announcement failed.", {(): w["failures"]}, ()
+    yield "emotrack_writer_queue_depth", "gauge", "Write requests waiting for the writer.", {(): w["queued"]}, ()
+    yield "emotrack_ws_connections", "gauge", "Open /ws connections.", {(): e["connections"]}, ()
+    yield "emotrack_ws_dropped_total", "counter", "Slow /ws clients disconnected.", {(): e["dropped"]}, ()
+    yield "emotrack_survey_table_rows", "gauge", "Surveys held by the in-memory table (0 until first use).", {(): s["rows"]}, ()
+    yield "emotrack_survey_table_bytes", "gauge", "Bytes held by the in-memory survey table.", {(): s["bytes"]}, ()
+    yield "emotrack_survey_table_loads_total", "counter", "Full loads of the survey table from storage.", {(): s["loads"]}, ()
+    if cluster.node.enabled:
+        c = cluster.node.stats()
+        yield "emotrack_cluster_version", "gauge", "Shared change version and the last one applied by this worker.", {("shared",): c["version"], ("applied",): c["applied"]}, ("counter",)
+        yield "emotrack_cluster_messages_total", "counter", "Change datagrams exchanged with other workers.", {("sent",): c["sent"], ("received",): c["received"], ("send_failed",): c["send_failures"]}, ("kind",)
+        yield "emotrack_cluster_gaps_total", "counter", "Times this worker missed changes and rebuilt from storage.", {(): c["gaps"]}, ()
+
 
 @app.get("/stats")
-def get_stats(Authorization: str | None = Header(None)):
-    user = get_user_from_token(Authorization)
-    if not SURVEYS_CSV.exists():
-        return {"average_mood": 0, "total_entries": 0, "history": [], "alerts": []}
-    rows = read_csv_rows(SURVEYS_CSV)
-    if not rows:
-        return {"average_mood": 0, "total_entries": 0, "history": [], "alerts": []}
+def get_stats(user: dict | None = Depends(current_user), from_: date | None = Query(None, alias="from"), to: date | None = Query(None)):
     if user and user.get('username'):
-        user_rows = [r for r in rows if r.get('username') == user['username']]
-        n = len(user_rows)
+        # The user's rows in the in-memory survey table (app.table): no file read
+        view = table.surveys.view(user['username'])
+        n = len(view)
         if n == 0:
             return {"average_mood": 0, "total_entries": 0, "history": [], "alerts": []}
-        total_mood = sum(float(r.get('mood', 0)) for r in user_rows)
-        average = round(total_mood / n, 2)
-        last_5 = sorted(user_rows, key=lambda x: x.get('created_at', ''), reverse=True)[:5]
+        moods = view['mood'][view['mood'] == view['mood']]  # blank moods do not count
+        average = round(float(moods.astype(float).sum()) / len(moods), 2) if len(moods) else 0
+        last_5 = view.latest(5)
         alerts = []
         try:
             if analytics.check_alerts(last_5):
@@ -143,51 +314,50 @@ def get_stats(Authorization: str | None = Header(None)):
         except Exception:
             pass
         return {"average_mood": average, "total_entries": n, "history": last_5, "alerts": alerts}
-    import pandas as _pd
-    df = _pd.DataFrame(rows)
-    df['mood'] = _pd.to_numeric(df.get('mood', _pd.Series()), errors='coerce')
-    total = int(len(df.dropna(subset=['mood'])))
-    avg = float(df['mood'].mean()) if total > 0 else 0
-    try:
-        df['created_at'] = _pd.to_datetime(df['created_at'])
-        ts = df.set_index('created_at').resample('D')['mood'].mean().ffill().reset_index()
-        history = ts.assign(date=ts['created_at'].dt.strftime('%Y-%m-%d')).rename(columns={'mood':'mood'}).loc[:, ['date','mood']].to_dict(orient='records')
-    except Exception:
-        history = []
+    # Global view: served from the materialized daily rollup, sliced to [from, to]
+    avg, total, history = rollups.daily_mood.summary(start=from_.isoformat() if from_ else None, end=to.isoformat() if to else None)
     return { 'average_mood': round(avg,2), 'total_entries': total, 'history': history, 'alerts': [] }
 
 
 @app.get("/recommendations")
-def get_user_recommendations(Authorization: str | None = Header(None)):
-    user = get_user_from_token(Authorization)
+def get_user_recommendations(user: dict | None = Depends(current_user)):
     if not user:
         raise HTTPException(status_code=401, detail="Token inválido o no encontrado")
     username = user['username']
-    alerts = []
-    if ALERTS_CSV.exists():
-        with ALERTS_CSV.open(encoding='utf-8') as f:
-            import csv
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('username') == username:
-                    alerts.append(row)
-    user_risk = "BAJO"
-    if alerts:
-        user_risk = alerts[-1].get('risk_level', 'BAJO')
+    # In-memory lookups (app.lookups): no file reads on this path
+    alert = lookups.alerts.for_username(username)
+    user_risk = alert['risk_level'] if alert else "BAJO"
     recommendation = analytics.get_recommendation_for_risk(user_risk)
     return {"username": username, "risk_level": user_risk, "recommendation": recommendation, "general_tips": ["Mantén un horario de sueño regular", "Realiza ejercicio físico moderado", "Practica técnicas de relajación", "Mantén una alimentación balanceada"]}
 
 
 @app.get("/all-alerts")
-def get_all_alerts(Authorization: str | None = Header(None)):
-    user = get_user_from_token(Authorization)
+def get_all_alerts(user: dict | None = Depends(current_user), limit: int | None = Query(None, ge=1, le=1000), cursor: str | None = None, risk_level: str | None = None, trend_negative: bool | None = None):
+    """Alerts in (user_id, username) order; pass `limit` to page and `next_cursor` back as `cursor`."""
     if not user:
         raise HTTPException(status_code=401, detail="Token inválido o no encontrado")
-    all_alerts = []
-    if ALERTS_CSV.exists():
-        with ALERTS_CSV.open(encoding='utf-8') as f:
-            import csv
-            reader = csv.DictReader(f)
-            for row in reader:
-                all_alerts.append({"user_id": row.get('user_id', ''), "username": row.get('username', ''), "risk_level": row.get('risk_level', 'BAJO'), "avg_score": float(row.get('avg_score', 0)), "trend_negative": row.get('trend_negative', 'False') == 'True'})
-    return {"total_alerts": len(all_alerts), "alerts": all_alerts}
+    try:
+        after = export.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    total, rows = storage.get().page_alerts(after=after, limit=limit, risk_level=risk_level, trend_negative=trend_negative)
+    all_alerts = [{"user_id": str(a['user_id']), "username": a['username'], "risk_level": a['risk_level'], "avg_score": a['avg_score'], "trend_negative": a['trend_negative']} for a in rows]
+    next_cursor = export.encode_cursor(rows[-1]) if limit is not None and len(rows) == limit else None
+    return {"total_alerts": total, "alerts": all_alerts, "next_cursor": next_cursor}
+
+
+@app.get("/surveys/export")
+def export_surveys(user: dict = Depends(require_user), format: str = Query("ndjson", pattern="^(ndjson|csv)$"), username: list[str] | None = Query(None), user_id: list[int] | None = Query(None)):
+    """Stream survey history as NDJSON or CSV.
+
+    Users get their own surveys; admins may pick a cohort with repeated
+    `username`/`user_id` params, or export everything.
+    """
+    if user.get('role') != 'admin':
+        if (username and set(username) != {user['username']}) or (user_id and set(user_id) != {user['user_id']}):
+            raise HTTPException(status_code=403, detail="Solo administradores pueden exportar otros usuarios")
+        username, user_id = [user['username']], None
+    rows = storage.get().iter_surveys(usernames=username, user_ids=user_id)
+    if format == 'csv':
+        return StreamingResponse(export.csv_lines(rows), media_type="text/csv", headers={"Content-Disposition": 'attachment; filename="surveys.csv"'})
+    return StreamingResponse(export.ndjson_lines(rows), media_type="application/x-ndjson")
@@ -0,0 +1,128 @@
+"""
+cache.py - Bounded LRU cache for rendered /user-plot images and series.
+
+Entries are keyed by (username, kind, format, data version), format being
+"png" or "json" (the series mode). A user's version is the id of their
+newest survey, read from the survey table (app.table) on first use and
+bumped by every commit of theirs, so cached PNGs never go stale and the
+same version doubles as the HTTP ETag. A rendering is only stored if the
+version it was started from is still current when it finishes.
+
+Versions carry an epoch: random per process, or the cluster's run token
+with several API workers (app.cluster). Survey ids come from storage, so
+every worker of a cluster hands out the same ETag for the same data,
+whenever it was started.
+"""
+
+from collections import OrderedDict
+import hashlib, os, threading, uuid
+
+from app import table
+
+PLOT_KINDS = ("evolution", "hist", "sleep", "summary")
+PLOT_FORMATS = ("png", "json")
+PLOT_CACHE_MAX_BYTES = int(os.environ.get("EMOTRACK_PLOT_CACHE_BYTES", 32 * 1024 * 1024))
+
+
+def normalize_kind(kind):
+    """Same fallback as analytics.generate_user_plot: unknown kinds render 'evolution'."""
+    k = kind.lower() if kind else "evolution"
+    return k if k in PLOT_KINDS else "evolution"
+
+
+def latest_survey_id(username):
+    """Id of the user's newest survey in the survey table (0 without surveys)."""
+    ids = table.surveys.view(username)["id"]
+    return int(ids.max()) if len(ids) else 0
+
+
+class PlotCache:
+    def __init__(self, max_bytes=PLOT_CACHE_MAX_BYTES, latest=latest_survey_id):
+        self.max_bytes = max_bytes
+        self._latest = latest
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (username, kind, format, version) -> bytes
+        self._bytes = 0
+        self._versions = {}  # username -> newest survey id, filled on first use
+        # a process restart keeps survey ids; the epoch keeps ETags from before it from matching
+        self._epoch = uuid.uuid4().hex[:8]
+        self.hits = self.misses = self.evictions = 0
+
+    def version(self, username):
+        with self._lock:
+            v, epoch = self._versions.get(username), self._epoch
+        if v is None:
+            v = self._latest(username)
+            with self._lock:
+                if epoch != self._epoch:
+                    return self.version(username)
+                # a commit bumping the user meanwhile wins
+                v = self._versions.setdefault(username, v)
+        return f"{epoch}.{v}"
+
+    def bump(self, username, version=None):
+        """Mark a user's data as changed and drop their cached images.
+
+        `version` is the id of the user's newest survey; without it the
+        version is read again from the survey table on next use.
+        """
+        with self._lock:
+            current = self._versions.pop(username, None)
+            if version is not None:
+                self._versions[username] = version
+            for kind in PLOT_KINDS:
+                for fmt in PLOT_FORMATS:
+                    data = self._entries.pop((username, kind, fmt, f"{self._epoch}.{current}"), None)
+                    if data is not None:
+                        self._bytes -= len(data)
+
+    def rebase(self, epoch):
+        """Drop everything and re-read every version from the survey table, under `epoch`."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._versions = {}
+            self._epoch = epoch
+
+    @staticmethod
+    def etag(username, kind, version, fmt="png"):
+        tag = f"{username}|{kind}|{version}" if fmt == "png" else f"{username}|{kind}|{fmt}|{version}"
+        digest = hashlib.sha1(tag.encode("utf-8")).hexdigest()[:20]
+        return f'"{digest}"'
+
+    def get(self, username, kind, version, fmt="png"):
+        key = (username, kind, fmt, version)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, username, kind, version, data, fmt="png"):
+        """Store a rendering made from `version`; skipped (False) if the user's data changed meanwhile."""
+        if len(data) > self.max_bytes:
+            return False
+        key = (username, kind, fmt, version)
+        with self._lock:
+            if username not in self._versions or version != f"{self._epoch}.{self._versions[username]}":
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+plots = PlotCache()
@@ -0,0 +1,292 @@
+"""
+cluster.py - Coordination between API worker processes on one host.
+
+With EMOTRACK_WORKERS > 1 (`python main.py --workers N`) every uvicorn
+worker has its own copy of the in-memory state: user index, next survey
+id, risk engine, daily rollup, plot cache and /ws subscribers. The workers
+keep it consistent through three local primitives in EMOTRACK_RUN_DIR
+(default: a directory under the system temp dir named after the data
+directory):
+
+- write.lock: an exclusive flock held for a whole group commit (ids,
+  append, fsync, alerts), so workers never interleave writes or hand out
+  the same id;
+- version: a shared change counter (mmap'ed), bumped by every commit that
+  stores surveys or users;
+- peers/<pid>.sock: one unix datagram socket per worker. After a commit
+  the stored rows and registered users are sent, tagged with the new
+  version, to every peer, which folds them into its own state and
+  publishes the events to its own /ws clients. The committer's store
+  position (next survey id, table stamps) travels with them, so peers do
+  not rescan the tables before their next write.
+
+Peers send while holding the lock, so a worker that takes it only waits
+for its listener thread to fold in what is already queued. A worker that
+finds a gap in the versions (a peer timed out sending to it) drops its
+derived state instead; listeners get groups=None and rebuild from storage.
+
+With a single worker nothing is shared: lock() only serializes threads and
+nothing is announced.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import fcntl, hashlib, json, mmap, os, socket, struct, tempfile, threading, uuid
+
+from app import metrics, storage
+
+WORKERS = int(os.environ.get("EMOTRACK_WORKERS", 1))
+RUN_DIR = Path(os.environ.get("EMOTRACK_RUN_DIR", Path(tempfile.gettempdir()) / ("emotrack-" + hashlib.sha1(str(storage.DATA_DIR.resolve()).encode()).hexdigest()[:12])))
+SEND_TIMEOUT = float(os.environ.get("EMOTRACK_CLUSTER_SEND_TIMEOUT", 0.25))  # per peer, before it is skipped
+FRAME_BYTES = 60000   # rows per datagram are capped by size; a commit may span several
+CHECK_INTERVAL = 0.5  # how often an idle worker compares the shared version with its own
+_HEADER = struct.Struct("<Q16s")  # shared version, run token
+
+
+class Node:
+    def __init__(self, run_dir=RUN_DIR, enabled=WORKERS > 1):
+        self.run_dir = Path(run_dir)
+        self.enabled = enabled
+        self.listeners = []  # called as fn(groups, version, users, state); groups=[(bulk, rows)], or None after a gap
+        self.token = None
+        self.applied = 0     # last version folded into this process
+        self._write_lock = threading.Lock()
+        self._applied = threading.Condition()
+        self._lock_fd = None
+        self._map = None
+        self._sock = None   # ours, read by the listener thread only
+        self._out = None    # for sending, with SEND_TIMEOUT
+        self._path = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._partial = None  # (version, parts, items) of a commit still arriving
+        self.sent = self.received = self.gaps = self.send_failures = 0
+
+    # shared primitives
+
+    @contextmanager
+    def _flock(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _try_flock(self):
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def version(self):
+        return _HEADER.unpack_from(self._map, 0)[0] if self._map is not None else 0
+
+    def start(self):
+        """Join the cluster: open the lock and counter, bind our socket, start listening.
+
+        Listeners first get (None, current version): this process starts
+        from whatever storage holds at that version.
+        """
+        if not self.enabled or self._sock is not None:
+            return
+        (self.run_dir / "peers").mkdir(parents=True, exist_ok=True)
+        self._lock_fd = os.open(self.run_dir / "write.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        with self._flock():
+            fd = os.open(self.run_dir / "version", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size < _HEADER.size:
+                    os.write(fd, _HEADER.pack(0, uuid.uuid4().bytes))
+                self._map = mmap.mmap(fd, _HEADER.size)
+            finally:
+                os.close(fd)
+            version, token = _HEADER.unpack_from(self._map, 0)
+            self.token = token.hex()[:8]
+            self._path = self.run_dir / "peers" / f"{os.getpid()}.sock"
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(str(self._path))
+            self._sock.settimeout(CHECK_INTERVAL)
+            self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._out.settimeout(SEND_TIMEOUT)
+            with self._applied:
+                self.applied = version
+                self._notify(None, version, [], None)
+        self._thread = threading.Thread(target=self._listen, name="cluster", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._sock is None:
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(CHECK_INTERVAL * 2)
+        self._sock.close()
+        self._out.close()
+        try:
+            self._path.unlink()
+        except FileNotFoundError:
+            pass
+        self._sock = None
+
+    # writing side
+
+    @contextmanager
+    def lock(self):
+        """Exclusive write access across workers, with this process caught up on earlier commits."""
+        with self._write_lock:
+            if self._sock is None:
+                yield
+                return
+            with metrics.stage("cluster.lock"), self._flock():
+                self.catch_up()
+                yield
+
+    def advance(self):
+        """Reserve the version of the commit in progress (call under lock()); None when not clustered."""
+        if self._sock is None:
+            return None
+        version = self.version() + 1
+        struct.pack_into("<Q", self._map, 0, version)
+        return version
+
+    def announce(self, version, groups, users=(), state=None):
+        """Send the rows stored under `version` to every peer (call under lock(), after advance()).
+
+        `users` are the accounts registered by the commit; `state` is a small
+        JSON-able dict handed to the peers' listeners as is.
+        """
+        if version is None:
+            return
+        with metrics.stage("cluster.announce"):
+            frames = self._frames(version, groups, users, state)
+            for peer in os.listdir(self.run_dir / "peers"):
+                path = str(self.run_dir / "peers" / peer)
+                if path == str(self._path):
+                    continue
+                for frame in frames:
+                    try:
+                        self._out.sendto(frame, path)
+                        self.sent += 1
+                    except (ConnectionRefusedError, FileNotFoundError):
+                        # a worker that exited without cleaning up
+                        try:
+                            os.unlink(path)
+                        except FileNotFoundError:
+                            pass
+                        break
+                    except OSError:
+                        # busy or gone: it will notice the gap and rebuild
+                        self.send_failures += 1
+                        break
+        with self._applied:
+            self.applied = version
+            self._applied.notify_all()
+
+    @staticmethod
+    def _frames(version, groups, users=(), state=None):
+        # items are [group index, bulk, row]; registered users go in group -1
+        parts, size = [[]], 0
+        items = [(g, bulk, row) for g, (bulk, rows) in enumerate(groups) for row in rows] + [(-1, False, row) for row in users]
+        for g, bulk, row in items:
+            item = json.dumps([g, bulk, row], separators=(",", ":"), default=str)
+            if parts[-1] and size + len(item) > FRAME_BYTES:
+                parts.append([])
+                size = 0
+            parts[-1].append(item)
+            size += len(item) + 1
+        header = json.dumps(state or {}, separators=(",", ":"), default=str)
+        return [f'{{"v":{version},"part":{i},"parts":{len(parts)},"state":{header},"rows":[{",".join(p)}]}}'.encode("utf-8") for i, p in enumerate(parts)]
+
+    # receiving side
+
+    def _listen(self):
+        # the only reader of our socket
+        while not self._stop.is_set():
+            try:
+                data = self._sock.recv(1 << 20)
+            except socket.timeout:
+                if self.version() != self.applied:
+                    self._check_idle()
+                continue
+            except OSError:
+                return
+            with self._applied:
+                self._receive(data)
+
+    def _check_idle(self):
+        # behind with nothing arriving: once nobody is mid-commit, whatever is still missing was lost
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            if not self._try_flock():
+                return
+            try:
+                self._sock.setblocking(False)
+                with self._applied:
+                    while True:
+                        try:
+                            data = self._sock.recv(1 << 20)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        self._receive(data)
+                    if self.version() != self.applied:
+                        self._gap()
+            finally:
+                self._sock.settimeout(CHECK_INTERVAL)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        finally:
+            self._write_lock.release()
+
+    def catch_up(self):
+        """Wait (under the file lock) until every earlier commit is folded in; on a gap, start over from storage."""
+        with self._applied:
+            if not self._applied.wait_for(lambda: self.applied >= self.version(), SEND_TIMEOUT * 2):
+                self._gap()
+
+    def _receive(self, data):
+        msg = json.loads(data)
+        self.received += 1
+        version, part = msg["v"], msg["part"]
+        if version <= self.applied:
+            return
+        if version != self.applied + 1:
+            return self._gap()
+        if part == 0:
+            self._partial = (version, msg["parts"], [])
+        elif self._partial is None or self._partial[0] != version or len(self._partial[2]) != part:
+            return self._gap()
+        items = self._partial[2]
+        items.append(msg["rows"])
+        if len(items) < self._partial[1]:
+            return
+        self._partial = None
+        groups = {}
+        for g, bulk, row in (item for rows in items for item in rows):
+            groups.setdefault(g, (bulk, []))[1].append(row)
+        users = groups.pop(-1, (False, []))[1]
+        self._notify([groups[g] for g in sorted(groups)], version, users, msg.get("state") or {})
+        self.applied = version
+        self._applied.notify_all()
+
+    def _gap(self):
+        # storage already holds every counted commit: they advance the counter only after writing
+        version = self.version()
+        self.gaps += 1
+        self._partial = None
+        self._notify(None, version, [], None)
+        self.applied = version
+        self._applied.notify_all()
+
+    def _notify(self, groups, version, users, state):
+        for fn in self.listeners:
+            try:
+                fn(groups, version, users, state)
+            except Exception:
+                pass
+
+    def stats(self):
+        return {"enabled": self.enabled, "version": self.version(), "applied": self.applied, "sent": self.sent, "received": self.received,
+                "gaps": self.gaps, "send_failures": self.send_failures}
+
+
+node = Node()
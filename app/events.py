@@ -0,0 +1,143 @@
+"""
+events.py - Live event fan-out for the /ws endpoint.
+
+Each connected socket gets a small bounded queue. Publishing is thread-safe
+(the sync endpoints run in worker threads) and never blocks: events are
+handed to the event loop, which copies them into the queues of the
+subscribers allowed to see them (admins: everything, users: their own
+plus the events about no user in particular, such as resync).
+
+A client whose queue fills up is disconnected (close code 1013) instead of
+buffering without limit. Sends that take longer than EMOTRACK_WS_SEND_TIMEOUT
+and dead sockets end the connection too. Clients are expected to reconnect
+and refetch.
+
+Events:
+    {"type": "survey_created", "user_id", "username", "survey": {id, mood, mood_score, created_at}}
+    {"type": "surveys_imported", "user_id", "username", "count"}   (one per user per batch block)
+    {"type": "risk_changed", "user_id", "username", "risk_level", "previous", "avg_score", "trend_negative"}
+    {"type": "resync"}   (changes made by another API worker were missed: refetch)
+"""
+
+import asyncio, os
+
+WS_QUEUE_SIZE = int(os.environ.get("EMOTRACK_WS_QUEUE", 64))
+WS_SEND_TIMEOUT = float(os.environ.get("EMOTRACK_WS_SEND_TIMEOUT", 5))
+
+
+def survey_created(row):
+    return {"type": "survey_created", "user_id": int(row["user_id"]), "username": row["username"], "survey": {k: row.get(k) for k in ("id","mood","mood_score","created_at")}}
+
+
+def surveys_imported(user_id, username, count):
+    return {"type": "surveys_imported", "user_id": int(user_id), "username": username, "count": count}
+
+
+def risk_changed(alert, previous):
+    return {"type": "risk_changed", "user_id": int(alert["user_id"]), "username": str(alert["username"]), "risk_level": alert["risk_level"], "previous": previous, "avg_score": round(float(alert["avg_score"]), 2), "trend_negative": bool(alert["trend_negative"])}
+
+
+def resync():
+    return {"type": "resync"}
+
+
+class Subscriber:
+    __slots__ = ("user_id", "username", "role", "queue")
+
+    def __init__(self, user, queue_size):
+        self.user_id = user.get("user_id")
+        self.username = user.get("username")
+        self.role = user.get("role", "user")
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def wants(self, event):
+        # events without a user_id (resync) are for everyone
+        return self.role == "admin" or "user_id" not in event or event["user_id"] == self.user_id
+
+
+class Broadcaster:
+    def __init__(self, queue_size=WS_QUEUE_SIZE, send_timeout=WS_SEND_TIMEOUT):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.connections = set()
+        self._loop = None
+        self.published = self.delivered = self.dropped = 0
+
+    def subscribe(self, user):
+        self._loop = asyncio.get_running_loop()
+        sub = Subscriber(user, self.queue_size)
+        self.connections.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.connections.discard(sub)
+
+    def publish(self, event):
+        """Queue `event` for every interested subscriber; callable from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self.connections:
+            return
+        self.published += 1
+        try:
+            same_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            same_loop = False
+        if same_loop:
+            self._fanout(event)
+        else:
+            loop.call_soon_threadsafe(self._fanout, event)
+
+    def alert_changed(self, alert, previous):
+        self.publish(risk_changed(alert, previous))
+
+    def _fanout(self, event):
+        for sub in list(self.connections):
+            if not sub.wants(event):
+                continue
+            try:
+                sub.queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                # slow consumer: replace its backlog with the close sentinel
+                self.connections.discard(sub)
+                self.dropped += 1
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.queue.put_nowait(None)
+
+    async def serve(self, websocket, user):
+        """Pump events to an accepted websocket until either side goes away."""
+        sub = self.subscribe(user)
+
+        async def pump():
+            await websocket.send_json({"type": "hello", "username": sub.username, "role": sub.role})
+            while True:
+                event = await sub.queue.get()
+                if event is None:
+                    await websocket.close(code=1013)
+                    return
+                await asyncio.wait_for(websocket.send_json(event), self.send_timeout)
+
+        async def drain():
+            # incoming messages are ignored; this only notices the disconnect
+            while True:
+                await websocket.receive_text()
+
+        tasks = [asyncio.create_task(pump()), asyncio.create_task(drain())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.unsubscribe(sub)
+            for t in tasks:
+                t.cancel()
+            for t in tasks:
+                try:
+                    await t
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+    def stats(self):
+        return {"connections": len(self.connections), "published": self.published, "delivered": self.delivered, "dropped": self.dropped}
+
+
+hub = Broadcaster()
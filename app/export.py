@@ -0,0 +1,79 @@
+"""
+export.py - Cursors for paged alerts and streamed survey exports.
+
+Alert pages are keyed by (user_id, username). The cursor handed to clients
+is that key as url-safe base64 JSON, so it stays valid while rows are
+added or updated.
+
+Survey exports are generators over storage.iter_surveys, which reads the
+CSV file or the SQLite table incrementally. Output is flushed every
+EXPORT_CHUNK_ROWS rows, so memory does not grow with the result size.
+"""
+
+import base64, csv, io, json
+
+from app.storage import SURVEY_FIELDS, alert_key
+
+EXPORT_CHUNK_ROWS = 500
+_INT_FIELDS = ("id", "user_id", "mood", "mood_score", "appetite", "concentration")
+
+
+def encode_cursor(alert):
+    return base64.urlsafe_b64encode(json.dumps(list(alert_key(alert))).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(user_id, username) from a cursor; raises ValueError when malformed."""
+    try:
+        user_id, username = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(user_id), str(username)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _typed(row):
+    """JSON-friendly survey row: numbers as numbers, blanks as null."""
+    out = {}
+    for k in SURVEY_FIELDS:
+        v = row.get(k, "")
+        if v == "" or v is None:
+            out[k] = None
+        elif k in _INT_FIELDS:
+            try:
+                out[k] = int(float(v))
+            except (TypeError, ValueError):
+                out[k] = v
+        elif k == "sleep_hours":
+            try:
+                out[k] = float(v)
+            except (TypeError, ValueError):
+                out[k] = v
+        else:
+            out[k] = v
+    return out
+
+
+def ndjson_lines(rows):
+    buf = []
+    for row in rows:
+        buf.append(json.dumps(_typed(row), ensure_ascii=False))
+        if len(buf) >= EXPORT_CHUNK_ROWS:
+            yield "\n".join(buf) + "\n"
+            buf = []
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+
+def csv_lines(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=SURVEY_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    n = 0
+    for row in rows:
+        writer.writerow(row)
+        n += 1
+        if n % EXPORT_CHUNK_ROWS == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
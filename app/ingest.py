@@ -0,0 +1,122 @@
+"""
+ingest.py - Survey row building and bulk import for POST /surveys/batch.
+
+Rows are validated one by one against SurveyImport (bad rows are reported,
+not fatal), then committed in blocks through app.writer: one id block and
+one append per block, then the rollup, plot cache, risk engine (affected
+users only) and live events are updated once per block instead of once
+per row.
+
+A JSON array is committed as a single block. NDJSON uploads are committed
+every EMOTRACK_BATCH_CHUNK rows so memory stays flat for large files.
+"""
+
+from datetime import datetime, timezone
+import json, os, time
+from pydantic import ValidationError
+
+from app import store, writer
+from app.models import SurveyImport
+
+BATCH_CHUNK = int(os.environ.get("EMOTRACK_BATCH_CHUNK", 10000))
+BATCH_MAX_ERRORS = 1000   # per-row errors listed in the response; the rest are only counted
+
+
+def survey_row(s, user_id, username, created_at=None):
+    """Storage row for a SurveyCreate; raises ValueError for an invalid mood."""
+    if not s.mood or s.mood < 1 or s.mood > 10:
+        raise ValueError("Invalid mood value")
+    mood_score = s.mood_score if s.mood_score is not None else min(100, max(0, s.mood*10))
+    return {"user_id": user_id, "username": username, "mood": s.mood, "mood_score": mood_score, "sleep_hours": s.sleep_hours if s.sleep_hours is not None else "", "appetite": s.appetite if s.appetite is not None else "", "concentration": s.concentration if s.concentration is not None else "", "notes": s.notes or "", "created_at": created_at or time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def _normalize_date(value):
+    """Stored form of an ISO-8601 date: to the second, dates with an offset converted to UTC."""
+    try:
+        d = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {value!r} (se espera ISO-8601)")
+    if d.tzinfo is not None:
+        d = d.astimezone(timezone.utc)
+    return d.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _describe(err):
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in err.errors())
+
+
+class BatchImport:
+    """Collects validated rows for one upload and commits them in blocks."""
+
+    def __init__(self, user, chunk_size=BATCH_CHUNK):
+        self.user = user
+        self.is_admin = user.get("role") == "admin"
+        self.chunk_size = chunk_size
+        self.pending = []
+        self.errors = []
+        self.inserted = self.rejected = 0
+        self.first_id = self.last_id = None
+        self._owners = {}  # username -> (user_id, username) or None
+
+    def _owner(self, name):
+        if not name or name == self.user["username"]:
+            return self.user["user_id"], self.user["username"]
+        if not self.is_admin:
+            raise ValueError("Solo administradores pueden importar encuestas de otros usuarios")
+        if name not in self._owners:
+            rows = store.users.by_username(name)
+            r = ([u for u in rows if u["username"] == name] or rows or [None])[0]
+            self._owners[name] = (int(r["id"]), r["username"]) if r else None
+        if self._owners[name] is None:
+            raise ValueError(f"Usuario desconocido: {name}")
+        return self._owners[name]
+
+    def _reject(self, row, message):
+        self.rejected += 1
+        if len(self.errors) < BATCH_MAX_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def feed(self, row, item):
+        """Validate one decoded item; `row` is how it is reported back on error."""
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Se esperaba un objeto JSON")
+            s = SurveyImport(**item)
+            user_id, username = self._owner(s.username)
+            created_at = _normalize_date(s.created_at) if s.created_at else None
+            self.pending.append(survey_row(s, user_id, username, created_at))
+        except ValidationError as e:
+            self._reject(row, _describe(e))
+        except ValueError as e:
+            self._reject(row, str(e))
+
+    def feed_all(self, items):
+        for i, item in enumerate(items):
+            self.feed(i, item)
+
+    def feed_lines(self, first_line, lines):
+        """NDJSON: one object per line, blank lines skipped; errors report 1-based line numbers."""
+        for n, line in enumerate(lines, start=first_line):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                self._reject(n, "JSON inválido")
+                continue
+            self.feed(n, item)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Commit the pending rows as one block through the group writer."""
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        rows = writer.wait(writer.commits.add_surveys(rows, bulk=True))
+        self.inserted += len(rows)
+        self.first_id = rows[0]["id"] if self.first_id is None else self.first_id
+        self.last_id = rows[-1]["id"]
+
+    def result(self):
+        return {"status": "ok", "inserted": self.inserted, "rejected": self.rejected, "first_id": self.first_id, "last_id": self.last_id, "errors": self.errors, "errors_truncated": self.rejected > len(self.errors)}
@@ -0,0 +1,190 @@
+"""
+keywords.py - Negative-keyword screening of survey notes.
+
+Notes and keywords are compared after folding: Unicode compatibility
+decomposition (NFKD), combining marks dropped and case folded, so
+"Estrés", "ESTRES" and "estrés" all match the keyword "estres" (and a list
+entry "depresión" matches "depresion"). Keywords match anywhere in the
+text, as stems ("suicid" matches "suicida").
+
+The list comes from EMOTRACK_KEYWORDS_FILE (default data/keywords.csv,
+columns keyword,weight) when that file exists, else DEFAULT_KEYWORDS. A
+weight is the composite penalty of a note containing that keyword (blank:
+DEFAULT_WEIGHT); a note with several keywords takes the highest. The file
+is reloaded when it changes (checked at most every EMOTRACK_LOOKUP_RECHECK
+seconds); app.risk rebuilds its table on the next survey after a reload.
+
+penalties() folds a column in blocks of about FOLD_BLOCK characters: the
+notes of a block are joined, encoded to Latin-1 (characters outside it
+folded on the way, by a codec error handler), lower-cased and mapped
+through a 256-byte translation table, then split again and searched while
+the block is still in cache. Keywords are tried by weight, heaviest first,
+with plain substring tests; within a weight the keywords found most often
+so far go first, and the first hit decides the note.
+"""
+
+import codecs, csv, os, re, unicodedata
+
+from app import lookups, storage
+
+DEFAULT_KEYWORDS = ["mal","triste","estres","depres","ansiedad","angusti","suicid","suicida","no puedo"]
+DEFAULT_WEIGHT = 0.12
+KEYWORDS_FILE = os.environ.get("EMOTRACK_KEYWORDS_FILE", storage.DATA_DIR / "keywords.csv")
+_ACCENTS = re.compile("[\u0300-\u034e\u0350-\u036f]")  # combining diacritics (U+034F is not a mark)
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+_OUTSIDE = "\x1a"  # stands for a folded character outside Latin-1 in penalties()
+FOLD_BLOCK = 1 << 16  # characters penalties() folds and searches at a time, so a block stays in cache
+
+
+def fold(text):
+    """Accent- and case-folded text (NFKD, combining marks dropped, ASCII lower-cased)."""
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text.casefold())
+    # Latin text ends up ASCII once its diacritics are gone; anything else is filtered mark by mark
+    stripped = _ACCENTS.sub("", text)
+    if stripped.isascii():
+        return stripped.lower()  # compatibility capitals such as "ℌ" decompose to ASCII ones
+    return "".join(c for c in text if not unicodedata.combining(c)).translate(_ASCII_LOWER)
+
+
+_latin1_folds = {}
+
+
+def _fold_latin1(c):
+    """fold(c) with every character outside Latin-1 replaced by _OUTSIDE."""
+    out = _latin1_folds.get(c)
+    if out is None:
+        out = _latin1_folds[c] = "".join(x if x <= "\xff" else _OUTSIDE for x in fold(c))
+    return out
+
+
+def _encode_folded(err):
+    return "".join(map(_fold_latin1, err.object[err.start:err.end])), err.end
+
+
+codecs.register_error("emotrack.fold", _encode_folded)
+
+# fold of each Latin-1 byte: one-byte folds go through the table (ASCII lower-casing
+# included), longer ones are replaced first, empty ones deleted
+_TABLE, _DROP, _EXPAND = bytearray(range(256)), bytearray(), {}
+_TABLE[65:91] = range(97, 123)
+for _code in range(128, 256):
+    _out = _fold_latin1(chr(_code)).encode("latin-1")
+    if len(_out) == 1:
+        _TABLE[_code] = _out[0]
+    elif not _out:
+        _DROP.append(_code)
+    else:
+        _EXPAND[_code] = _out
+_TABLE, _DROP = bytes(_TABLE), bytes(_DROP)
+_ASCII = bytes(range(128))
+
+
+def fold_latin1(text):
+    """fold(text) as far as Latin-1 keywords can tell: characters whose fold falls outside
+    Latin-1 come out as _OUTSIDE. Folds character by character, so joined notes fold
+    like the notes one by one."""
+    if text.isascii():
+        return text.lower()
+    data = text.encode("latin-1", "emotrack.fold")
+    for code, out in _EXPAND.items():
+        if code in data:
+            data = data.replace(bytes((code,)), out)
+    return (data.translate(_TABLE, _DROP) if _DROP else data.translate(_TABLE)).decode("latin-1")
+
+
+class KeywordScreen(lookups._Refreshing):
+    def __init__(self, path=None, recheck=lookups.LOOKUP_RECHECK):
+        super().__init__(recheck)
+        self.path = path or KEYWORDS_FILE
+        self._compiled = ({}, [], True)
+
+    def stamp(self):
+        return storage._file_stat(self.path)
+
+    def _load(self):
+        entries = [(kw, DEFAULT_WEIGHT) for kw in DEFAULT_KEYWORDS]
+        if os.path.exists(self.path):
+            entries = []
+            with open(self.path, encoding="utf-8", newline="") as f:
+                for r in csv.DictReader(f):
+                    try:
+                        weight = float(r.get("weight") or DEFAULT_WEIGHT)
+                    except ValueError:
+                        weight = DEFAULT_WEIGHT
+                    entries.append((r.get("keyword") or "", min(1.0, max(0.0, weight))))
+        self._compiled = self.compile(entries)
+
+    @staticmethod
+    def compile(entries):
+        """({folded keyword: weight}, [(weight, keywords)] heaviest first, Latin-1 only) for (keyword, weight) pairs."""
+        weights = {}
+        for kw, weight in entries:
+            kw = fold(kw.strip())
+            if kw and weight > 0:
+                weights[kw] = max(weight, weights.get(kw, 0.0))
+        tiers = {}
+        for kw in sorted(weights, key=lambda k: (len(k), k)):
+            same = tiers.setdefault(weights[kw], [])
+            if not any(shorter in kw for shorter in same):  # "suicida" adds nothing to "suicid"
+                same.append(kw)
+        # fold_latin1() keeps Latin-1 only: other keywords need the exact fold of every note
+        latin1 = all(max(kw) <= "\xff" and "\0" not in kw and _OUTSIDE not in kw for kw in weights)
+        return weights, [(w, tuple(tiers[w])) for w in sorted(tiers, reverse=True)], latin1
+
+    def keywords(self):
+        """{folded keyword: weight} currently in use."""
+        self._ensure()
+        return dict(self._compiled[0])
+
+    def version(self):
+        """Changes whenever the keyword list is (re)loaded."""
+        self._ensure()
+        return self.reloads
+
+    def penalty(self, text):
+        """Penalty of one note (0.0 for non-strings and notes without keywords)."""
+        self._ensure()
+        if not isinstance(text, str) or not text:
+            return 0.0
+        folded = fold(text)
+        for weight, kws in self._compiled[1]:
+            for kw in kws:
+                if kw in folded:
+                    return weight
+        return 0.0
+
+    def penalties(self, values):
+        """penalty() for every value of a sequence or Series, as a float numpy array."""
+        import numpy as np
+        self._ensure()
+        texts = [v if isinstance(v, str) else "" for v in values]
+        out = np.zeros(len(texts), dtype=float)
+        weights, tiers, latin1 = self._compiled
+        order = [kw for _, kws in tiers for kw in kws]  # heaviest first
+        if not texts or not order:
+            return out
+        rows = {kw: [] for kw in order}
+        start, step = 0, 256
+        while start < len(texts):
+            block = texts[start:start + step]
+            joined = fold_latin1("\0".join(block)) if latin1 else ""
+            folded = joined.split("\0") if latin1 else ()
+            if len(folded) != len(block):  # a note holds the separator, or keywords outside Latin-1
+                folded = [fold(t) for t in block]
+            for i, text in enumerate(folded, start):
+                if text:
+                    for kw in order:
+                        if kw in text:
+                            rows[kw].append(i)
+                            break
+            # within a weight any hit will do: try the most frequent keywords first
+            order.sort(key=lambda kw: (-weights[kw], -len(rows[kw])))
+            start += len(block)
+            step = max(1, FOLD_BLOCK * len(block) // (len(joined) or FOLD_BLOCK))
+        for kw, found in rows.items():
+            out[found] = weights[kw]
+        return out
+
+screen = KeywordScreen()
@@ -0,0 +1,132 @@
+"""
+lookups.py - In-memory alert and recommendation lookups for /recommendations.
+
+AlertTable indexes the stored alerts by username and by user_id.
+RecommendationMap holds recommendations.csv keyed by normalized risk level
+(trimmed, upper case). Request handlers only do dictionary lookups.
+
+Both are refreshed:
+- right away when alerts are written through app.risk or
+  analytics.compute_risk, which hand over the rows they just saved;
+- when the underlying table or file changes outside the API, detected by
+  comparing its stamp at most once every EMOTRACK_LOOKUP_RECHECK seconds.
+"""
+
+import csv, os, threading, time
+
+from app import storage
+
+LOOKUP_RECHECK = float(os.environ.get("EMOTRACK_LOOKUP_RECHECK", 1.0))
+
+
+def normalize_level(level):
+    return (level or "").strip().upper()
+
+
+class _Refreshing:
+    """Load once, then reload when stamp() changes (checked every `recheck` seconds)."""
+
+    def __init__(self, recheck=LOOKUP_RECHECK):
+        self.recheck = recheck
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked = None
+        self.reloads = 0
+
+    def _ensure(self):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.recheck:
+            return
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.recheck:
+                return
+            stamp = self.stamp()
+            if self._checked is None or stamp != self._stamp:
+                self._load()
+                self._stamp = stamp
+                self.reloads += 1
+            self._checked = now
+
+
+class AlertTable(_Refreshing):
+    """Alerts by username and user_id.
+
+    When several rows share a username (or user_id), the one with the highest
+    (user_id, username) key wins, i.e. the last row of the sorted table.
+    """
+
+    def __init__(self, backend=None, recheck=LOOKUP_RECHECK):
+        super().__init__(recheck)
+        self._backend = backend
+        self._by_username = {}
+        self._by_id = {}
+
+    @property
+    def backend(self):
+        return self._backend or storage.get()
+
+    def stamp(self):
+        return self.backend.alerts_stamp()
+
+    @staticmethod
+    def _index(by_username, by_id, alerts):
+        for alert in alerts:
+            key = storage.alert_key(alert)
+            for index, k in ((by_username, alert["username"]), (by_id, alert["user_id"])):
+                current = index.get(k)
+                if current is None or storage.alert_key(current) <= key:
+                    index[k] = alert
+
+    def _replace(self, alerts):
+        # build aside and swap, so readers never see a half-filled index
+        by_username, by_id = {}, {}
+        self._index(by_username, by_id, alerts)
+        self._by_username, self._by_id = by_username, by_id
+
+    def _load(self):
+        self._replace(self.backend.read_alerts())
+
+    def saved(self, rows, changed=None):
+        """Record a write: `rows` is the full table, `changed` the upserted subset if known."""
+        with self._lock:
+            if changed is None or self._checked is None:
+                self._replace([storage._parse_alert(a) for a in rows])
+            else:
+                self._index(self._by_username, self._by_id, [storage._parse_alert(a) for a in changed])
+            self._stamp = self.stamp()
+            self._checked = time.monotonic()
+
+    def for_username(self, username):
+        self._ensure()
+        return self._by_username.get(username)
+
+    def for_user_id(self, user_id):
+        self._ensure()
+        return self._by_id.get(int(user_id))
+
+
+class RecommendationMap(_Refreshing):
+    def __init__(self, path=None, recheck=LOOKUP_RECHECK):
+        super().__init__(recheck)
+        self.path = path or storage.DATA_DIR / "recommendations.csv"
+        self._by_level = {}
+
+    def stamp(self):
+        return storage._file_stat(self.path)
+
+    def _load(self):
+        by_level = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8", newline="") as f:
+                for r in csv.DictReader(f):
+                    # first row wins, like the old linear scan
+                    by_level.setdefault(normalize_level(r.get("risk_level")), r.get("recommendation") or "")
+        self._by_level = by_level
+
+    def get(self, risk_level):
+        self._ensure()
+        return self._by_level.get(normalize_level(risk_level), "")
+
+
+alerts = AlertTable()
+recommendations = RecommendationMap()
@@ -0,0 +1,309 @@
+"""
+metrics.py - In-process metrics in Prometheus text format, plus an opt-in sampling profiler.
+
+No collector or client library needed: counters and histograms live in
+memory and GET /metrics renders them. Recording is a perf_counter pair, a
+bisect and a short lock, cheap enough to leave on.
+
+- HTTP: MetricsMiddleware times every request per route template
+  (emotrack_http_request_duration_seconds, emotrack_http_requests_total).
+- Stages: `with stage("risk.scoring"):` blocks (or record(name, seconds))
+  inside the app (emotrack_stage_duration_seconds{stage}).
+- CSV I/O: io("read", path, rows, nbytes, seconds) from the CSV helpers
+  (emotrack_csv_{seconds,rows_total,bytes_total}{op,file}).
+- Collectors: callables returning live gauges (cache sizes, queue depths,
+  resident memory, which heavy modules are loaded) are evaluated when
+  /metrics is scraped.
+
+Plot workers are separate processes; they ship their recordings back with
+each result (Registry.drain / Registry.merge).
+
+Profiling: a request carrying `X-Profile: 1` (admins only, checked by the
+guard passed to the middleware) is sampled every
+EMOTRACK_PROFILE_INTERVAL_MS. The collapsed stacks (flamegraph.pl /
+speedscope format) are kept in memory under the id returned in the
+`X-Profile-Id` response header. The sampler sees every thread, so profile
+a quiet instance for clean results.
+
+EMOTRACK_METRICS=0 turns recording off.
+"""
+
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+import os, sys, threading, time, uuid
+
+METRICS_ENABLED = os.environ.get("EMOTRACK_METRICS", "1") != "0"
+PROFILE_INTERVAL = float(os.environ.get("EMOTRACK_PROFILE_INTERVAL_MS", 5)) / 1000
+PROFILES_KEPT = 16
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+APP_DIR = str(Path(__file__).resolve().parent)
+HEAVY_MODULES = ("numpy", "pandas", "matplotlib", "seaborn")  # loaded lazily by app.analytics
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(v):
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = defaultdict(float)
+
+    def inc(self, labels=(), value=1):
+        self._values[labels] += value
+
+    def _merge(self, data):
+        for labels, value in data.items():
+            self._values[labels] += value
+
+    def _render(self):
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [per-bucket counts (last = +Inf), sum, count]
+
+    def observe(self, labels, value):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def _merge(self, data):
+        for labels, (counts, total, n) in data.items():
+            entry = self._values.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+            entry[2] += n
+
+    def _render(self):
+        for labels, (counts, total, n) in sorted(self._values.items()):
+            running = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                running += c
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {running}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(round(total, 6))}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {n}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def observe(self, metric, labels, value):
+        with self._lock:
+            metric.observe(labels, value)
+
+    def collector(self, fn):
+        """Register fn() -> iterable of (name, type, help, {labels tuple or (): value}, labelnames)."""
+        self._collectors.append(fn)
+        return fn
+
+    def drain(self):
+        """Everything recorded so far (picklable), then reset; used by worker processes."""
+        with self._lock:
+            data = {name: dict(m._values) for name, m in self._metrics.items() if m._values}
+            for m in self._metrics.values():
+                m._values = defaultdict(float) if m.kind == "counter" else {}
+        return data
+
+    def merge(self, data):
+        with self._lock:
+            for name, values in (data or {}).items():
+                if name in self._metrics:
+                    self._metrics[name]._merge(values)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for m in self._metrics.values():
+                lines += [f"# HELP {m.name} {m.help}", f"# TYPE {m.name} {m.kind}"]
+                lines += list(m._render())
+        for fn in self._collectors:
+            try:
+                for name, kind, help, samples, labelnames in fn():
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                    lines += [f"{name}{_labels(labelnames, labels)} {_number(value)}" for labels, value in samples.items() if value is not None]
+            except Exception:
+                continue
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+http_seconds = registry.histogram("emotrack_http_request_duration_seconds", "Request latency by route template.", ("method", "route"))
+http_requests = registry.counter("emotrack_http_requests_total", "Requests by route template and status code.", ("method", "route", "status"))
+stage_seconds = registry.histogram("emotrack_stage_duration_seconds", "Time spent in internal stages.", ("stage",))
+csv_seconds = registry.histogram("emotrack_csv_seconds", "CSV read/write/append time.", ("op", "file"))
+csv_rows = registry.counter("emotrack_csv_rows_total", "CSV rows read or written.", ("op", "file"))
+csv_bytes = registry.counter("emotrack_csv_bytes_total", "CSV bytes read or written.", ("op", "file"))
+
+
+def rss_bytes():
+    """Current resident set size (Linux /proc), or None where unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+@registry.collector
+def process_metrics():
+    yield "emotrack_process_resident_memory_bytes", "gauge", "Resident memory of this process.", {(): rss_bytes()}, ()
+    yield "emotrack_module_loaded", "gauge", "Lazily imported heavy modules present in this process.", {(m,): int(m in sys.modules) for m in HEAVY_MODULES}, ("module",)
+
+
+def record(name, seconds):
+    """Add one observation to emotrack_stage_duration_seconds{stage=name}."""
+    if METRICS_ENABLED:
+        registry.observe(stage_seconds, (name,), seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as emotrack_stage_duration_seconds{stage=name}."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+
+def io(op, path, rows, nbytes, seconds):
+    """Record one CSV operation on `path` (labelled by file name)."""
+    if not METRICS_ENABLED:
+        return
+    labels = (op, Path(path).name)
+    with registry._lock:
+        csv_seconds.observe(labels, seconds)
+        csv_rows.inc(labels, rows)
+        csv_bytes.inc(labels, nbytes)
+
+
+# Sampling profiler
+
+class Sampler:
+    """Samples the stacks of all other threads every `interval` seconds.
+
+    Only stacks that pass through app/ code are kept; the result is in
+    collapsed format: "outer;inner;leaf count" per line.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack, ours = [], False
+                while frame is not None:
+                    code = frame.f_code
+                    ours = ours or code.co_filename.startswith(APP_DIR)
+                    stack.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+                    frame = frame.f_back
+                if ours:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return "".join(f"{s} {n}\n" for s, n in sorted(self.samples.items(), key=lambda kv: -kv[1]))
+
+
+profiles = OrderedDict()  # id -> collapsed stacks, newest last
+_profiles_lock = threading.Lock()
+
+
+def _keep_profile(profile_id, text):
+    with _profiles_lock:
+        profiles[profile_id] = text
+        while len(profiles) > PROFILES_KEPT:
+            profiles.popitem(last=False)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: per-route latency and status, and the X-Profile hook.
+
+    `profile_guard(headers)` decides whether a request may be profiled.
+    """
+
+    def __init__(self, app, profile_guard=None):
+        self.app = app
+        self.profile_guard = profile_guard
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        sampler = None
+        if self.profile_guard is not None:
+            headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+            if headers.get("x-profile") in ("1", "true") and self.profile_guard(headers):
+                sampler = Sampler().start()
+        status, profile_id = [500], [None]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if sampler is not None:
+                    profile_id[0] = uuid.uuid4().hex[:12]
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id[0].encode())]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            route = scope.get("route")
+            # templates only (/metrics/profiles/{profile_id}), never raw paths: keeps label cardinality bounded
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            with registry._lock:
+                http_seconds.observe((method, path), elapsed)
+                http_requests.inc((method, path, str(status[0])))
+            if sampler is not None:
+                text = sampler.stop()
+                if profile_id[0] is not None:
+                    _keep_profile(profile_id[0], text)
@@ -14,16 +14,17 @@ class UserModel:
 
 @dataclass
 class SurveyModel:
+    """One typed survey row (see app.table); blank fields are None."""
     id: int
-    user_id: int
+    user_id: Optional[int]
     username: str
-    mood: int
-    mood_score: int
-    sleep_hours: float
-    appetite: int
-    concentration: int
+    mood: Optional[int]
+    mood_score: Optional[int]
+    sleep_hours: Optional[float]
+    appetite: Optional[int]
+    concentration: Optional[int]
     notes: Optional[str]
-    created_at: str
+    created_at: Optional[str]
 
 
 # Pydantic schemas moved here for reuse across the app (requests/validation)
@@ -46,3 +47,10 @@ class SurveyCreate(BaseModel):
     appetite: Optional[int] = None
     concentration: Optional[int] = None
     notes: Optional[str] = None
+
+
+class SurveyImport(SurveyCreate):
+    """One row of POST /surveys/batch. Backfilled forms carry their own date;
+    admins may import rows on behalf of another user."""
+    created_at: Optional[str] = None
+    username: Optional[str] = None
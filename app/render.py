@@ -0,0 +1,178 @@
+"""
+render.py - Plot rendering off the API workers.
+
+generate_user_plot drives pyplot's global state, which is slow and not
+thread-safe, so renders run in a small pool of warm worker processes that
+import matplotlib/seaborn once. The pool has a bounded queue (callers get
+Overloaded when it is full), a per-job timeout, and identical concurrent
+requests for the same (username, kind, version) share a single job.
+
+A job that times out before it started is cancelled. One that is still
+running is taken as hung: the pool is recycled (its workers are killed and
+its jobs' queue slots released) and the next render starts a fresh one.
+Each worker reports its pid when it starts, so recycling knows what to kill
+without reaching into the executor.
+Jobs lost with a dead worker are submitted once more on a new pool.
+
+EMOTRACK_PLOT_WORKERS=0 renders on one background thread instead (pyplot
+calls are still serialized), which is handy for development. A hung thread
+cannot be killed; recycling only abandons it.
+"""
+
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio, multiprocessing, os, signal, threading
+
+from app import metrics
+
+PLOT_WORKERS = int(os.environ.get("EMOTRACK_PLOT_WORKERS", 2))
+PLOT_QUEUE_SIZE = int(os.environ.get("EMOTRACK_PLOT_QUEUE", 16))   # running + waiting jobs
+PLOT_TIMEOUT = float(os.environ.get("EMOTRACK_PLOT_TIMEOUT", 15))  # seconds a request waits
+
+
+class Overloaded(Exception):
+    """The render queue is full; the caller should retry later."""
+
+
+def _warm(pids=None):
+    # Runs once per worker process: say who we are, then pay the plotting-stack import up front
+    if pids is not None:
+        pids.put(os.getpid())
+    from app import analytics
+    analytics.prewarm()
+
+
+def _render(username, kind):
+    from app import analytics, metrics
+    png = analytics.generate_user_plot(username, kind=kind)
+    # a worker process ships its stage/CSV timings back with the image
+    return png, metrics.registry.drain() if multiprocessing.parent_process() is not None else None
+
+
+def _worker_pids(pids):
+    """Pids reported so far on a pool's queue (none for the thread fallback)."""
+    out = []
+    while pids is not None and not pids.empty():
+        out.append(pids.get())
+    return out
+
+
+class PlotRenderer:
+    def __init__(self, workers=PLOT_WORKERS, queue_size=PLOT_QUEUE_SIZE, timeout=PLOT_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pids = {}  # process pool -> SimpleQueue its workers put their pid on
+        self._inflight = {}  # (username, kind, version) -> (concurrent.futures.Future, pool it runs on)
+        self.deduplicated = self.rejected = self.timeouts = self.recycled = 0
+
+    def _executor(self):
+        if self._pool is None:
+            if self.workers > 0:
+                ctx = multiprocessing.get_context("spawn")
+                pids = ctx.SimpleQueue()
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_warm, initargs=(pids,))
+                self._pids[self._pool] = pids
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plot")
+        return self._pool
+
+    def start(self):
+        """Create the pool and start every worker now instead of on first request.
+
+        The thread fallback is not warmed: it runs in the API process, which
+        loads the plotting stack on the first plot (or EMOTRACK_PREWARM=all).
+        """
+        with self._lock:
+            pool = self._executor()
+        if self.workers > 0:
+            for f in [pool.submit(_warm) for _ in range(self.workers)]:
+                f.result()
+
+    def _submit(self, username, kind, version):
+        key = (username, kind, version)
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None:
+                self.deduplicated += 1
+                return entry
+            if len(self._inflight) >= self.queue_size:
+                self.rejected += 1
+                raise Overloaded()
+            pool = self._executor()
+            try:
+                fut = pool.submit(_render, username, kind)
+            except BrokenProcessPool:
+                # a worker died (crash/OOM): replace the pool once and retry
+                self._pids.pop(pool, None)
+                self._pool = None
+                pool = self._executor()
+                fut = pool.submit(_render, username, kind)
+            entry = self._inflight[key] = (fut, pool)
+        fut.add_done_callback(lambda f: self._done(key, f))
+        return entry
+
+    def submit(self, username, kind, version):
+        return self._submit(username, kind, version)[0]
+
+    def _done(self, key, fut):
+        with self._lock:
+            if self._inflight.get(key, (None,))[0] is fut:
+                del self._inflight[key]
+        if not fut.cancelled() and fut.exception() is None:
+            metrics.registry.merge(fut.result()[1])
+
+    def _recycle(self, pool):
+        """Kill `pool`'s workers and release the queue slots of its jobs."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self.recycled += 1
+            self._inflight = {k: e for k, e in self._inflight.items() if e[1] is not pool}
+            pids = self._pids.pop(pool, None)
+        # the pool's manager thread then fails its remaining futures with BrokenProcessPool
+        for pid in _worker_pids(pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass  # already gone
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def render(self, username, kind, version):
+        """PNG bytes for the plot; raises Overloaded or asyncio.TimeoutError."""
+        for attempt in range(2):
+            fut, pool = self._submit(username, kind, version)
+            try:
+                # shield: a waiter timing out must not cancel a job others may share
+                png, _ = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), self.timeout)
+                return png
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                if not fut.done() and not fut.cancel():
+                    self._recycle(pool)
+                raise
+            except (asyncio.CancelledError, CancelledError):
+                if not fut.cancelled():
+                    raise
+                # another waiter of this shared job timed out before it started
+                raise asyncio.TimeoutError()
+            except BrokenProcessPool:
+                self._recycle(pool)
+                if attempt:
+                    raise
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "queue_size": self.queue_size, "in_flight": len(self._inflight), "deduplicated": self.deduplicated, "rejected": self.rejected, "timeouts": self.timeouts, "recycled": self.recycled}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._pids.pop(pool, None)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+plots = PlotRenderer()
@@ -0,0 +1,259 @@
+"""
+risk.py - Incremental per-user risk engine.
+
+Keeps running aggregates per user (composite sum/count and the latest
+analytics.TREND_WINDOW mood_score readings) so a new survey only touches its
+own user instead of re-reading every survey like analytics.compute_risk does. Alerts are saved
+from the in-memory table: the CSV backend rewrites alerts.csv (O(users), no
+survey reads), the SQLite backend upserts only the changed row.
+
+The results match the batch path exactly (same composite, same Kahan-summed
+mean pandas uses, same trend rule). For recovery or auditing:
+
+    python -m app.risk rebuild   # recompute everything from the stored surveys
+    python -m app.risk check     # compare against analytics.compute_risk
+"""
+
+import math, sys, threading
+
+from app import analytics, keywords, lookups, storage, table
+
+
+def _as_read_csv(row):
+    """Coerce an API row to the values pandas.read_csv would give for it."""
+    import pandas as pd
+    out = dict(row)
+    for k in ("mood","mood_score","sleep_hours","appetite","concentration","notes"):
+        v = out.get(k)
+        if v is None or v == "":
+            out[k] = math.nan
+        elif k != "notes" and isinstance(v, str):
+            try:
+                out[k] = float(v)
+            except ValueError:
+                pass
+    try:
+        out["created_at"] = pd.Timestamp(out.get("created_at"))
+    except Exception:
+        pass
+    return out
+
+
+def _as_read_csv_frame(rows):
+    """Columnar _as_read_csv for a block of API rows."""
+    import pandas as pd
+    df = pd.DataFrame(rows)
+    for k in ("mood","mood_score","sleep_hours","appetite","concentration"):
+        if k in df.columns:
+            df[k] = pd.to_numeric(df[k], errors="coerce")
+    df["created_at"] = pd.to_datetime(df["created_at"])
+    return df
+
+
+class _UserScore:
+    """Composite mean with the same Kahan compensation as pandas groupby().mean()."""
+    __slots__ = ("total", "compensation", "count")
+
+    def __init__(self):
+        self.total = 0.0
+        self.compensation = 0.0
+        self.count = 0
+
+    def add(self, value):
+        y = value - self.compensation
+        t = self.total + y
+        self.compensation = t - self.total - y
+        if self.compensation != self.compensation:
+            self.compensation = 0.0
+        self.total = t
+        self.count += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count
+
+
+class RiskEngine:
+    def __init__(self, backend=None, survey_table=None):
+        self._backend = backend
+        # rebuilds read the process-wide survey table (a private one over an explicit backend)
+        self._table = survey_table or (table.SurveyTable(backend) if backend is not None else table.surveys)
+        self._lock = threading.Lock()
+        self._scores = {}   # (user_id, username) -> _UserScore
+        self._recent = {}   # user_id -> [(created_at, seq, mood_score)], oldest first
+        self._seq = 0
+        self._last_id = None
+        self._loaded = False
+        self._keywords = None  # keywords.screen.version() the table was built with
+        self.window = analytics.TREND_WINDOW
+        self.listeners = []  # called as fn(alert, previous_level) when a risk_level changes
+
+    @property
+    def backend(self):
+        return self._backend or storage.get()
+
+    def _reset(self):
+        self._scores, self._recent, self._seq, self._last_id = {}, {}, 0, None
+
+    def _apply(self, user_id, username, composite, created_at, mood_score):
+        import pandas as pd
+        if pd.isna(user_id) or pd.isna(username):
+            return
+        self._seq += 1
+        self._scores.setdefault((user_id, username), _UserScore()).add(composite)
+        recent = self._recent.setdefault(user_id, [])
+        recent.append((created_at, self._seq, mood_score))
+        if len(recent) > 1 and recent[-2][0] > created_at:
+            recent.sort(key=lambda r: (r[0], r[1]))
+        del recent[:-self.window]
+
+    def _trend(self, user_id):
+        return analytics.is_negative_trend([r[2] for r in self._recent.get(user_id, [])], window=self.window)
+
+    def _row(self, key):
+        user_id, username = key
+        avg = self._scores[key].mean
+        trend = self._trend(user_id)
+        return {"user_id": user_id, "username": username, "avg_score": avg, "trend_negative": trend, "risk_level": analytics.risk_label(avg, trend)}
+
+    def _levels(self):
+        if self._loaded:
+            return {k: self._row(k)["risk_level"] for k in self._scores}
+        return {(a["user_id"], a["username"]): a["risk_level"] for a in self.backend.read_alerts()}
+
+    def _notify(self, changes):
+        for alert, previous in changes:
+            for fn in self.listeners:
+                try:
+                    fn(alert, previous)
+                except Exception:
+                    pass
+
+    def _write(self, changed=None, persist=True):
+        rows = self.alerts()
+        if persist:
+            self.backend.save_alerts(rows, changed=changed)
+        lookups.alerts.saved(rows, changed=changed)
+        if persist:
+            analytics.ensure_recommendations_file()
+
+    def _rebuild(self):
+        import pandas as pd
+        self._reset()
+        self._loaded = True
+        self._keywords = keywords.screen.version()
+        df = self._table.frame()
+        if df.empty:
+            return
+        for c in ["mood_score","sleep_hours","appetite","concentration","notes"]:
+            if c not in df.columns:
+                df[c] = None
+        df["composite"] = analytics.composite_scores(df)
+        for r in df[["user_id","username","composite","created_at","mood_score"]].itertuples(index=False):
+            self._apply(r.user_id, r.username, r.composite, r.created_at, r.mood_score)
+        ids = pd.to_numeric(df["id"], errors="coerce")
+        self._last_id = int(ids.iloc[-1]) if pd.notna(ids.iloc[-1]) else None
+
+    def rebuild(self):
+        """Full recompute from the stored surveys (recovery mode); replaces all alerts."""
+        self._table.invalidate()
+        with self._lock:
+            self._rebuild()
+            self._write()
+            return self.alerts()
+
+    def add(self, row):
+        """Fold one freshly stored survey row in and refresh its alert row.
+
+        Falls back to a rebuild when the row does not directly follow the last
+        one seen (first call, or surveys changed behind our back). Listeners
+        are called after the lock is released, once per changed risk_level.
+        """
+        return self.add_many([row]).get((row["user_id"], row["username"]))
+
+    def add_many(self, rows, persist=True):
+        """Fold a block of freshly stored rows (consecutive ids) in at once.
+
+        Only the affected users' alert rows are saved, in a single write.
+        Returns {(user_id, username): alert} for those users. persist=False
+        (rows stored and alerts saved by another API worker) only updates
+        memory and lookups.alerts.
+        """
+        rows = list(rows)
+        if not rows:
+            return {}
+        keys = list(dict.fromkeys((r["user_id"], r["username"]) for r in rows))
+        with self._lock:
+            first = int(rows[0]["id"])
+            if self._loaded and self._last_id is not None and int(rows[-1]["id"]) <= self._last_id:
+                # already read from storage by a rebuild
+                return {k: self.alert_for(*k) for k in keys}
+            if not self._loaded or self._keywords != keywords.screen.version() or self._last_id is None or first != self._last_id + 1 or int(rows[-1]["id"]) != first + len(rows) - 1:
+                before = self._levels() if self.listeners else {}
+                self._rebuild()
+                self._write(persist=persist)
+                changes = [(a, before.get((a["user_id"], a["username"]))) for a in self.alerts()] if self.listeners else []
+            else:
+                previous = {k: self._row(k)["risk_level"] if k in self._scores else None for k in keys}
+                if len(rows) == 1:
+                    r = _as_read_csv(rows[0])
+                    self._apply(r["user_id"], r["username"], analytics.compute_composite(r), r["created_at"], r["mood_score"])
+                else:
+                    df = _as_read_csv_frame(rows)
+                    df["composite"] = analytics.composite_scores(df)
+                    for r in df[["user_id","username","composite","created_at","mood_score"]].itertuples(index=False):
+                        self._apply(r.user_id, r.username, r.composite, r.created_at, r.mood_score)
+                self._last_id = first + len(rows) - 1
+                changed = [a for a in (self.alert_for(*k) for k in keys) if a]
+                self._write(changed=changed, persist=persist)
+                changes = [(a, previous[(a["user_id"], a["username"])]) for a in changed]
+            result = {k: self.alert_for(*k) for k in keys}
+        self._notify([(a, p) for a, p in changes if a["risk_level"] != p])
+        return result
+
+    def invalidate(self):
+        """Forget the in-memory table; the next add_many() rebuilds it from storage."""
+        with self._lock:
+            self._loaded = False
+
+    def alert_for(self, user_id, username):
+        key = (user_id, username)
+        return self._row(key) if key in self._scores else None
+
+    def alerts(self):
+        return [self._row(k) for k in sorted(self._scores)]
+
+    def check(self):
+        """Compare the incremental table with analytics.compute_risk.
+
+        Returns a list of mismatch descriptions (empty when both agree).
+        """
+        with self._lock:
+            if not self._loaded:
+                self._rebuild()
+            mine = {(a["user_id"], a["username"]): a for a in self.alerts()}
+        batch = analytics.compute_risk(write_alerts=False).get("alerts", [])
+        theirs = {(a["user_id"], a["username"]): a for a in batch}
+        problems = [f"missing in incremental: {k}" for k in theirs.keys() - mine.keys()]
+        problems += [f"missing in batch: {k}" for k in mine.keys() - theirs.keys()]
+        for k in theirs.keys() & mine.keys():
+            for field in ("avg_score", "trend_negative", "risk_level"):
+                if mine[k][field] != theirs[k][field]:
+                    problems.append(f"{k} {field}: incremental={mine[k][field]!r} batch={theirs[k][field]!r}")
+        return problems
+
+
+engine = RiskEngine()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "rebuild":
+        print(f"{len(engine.rebuild())} alert rows written ({engine.backend.name} storage)")
+    elif cmd == "check":
+        problems = engine.check()
+        print("\n".join(problems) if problems else "incremental and batch risk agree")
+        sys.exit(1 if problems else 0)
+    else:
+        print("usage: python -m app.risk rebuild|check")
+        sys.exit(1)
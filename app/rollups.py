@@ -0,0 +1,148 @@
+"""
+rollups.py - Materialized daily mood rollup for the global /stats view.
+
+Keeps sum/count of mood per calendar day (plus the number of survey rows,
+so days with only blank moods still extend the range like resample does).
+It is built from one narrow (id, mood, created_at) scan of app.table on first use,
+updated in O(1) on each insert, and rebuilt automatically when the surveys
+table changes behind our back.
+
+summary() reproduces resample('D').mean().ffill() over any date window, so
+the response size follows the window instead of the full history.
+"""
+
+from bisect import bisect_left
+from datetime import date, timedelta
+import math, threading
+
+from app import storage, table
+
+
+def _day(value):
+    # API rows carry 'YYYY-MM-DDTHH:MM:SS'; anything else goes through pandas
+    if isinstance(value, str) and len(value) == 19 and value[10] == "T":
+        return value[:10]
+    import pandas as pd
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+class DailyMoodRollup:
+    def __init__(self, backend=None, survey_table=None):
+        self._backend = backend
+        self._table = survey_table or (table.SurveyTable(backend) if backend is not None else table.surveys)
+        self._lock = threading.Lock()
+        self._days = {}      # 'YYYY-MM-DD' -> [mood_sum, mood_count, rows]
+        self._sorted = []    # days with rows, ascending
+        self._last_id = None
+        self._stamp = None
+        self._loaded = False
+
+    @property
+    def backend(self):
+        return self._backend or storage.get()
+
+    def _rebuild(self):
+        import pandas as pd
+        self._days, self._sorted, self._last_id = {}, [], None
+        self._stamp = self.backend.surveys_stamp()
+        self._loaded = True
+        df = self._table.frame(columns=["id","mood","created_at"])
+        if df.empty:
+            return
+        ids = pd.to_numeric(df["id"], errors="coerce")
+        self._last_id = int(ids.iloc[-1]) if pd.notna(ids.iloc[-1]) else None
+        mood = pd.to_numeric(df["mood"], errors="coerce")
+        try:
+            days = pd.to_datetime(df["created_at"]).dt.strftime("%Y-%m-%d")
+        except (ValueError, TypeError):
+            return
+        g = pd.DataFrame({"day": days, "mood": mood}).groupby("day")["mood"].agg(["sum", "count", "size"])
+        for day, r in g.iterrows():
+            self._days[day] = [float(r["sum"]), int(r["count"]), int(r["size"])]
+        self._sorted = sorted(self._days)
+
+    def rebuild(self):
+        self._table.invalidate()
+        with self._lock:
+            self._rebuild()
+
+    def add(self, row):
+        """Fold one freshly stored survey into its day."""
+        self.add_many([row])
+
+    def add_many(self, rows):
+        """Fold freshly stored surveys (consecutive ids) into their days."""
+        if not rows:
+            return
+        with self._lock:
+            first = int(rows[0]["id"])
+            if self._loaded and self._last_id is not None and int(rows[-1]["id"]) <= self._last_id:
+                return  # already read from storage
+            if not self._loaded or self._last_id is None or first != self._last_id + 1 or int(rows[-1]["id"]) != first + len(rows) - 1:
+                self._rebuild()
+                return
+            for row in rows:
+                day = _day(row["created_at"])
+                entry = self._days.get(day)
+                if entry is None:
+                    entry = self._days[day] = [0.0, 0, 0]
+                    self._sorted.insert(bisect_left(self._sorted, day), day)
+                try:
+                    mood = float(row.get("mood"))
+                except (TypeError, ValueError):
+                    mood = math.nan
+                if not math.isnan(mood):
+                    entry[0] += mood
+                    entry[1] += 1
+                entry[2] += 1
+            self._last_id = int(rows[-1]["id"])
+            self._stamp = self.backend.surveys_stamp()
+
+    def invalidate(self):
+        """Rebuild from storage on next use."""
+        with self._lock:
+            self._loaded = False
+
+    def _ensure(self):
+        if not self._loaded or self.backend.surveys_stamp() != self._stamp:
+            self._rebuild()
+
+    def summary(self, start=None, end=None):
+        """(average_mood, total_entries, history) for the inclusive [start, end] window.
+
+        start/end are 'YYYY-MM-DD' strings or None for the full range. A
+        window without any mood gives (0, 0, []), like an empty table; moods
+        are only carried into a window that has data of its own.
+        """
+        with self._lock:
+            self._ensure()
+            if not self._sorted:
+                return 0, 0, []
+            first = max(start or self._sorted[0], self._sorted[0])
+            last = min(end or self._sorted[-1], self._sorted[-1])
+            if first > last:
+                return 0, 0, []
+            # seed the forward fill with the last day that has a mood before the window
+            i = bisect_left(self._sorted, first)
+            carry = None
+            for d in reversed(self._sorted[:i]):
+                if self._days[d][1]:
+                    carry = self._days[d][0] / self._days[d][1]
+                    break
+            history, total, count = [], 0.0, 0
+            day, stop = date.fromisoformat(first), date.fromisoformat(last)
+            while day <= stop:
+                key = day.isoformat()
+                entry = self._days.get(key)
+                if entry and entry[1]:
+                    carry = entry[0] / entry[1]
+                    total += entry[0]
+                    count += entry[1]
+                history.append({"date": key, "mood": carry})
+                day += timedelta(days=1)
+            if not count:
+                return 0, 0, []
+            return total / count, count, history
+
+
+daily_mood = DailyMoodRollup()
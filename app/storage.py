@@ -0,0 +1,443 @@
+"""
+storage.py - Pluggable persistence for users, surveys and alerts.
+
+Two backends share the same small interface:
+
+- CSVStorage: the original data/*.csv files (default).
+- SQLiteStorage: one SQLite database in WAL mode with indexes on username,
+  user_id and created_at, safe for concurrent writers.
+
+The backend is chosen with EMOTRACK_STORAGE=csv|sqlite (database path in
+EMOTRACK_SQLITE_PATH, default data/emotrack.db). Existing CSV data can be
+copied into SQLite once with:
+
+    python -m app.storage migrate [sqlite_path]
+
+Survey reads can ask for specific columns and users, so analytics only load
+what they need. Each table also exposes a cheap change stamp that in-memory
+caches compare to know when to reload.
+"""
+
+from pathlib import Path
+import csv, heapq, os, sqlite3, sys, threading, time
+
+from app import metrics
+from app.utils import append_csv_rows, read_csv_rows, write_csv_rows
+
+BASE = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(os.environ.get("EMOTRACK_DATA_DIR", BASE / "data"))
+
+USER_FIELDS = ["id","username","email","hashed_password","role","created_at"]
+SURVEY_FIELDS = ["id","user_id","username","mood","mood_score","sleep_hours","appetite","concentration","notes","created_at"]
+ALERT_FIELDS = ["user_id","username","avg_score","trend_negative","risk_level"]
+
+STORAGE_BACKEND = os.environ.get("EMOTRACK_STORAGE", "csv").lower()
+SQLITE_PATH = Path(os.environ.get("EMOTRACK_SQLITE_PATH", DATA_DIR / "emotrack.db"))
+
+
+def _fsync(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _file_stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _parse_alert(row):
+    """Typed alert row: int user_id, float avg_score, bool trend_negative."""
+    try:
+        user_id = int(row.get("user_id"))
+    except (TypeError, ValueError):
+        user_id = row.get("user_id", "")
+    trend = row.get("trend_negative", False)
+    if isinstance(trend, str):
+        trend = trend == "True"
+    return {"user_id": user_id, "username": row.get("username", ""), "avg_score": float(row.get("avg_score") or 0), "trend_negative": bool(trend), "risk_level": row.get("risk_level") or "BAJO"}
+
+
+def alert_key(alert):
+    """Sort/cursor key of an alert row: (user_id, username)."""
+    user_id = alert["user_id"]
+    return (user_id if isinstance(user_id, int) else -1, alert["username"])
+
+
+def _alert_matches(alert, risk_level, trend_negative):
+    if risk_level is not None and alert["risk_level"].upper() != risk_level.upper():
+        return False
+    return trend_negative is None or alert["trend_negative"] == trend_negative
+
+
+class CSVStorage:
+    name = "csv"
+
+    def __init__(self, data_dir=DATA_DIR):
+        data_dir = Path(data_dir)
+        self.users_csv = data_dir / "users.csv"
+        self.surveys_csv = data_dir / "surveys.csv"
+        self.alerts_csv = data_dir / "alerts.csv"
+        self._users_header_ok = None
+
+    def sync(self, tables=("users", "surveys")):
+        """Flush appended rows to disk (fsync) so they survive a crash."""
+        for t in tables:
+            _fsync(getattr(self, f"{t}_csv"))
+
+    # users
+    def users_stamp(self):
+        return _file_stat(self.users_csv)
+
+    def read_users(self):
+        rows = read_csv_rows(self.users_csv)
+        self._users_header_ok = not rows or list(rows[0].keys()) == USER_FIELDS
+        return rows
+
+    def append_users(self, rows):
+        if self._users_header_ok is None:
+            self.read_users()
+        if self._users_header_ok:
+            append_csv_rows(self.users_csv, rows, USER_FIELDS)
+        else:
+            # legacy header (e.g. no role column): rewrite once with the current one
+            write_csv_rows(self.users_csv, read_csv_rows(self.users_csv) + list(rows), USER_FIELDS)
+            self._users_header_ok = True
+
+    # surveys
+    def surveys_stamp(self):
+        return _file_stat(self.surveys_csv)
+
+    def max_survey_id(self):
+        max_id = 0
+        if self.surveys_csv.exists():
+            with open(self.surveys_csv, encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if header and "id" in header:
+                    idx = header.index("id")
+                    for rec in reader:
+                        try:
+                            max_id = max(max_id, int(rec[idx]))
+                        except (IndexError, ValueError):
+                            continue
+        return max_id
+
+    def append_surveys(self, rows):
+        append_csv_rows(self.surveys_csv, rows, SURVEY_FIELDS)
+
+    def read_surveys(self, columns=None, usernames=None, user_ids=None):
+        """Surveys as a DataFrame (created_at parsed), optionally narrowed."""
+        import pandas as pd
+        if not self.surveys_csv.exists():
+            return pd.DataFrame(columns=columns or SURVEY_FIELDS)
+        usecols = None
+        if columns is not None:
+            wanted = set(columns) | ({"username"} if usernames is not None else set()) | ({"user_id"} if user_ids is not None else set())
+            usecols = lambda c: c in wanted
+        parse = ["created_at"] if columns is None or "created_at" in columns else False
+        t0 = time.perf_counter()
+        df = pd.read_csv(self.surveys_csv, usecols=usecols, parse_dates=parse)
+        metrics.io("read", self.surveys_csv, len(df), self.surveys_csv.stat().st_size, time.perf_counter() - t0)
+        if usernames is not None:
+            df = df[df["username"].isin(list(usernames))]
+        if user_ids is not None:
+            df = df[df["user_id"].isin(list(user_ids))]
+        return df[[c for c in columns if c in df.columns]] if columns is not None else df
+
+    def iter_surveys(self, usernames=None, user_ids=None):
+        """Survey rows as dicts (CSV strings), streamed in file order."""
+        if not self.surveys_csv.exists():
+            return
+        names = set(usernames) if usernames is not None else None
+        ids = {str(u) for u in user_ids} if user_ids is not None else None
+        t0, scanned = time.perf_counter(), 0
+        with open(self.surveys_csv, encoding="utf-8", newline="") as f:
+            try:
+                for r in csv.DictReader(f):
+                    scanned += 1
+                    if names is not None and r.get("username") not in names:
+                        continue
+                    if ids is not None and r.get("user_id") not in ids:
+                        continue
+                    yield r
+            finally:
+                # bytes: the file size (an abandoned scan still read buffers ahead)
+                metrics.io("read", self.surveys_csv, scanned, os.fstat(f.fileno()).st_size, time.perf_counter() - t0)
+
+    def compact_surveys(self):
+        """Rewrite surveys.csv sorted by id, keeping the last row for each id."""
+        if not self.surveys_csv.exists():
+            return {"rows": 0, "dropped": 0}
+        by_id, total = {}, 0
+        with open(self.surveys_csv, encoding="utf-8", newline="") as f:
+            for r in csv.DictReader(f):
+                total += 1
+                try:
+                    by_id[int(r.get("id"))] = r
+                except (TypeError, ValueError):
+                    continue
+        tmp = self.surveys_csv.with_suffix(".csv.tmp")
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SURVEY_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(by_id[k] for k in sorted(by_id))
+        os.replace(tmp, self.surveys_csv)
+        return {"rows": len(by_id), "dropped": total - len(by_id)}
+
+    # alerts
+    def alerts_stamp(self):
+        return _file_stat(self.alerts_csv)
+
+    def read_alerts(self):
+        return [_parse_alert(r) for r in read_csv_rows(self.alerts_csv)]
+
+    def page_alerts(self, after=None, limit=None, risk_level=None, trend_negative=None):
+        """(total matching, matching rows with alert_key > after, first `limit` by key).
+
+        One streaming pass over alerts.csv; only `limit` rows are held.
+        """
+        total, rows, scanned = 0, [], 0
+        if self.alerts_csv.exists():
+            t0 = time.perf_counter()
+            with open(self.alerts_csv, encoding="utf-8", newline="") as f:
+                for a in map(_parse_alert, csv.DictReader(f)):
+                    scanned += 1
+                    if not _alert_matches(a, risk_level, trend_negative):
+                        continue
+                    total += 1
+                    if after is None or alert_key(a) > after:
+                        rows.append(a)
+                        if limit is not None and len(rows) > 4 * limit:
+                            rows = heapq.nsmallest(limit, rows, key=alert_key)
+                nbytes = os.fstat(f.fileno()).st_size
+            metrics.io("read", self.alerts_csv, scanned, nbytes, time.perf_counter() - t0)
+        rows = heapq.nsmallest(limit, rows, key=alert_key) if limit is not None else sorted(rows, key=alert_key)
+        return total, rows
+
+    def save_alerts(self, rows, changed=None):
+        """Persist the full alerts table (a CSV cannot update single rows)."""
+        write_csv_rows(self.alerts_csv, rows, ALERT_FIELDS)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY, username TEXT NOT NULL, email TEXT, hashed_password TEXT, role TEXT, created_at TEXT);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS surveys (
+    id INTEGER PRIMARY KEY, user_id INTEGER, username TEXT, mood INTEGER, mood_score INTEGER, sleep_hours REAL,
+    appetite INTEGER, concentration INTEGER, notes TEXT, created_at TEXT);
+CREATE INDEX IF NOT EXISTS idx_surveys_username ON surveys(username);
+CREATE INDEX IF NOT EXISTS idx_surveys_user_id ON surveys(user_id);
+CREATE INDEX IF NOT EXISTS idx_surveys_created_at ON surveys(created_at);
+CREATE TABLE IF NOT EXISTS alerts (
+    user_id INTEGER, username TEXT, avg_score REAL, trend_negative INTEGER, risk_level TEXT, PRIMARY KEY (user_id, username));
+CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0);
+INSERT OR IGNORE INTO table_versions (name) VALUES ('users'), ('surveys'), ('alerts');
+"""
+
+# Per-table change counters, bumped by triggers so every process sees them
+_VERSION_TRIGGERS = "".join(
+    f"CREATE TRIGGER IF NOT EXISTS {t}_{op.lower()}_version AFTER {op} ON {t} BEGIN "
+    f"UPDATE table_versions SET version = version + 1 WHERE name = '{t}'; END;\n"
+    for t in ("users", "surveys", "alerts") for op in ("INSERT", "UPDATE", "DELETE")
+)
+
+
+def _blank_to_null(v):
+    return None if v == "" else v
+
+
+class SQLiteStorage:
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def sync(self, tables=None):
+        """Make committed transactions durable.
+
+        With synchronous=NORMAL a WAL commit is only fsynced at checkpoint;
+        fsyncing the -wal file gives the same guarantee as synchronous=FULL,
+        once per group of commits instead of once per commit.
+        """
+        _fsync(Path(str(self.path) + "-wal"))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SQLITE_SCHEMA + _VERSION_TRIGGERS)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def _version(self, table):
+        row = self._conn().execute("SELECT version FROM table_versions WHERE name = ?", (table,)).fetchone()
+        return row[0] if row else 0
+
+    def _insert(self, table, fields, rows):
+        conn = self._conn()
+        sql = f"INSERT INTO {table} ({','.join(fields)}) VALUES ({','.join('?' * len(fields))})"
+        with conn:
+            conn.executemany(sql, [tuple(_blank_to_null(r.get(f)) for f in fields) for r in rows])
+
+    # users
+    def users_stamp(self):
+        return self._version("users")
+
+    def read_users(self):
+        cur = self._conn().execute(f"SELECT {','.join(USER_FIELDS)} FROM users ORDER BY id")
+        return [{k: ("" if r[k] is None else str(r[k])) for k in USER_FIELDS} for r in cur]
+
+    def append_users(self, rows):
+        self._insert("users", USER_FIELDS, rows)
+
+    # surveys
+    def surveys_stamp(self):
+        return self._version("surveys")
+
+    def max_survey_id(self):
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM surveys").fetchone()[0]
+
+    def append_surveys(self, rows):
+        self._insert("surveys", SURVEY_FIELDS, rows)
+
+    def _where(self, usernames, user_ids):
+        clauses, params = [], []
+        if usernames is not None:
+            usernames = list(usernames)
+            clauses.append(f"username IN ({','.join('?' * len(usernames))})")
+            params += usernames
+        if user_ids is not None:
+            user_ids = [int(u) for u in user_ids]
+            clauses.append(f"user_id IN ({','.join('?' * len(user_ids))})")
+            params += user_ids
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def read_surveys(self, columns=None, usernames=None, user_ids=None):
+        import pandas as pd
+        cols = [c for c in (columns or SURVEY_FIELDS) if c in SURVEY_FIELDS]
+        where, params = self._where(usernames, user_ids)
+        df = pd.read_sql_query(f"SELECT {','.join(cols)} FROM surveys{where} ORDER BY id", self._conn(), params=params)
+        if "created_at" in df.columns:
+            try:
+                df["created_at"] = pd.to_datetime(df["created_at"])
+            except (ValueError, TypeError):
+                pass
+        return df
+
+    def iter_surveys(self, usernames=None, user_ids=None, page_size=1000):
+        """Survey rows as dicts (NULL as ''), streamed in id order.
+
+        Reads keyset pages (id > last) so no cursor outlives a page: callers
+        such as streaming responses may resume on another thread.
+        """
+        where, params = self._where(usernames, user_ids)
+        where = (where + " AND" if where else " WHERE") + " id > ?"
+        last = 0
+        while True:
+            page = self._conn().execute(f"SELECT {','.join(SURVEY_FIELDS)} FROM surveys{where} ORDER BY id LIMIT {int(page_size)}", params + [last]).fetchall()
+            for r in page:
+                yield {k: ("" if r[k] is None else r[k]) for k in SURVEY_FIELDS}
+            if len(page) < page_size:
+                return
+            last = page[-1]["id"]
+
+    # alerts
+    def alerts_stamp(self):
+        return self._version("alerts")
+
+    def read_alerts(self):
+        cur = self._conn().execute(f"SELECT {','.join(ALERT_FIELDS)} FROM alerts ORDER BY user_id, username")
+        return [_parse_alert(dict(r)) for r in cur]
+
+    def page_alerts(self, after=None, limit=None, risk_level=None, trend_negative=None):
+        """(total matching, next rows after `after` in (user_id, username) order)."""
+        clauses, params = [], []
+        if risk_level is not None:
+            clauses.append("UPPER(risk_level) = ?")
+            params.append(risk_level.upper())
+        if trend_negative is not None:
+            clauses.append("trend_negative = ?")
+            params.append(int(trend_negative))
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM alerts{where}", params).fetchone()[0]
+        if after is not None:
+            clauses.append("(user_id > ? OR (user_id = ? AND username > ?))")
+            params += [after[0], after[0], after[1]]
+            where = " WHERE " + " AND ".join(clauses)
+        sql = f"SELECT {','.join(ALERT_FIELDS)} FROM alerts{where} ORDER BY user_id, username" + (f" LIMIT {int(limit)}" if limit is not None else "")
+        return total, [_parse_alert(dict(r)) for r in conn.execute(sql, params)]
+
+    def save_alerts(self, rows, changed=None):
+        """Upsert only `changed` when given, otherwise replace the whole table."""
+        conn = self._conn()
+        sql = f"INSERT OR REPLACE INTO alerts ({','.join(ALERT_FIELDS)}) VALUES (?,?,?,?,?)"
+        data = [(int(r["user_id"]), str(r["username"]), float(r["avg_score"]), int(bool(r["trend_negative"])), r["risk_level"]) for r in (changed if changed is not None else rows)]
+        with conn:
+            if changed is None:
+                conn.execute("DELETE FROM alerts")
+            conn.executemany(sql, data)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get():
+    """The configured backend (created on first use)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = SQLiteStorage() if STORAGE_BACKEND == "sqlite" else CSVStorage()
+    return _storage
+
+
+def migrate_csv_to_sqlite(sqlite_path=SQLITE_PATH, data_dir=DATA_DIR):
+    """Copy users, surveys and alerts from the CSV files into SQLite (one shot)."""
+    src, dst = CSVStorage(data_dir), SQLiteStorage(sqlite_path)
+    conn = dst._conn()
+    if conn.execute("SELECT (SELECT COUNT(*) FROM users) + (SELECT COUNT(*) FROM surveys)").fetchone()[0]:
+        raise RuntimeError(f"{sqlite_path} already has data; refusing to migrate twice")
+    users = src.read_users()
+    dst.append_users(users)
+    batch, n_surveys = [], 0
+    for row in src.iter_surveys():
+        batch.append(row)
+        if len(batch) >= 10000:
+            dst.append_surveys(batch)
+            n_surveys += len(batch)
+            batch = []
+    dst.append_surveys(batch)
+    n_surveys += len(batch)
+    alerts = src.read_alerts()
+    dst.save_alerts(alerts)
+    return {"users": len(users), "surveys": n_surveys, "alerts": len(alerts), "path": str(sqlite_path)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("usage: python -m app.storage migrate [sqlite_path]")
+        sys.exit(1)
+    print(migrate_csv_to_sqlite(Path(sys.argv[2]) if len(sys.argv) > 2 else SQLITE_PATH))
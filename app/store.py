@@ -0,0 +1,234 @@
+"""
+store.py - Append-only stores for surveys and users.
+
+New surveys are appended instead of rewriting the whole table, and the next
+id is kept in memory. With the CSV backend the file stays a plain CSV with
+the same header, so pandas.read_csv and read_csv_rows keep working unchanged.
+
+Users are loaded once into hash indexes (username, email, id) that are
+reloaded only when the users table changes (see app.storage stamps); new
+users are appended.
+
+With several API workers (app.cluster) each commit hands its peers the
+position it left (next survey id, table stamps, new users), which they
+adopt instead of rescanning the tables (see adopt()).
+
+Both stores sit on top of the configured app.storage backend. Offline
+compaction of surveys.csv (sort by id, drop duplicated/broken rows):
+
+    python -m app.store compact
+"""
+
+import sys, threading
+
+from app import storage
+
+USER_FIELDS = storage.USER_FIELDS
+SURVEY_FIELDS = storage.SURVEY_FIELDS
+
+
+def _as_stamp(value):
+    # stamps cross app.cluster as JSON: CSV (mtime, size) pairs come back as lists
+    return tuple(value) if isinstance(value, list) else value
+
+
+class SurveyStore:
+    """Append-only writer for surveys.
+
+    The highest id is read once and then tracked in memory. If the table is
+    changed by someone else (its stamp differs from our last write) the id
+    is read again before the next append.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._next_id = None
+        self._stamp = None
+        self.last_append = None  # (next id, stamp) after our last append
+
+    @property
+    def backend(self):
+        return self._backend or storage.get()
+
+    def _sync(self):
+        stamp = self.backend.surveys_stamp()
+        if self._next_id is None or stamp != self._stamp:
+            self._next_id = self.backend.max_survey_id() + 1
+            self._stamp = stamp
+
+    def next_id(self):
+        with self._lock:
+            self._sync()
+            return self._next_id
+
+    def append(self, row):
+        """Assign the next id to `row`, append it and return the stored row."""
+        with self._lock:
+            self._sync()
+            row = {"id": self._next_id, **{k: v for k, v in row.items() if k != "id"}}
+            self.backend.append_surveys([row])
+            self._next_id += 1
+            self._stamp = self.backend.surveys_stamp()
+            self.last_append = (self._next_id, self._stamp)
+            return row
+
+    def append_many(self, rows):
+        """Assign a block of consecutive ids to `rows` and store them in one write."""
+        rows = list(rows)
+        if not rows:
+            return []
+        with self._lock:
+            self._sync()
+            start = self._next_id
+            rows = [{"id": start + i, **{k: v for k, v in r.items() if k != "id"}} for i, r in enumerate(rows)]
+            self.backend.append_surveys(rows)
+            self._next_id += len(rows)
+            self._stamp = self.backend.surveys_stamp()
+            self.last_append = (self._next_id, self._stamp)
+            return rows
+
+    def adopt(self, next_id, stamp):
+        """Take the position another API worker left after its commit (app.writer.replay).
+
+        It assigned ids under the cluster write lock from a synced position,
+        so its next id holds whatever we knew before; our next append does
+        not rescan the table unless it changes again outside the API.
+        """
+        with self._lock:
+            self._next_id, self._stamp = next_id, _as_stamp(stamp)
+
+    def compact(self):
+        """Rewrite the survey log sorted by id (CSV backend only)."""
+        with self._lock:
+            if not hasattr(self.backend, "compact_surveys"):
+                return {"rows": None, "dropped": 0, "message": f"nothing to compact for {self.backend.name}"}
+            result = self.backend.compact_surveys()
+            self._next_id = None
+            return result
+
+
+class UserDirectory:
+    """In-memory user index.
+
+    Lookups by lowercased username, lowercased email and id are O(1). The
+    indexes are rebuilt only when the users table's stamp differs from what
+    we last saw, so edits made outside the API are still picked up.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._loaded = False
+        self._by_username = {}  # lower(username) -> [rows], file order
+        self._by_email = {}     # lower(email) -> row
+        self._by_id = {}        # int id -> row
+        self._next_id = 1
+        self.last_append = None  # (stamp before, stamp after) of our last append
+
+    @property
+    def backend(self):
+        return self._backend or storage.get()
+
+    def _index(self, row):
+        self._by_username.setdefault(row.get("username", "").lower(), []).append(row)
+        self._by_email.setdefault(row.get("email", "").lower(), row)
+        try:
+            uid = int(row["id"])
+        except (KeyError, TypeError, ValueError):
+            return
+        self._by_id.setdefault(uid, row)
+        self._next_id = max(self._next_id, uid + 1)
+
+    def _sync(self):
+        stamp = self.backend.users_stamp()
+        if self._loaded and stamp == self._stamp:
+            return
+        self._by_username, self._by_email, self._by_id, self._next_id = {}, {}, {}, 1
+        for row in self.backend.read_users():
+            self._index(row)
+        self._stamp = stamp
+        self._loaded = True
+
+    def by_username(self, username):
+        """All rows whose username matches case-insensitively (usually 0 or 1)."""
+        with self._lock:
+            self._sync()
+            return list(self._by_username.get(username.lower(), []))
+
+    def by_email(self, email):
+        with self._lock:
+            self._sync()
+            return self._by_email.get(email.lower())
+
+    def by_id(self, user_id):
+        with self._lock:
+            self._sync()
+            return self._by_id.get(int(user_id))
+
+    def add(self, row):
+        """Assign an id to `row` and append it.
+
+        Raises ValueError('username') or ValueError('email') when either is
+        already registered (case-insensitive); the check and the append happen
+        under the same lock.
+        """
+        result = self.add_many([row])[0]
+        if isinstance(result, ValueError):
+            raise result
+        return result
+
+    def add_many(self, rows):
+        """add() for several rows with a single append.
+
+        Returns one entry per input row: the stored row, or the ValueError
+        that add() would have raised (duplicates within `rows` included).
+        """
+        with self._lock:
+            self._sync()
+            before = self._stamp
+            results, stored, names, emails = [], [], set(), set()
+            for row in rows:
+                name, email = row["username"].lower(), row["email"].lower()
+                if name in self._by_username or name in names:
+                    results.append(ValueError("username"))
+                elif email in self._by_email or email in emails:
+                    results.append(ValueError("email"))
+                else:
+                    row = {"id": self._next_id + len(stored), **{k: v for k, v in row.items() if k != "id"}}
+                    names.add(name)
+                    emails.add(email)
+                    stored.append(row)
+                    results.append(row)
+            if stored:
+                self.backend.append_users(stored)
+                for row in stored:
+                    self._index({k: str(v) for k, v in row.items()})
+                self._stamp = self.backend.users_stamp()
+                self.last_append = (before, self._stamp)
+            return results
+
+    def adopt(self, rows, before, after):
+        """Index users another API worker just registered (app.writer.replay).
+
+        Only if our index was current right before that commit (our stamp is
+        its `before`); otherwise the next lookup reloads the table as usual.
+        """
+        with self._lock:
+            if not self._loaded or self._stamp != _as_stamp(before):
+                return
+            for row in rows:
+                self._index({k: str(v) for k, v in row.items()})
+            self._stamp = _as_stamp(after)
+
+
+surveys = SurveyStore()
+users = UserDirectory()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print("usage: python -m app.store compact")
+        sys.exit(1)
+    print(surveys.compact())
@@ -0,0 +1,522 @@
+"""
+table.py - Process-wide typed, columnar copy of the surveys table.
+
+Readers used to parse the surveys on every call (read_csv_rows string
+dicts for /stats, pandas.read_csv for risk, rollups and plots). The table
+is loaded once from the storage backend and kept as numpy columns:
+
+- id, user_id: int64; username: int32 code into one list of names
+- mood, mood_score, sleep_hours, appetite, concentration: float32, or
+  float64 for a column holding any value float32 cannot represent exactly
+- created_at: int64 epoch seconds (naive timestamps as they are, ones with
+  an offset converted to UTC)
+- notes: one UTF-8 blob, NUL-separated, with int64 offsets, decoded only
+  when asked for
+
+Rows are clustered by username with per-user start offsets, so
+view(username) hands out slices of the columns without copying. Surveys
+stored after the last merge sit in a small tail in id order; once it holds
+EMOTRACK_TABLE_TAIL rows (default 4096) it is merged into the clustered
+base with one stable sort by user.
+
+The writer appends every commit (add_many). When the surveys table's stamp
+differs from ours (edited by hand, compacted) the table is reloaded on
+next use, like app.rollups.
+
+frame() gives a DataFrame shaped like storage.read_surveys: file order,
+created_at as datetime64, NaN for blanks. Values that are not numbers are
+kept as the original strings, so analytics scores them as before.
+
+Memory for 1M synthetic surveys (python -m benchmarks.bench_table): about
+74 MiB (~77 bytes a row, notes included) against ~615 MiB as read_csv_rows
+string dicts and ~180 MiB as a read_csv DataFrame. Every API worker holds
+its own copy.
+
+    python -m app.table check   # compare with a fresh read of storage
+"""
+
+from datetime import datetime, timezone
+import os, threading
+
+from app import storage
+
+TAIL_ROWS = int(os.environ.get("EMOTRACK_TABLE_TAIL", 4096))
+SMALL_APPEND = 64  # commits up to this many rows are converted row by row instead of through pandas
+NUMERIC = ("mood","mood_score","sleep_hours","appetite","concentration")
+COLUMNS = ("id","user_id","username","created_at") + NUMERIC
+MISSING = -(2 ** 63)  # id/user_id/created_at that could not be read (NaN/NaT in frames)
+
+
+def _fit(values):
+    """float32 when every value survives the round trip, else the float64 values."""
+    import numpy as np
+    narrow = values.astype(np.float32)
+    return narrow if np.array_equal(narrow, values, equal_nan=True) else values
+
+
+def _ints(column):
+    import numpy as np, pandas as pd
+    if pd.api.types.is_integer_dtype(column):
+        return column.to_numpy(dtype=np.int64)
+    v = pd.to_numeric(column, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    out = np.full(len(v), MISSING, dtype=np.int64)
+    ok = ~np.isnan(v)
+    out[ok] = v[ok]
+    return out
+
+
+def _epochs(column):
+    """int64 epoch seconds of a column of timestamps or strings; MISSING where unreadable."""
+    import numpy as np, pandas as pd
+    if not pd.api.types.is_datetime64_any_dtype(column):
+        try:
+            # API rows: 'YYYY-MM-DDTHH:MM:SS', parsed by numpy in C
+            return np.array(column.tolist(), dtype="datetime64[s]").view(np.int64)
+        except (ValueError, TypeError):
+            column = pd.to_datetime(column, errors="coerce", utc=True, format="mixed")
+    if column.dt.tz is not None:
+        column = column.dt.tz_convert("UTC").dt.tz_localize(None)
+    return column.to_numpy(dtype="datetime64[s]").view(np.int64)
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            return MISSING
+
+
+def _epoch(value):
+    """_epochs for one value."""
+    import numpy as np, pandas as pd
+    try:
+        return int(np.datetime64(value, "s").view(np.int64))
+    except (ValueError, TypeError):
+        return int(_epochs(pd.Series([value], dtype=object))[0])
+
+
+def _number(value):
+    """(float, original string when it is not a number) for one value, like _floats."""
+    if value is None or value == "":
+        return float("nan"), None
+    try:
+        return float(value), None
+    except (TypeError, ValueError):
+        return float("nan"), str(value)
+
+
+def _floats(column):
+    """(float64 values, {row: original string} for values that are not numbers)."""
+    import numpy as np, pandas as pd
+    if column.dtype != object:
+        return column.to_numpy(dtype=float, na_value=np.nan), {}
+    v = pd.to_numeric(column, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    bad = np.isnan(v) & column.notna().to_numpy() & (column != "").to_numpy()
+    return v, {int(i): column.iat[i] for i in np.flatnonzero(bad)}
+
+
+def _to_frame_column(name, values):
+    import numpy as np
+    if name == "created_at":
+        return values.view("datetime64[s]").astype("datetime64[ns]")
+    if name in ("id", "user_id"):
+        missing = values == MISSING
+        if missing.any():
+            out = values.astype(float)
+            out[missing] = np.nan
+            return out
+        return values
+    return values.astype(np.float64)
+
+
+class _Base:
+    """Immutable clustered part of the table (replaced whole on merge/reload)."""
+    __slots__ = ("n", "cols", "pos", "order", "starts", "blob", "offsets")
+
+    def __init__(self, cols, pos, starts, blob, offsets):
+        import numpy as np
+        self.n = len(pos)
+        self.cols = cols        # name -> array in clustered order (username as int32 codes)
+        self.pos = pos          # clustered row -> file position
+        self.order = np.empty(self.n, dtype=np.int32)
+        self.order[pos] = np.arange(self.n, dtype=np.int32)  # file position -> clustered row
+        self.starts = starts    # code -> first clustered row (len = codes known at build + 1)
+        self.blob = blob        # notes in file order, each followed by NUL
+        self.offsets = offsets  # file position -> offset in blob (len n + 1)
+
+    def rows_of(self, code):
+        if code + 1 >= len(self.starts):
+            return 0, 0
+        return int(self.starts[code]), int(self.starts[code + 1])
+
+    def note(self, p):
+        return self.blob[self.offsets[p]:self.offsets[p + 1] - 1].decode("utf-8")
+
+
+class SurveyView:
+    """One user's surveys in id order.
+
+    view[name] gives numpy columns (created_at as epoch seconds); rows merged
+    into the table's base are slices of it, not copies.
+    """
+
+    def __init__(self, username, cols, notes, raw):
+        self.username = username
+        self.columns = cols      # name -> array; no 'username' column
+        self._notes = notes      # () -> list[str], decoded on first use
+        self._raw = raw          # name -> {row: original string}
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def notes(self):
+        if callable(self._notes):
+            self._notes = self._notes()
+        return self._notes
+
+    def frame(self, columns=None):
+        """DataFrame like storage.read_surveys(columns, usernames=[username])."""
+        import numpy as np, pandas as pd
+        wanted = list(columns) if columns is not None else list(storage.SURVEY_FIELDS)
+        data = {}
+        for c in wanted:
+            if c == "username":
+                data[c] = np.full(len(self), self.username, dtype=object)
+            elif c == "notes":
+                data[c] = _notes_column(self.notes())
+            elif c in self.columns:
+                data[c] = _with_raw(_to_frame_column(c, self.columns[c]), self._raw.get(c))
+        return pd.DataFrame(data, columns=[c for c in wanted if c in data])
+
+    def record(self, i):
+        """Row i as a surveys.csv row: every field as text, '' for blanks, numbers and
+        created_at (YYYY-MM-DDTHH:MM:SS, offsets in UTC) written as the API stores them."""
+        import math
+        def num(c):
+            raw = self._raw.get(c, {}).get(i)
+            v = float(self.columns[c][i])
+            return raw if raw is not None else "" if math.isnan(v) else str(int(v)) if v.is_integer() and c != "sleep_hours" else str(v)
+        ints = {c: (None if self.columns[c][i] == MISSING else int(self.columns[c][i])) for c in ("id", "user_id", "created_at")}
+        created = datetime.fromtimestamp(ints["created_at"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%S") if ints["created_at"] is not None else ""
+        row = {"id": "" if ints["id"] is None else str(ints["id"]), "user_id": "" if ints["user_id"] is None else str(ints["user_id"]), "username": self.username}
+        row.update((c, num(c)) for c in NUMERIC)
+        row.update(notes=self.notes()[i], created_at=created)
+        return {c: row[c] for c in storage.SURVEY_FIELDS}
+
+    def latest(self, n):
+        """The n most recent surveys as record() rows: created_at descending, ties in id
+        order and unreadable dates last (the order of sorting the CSV strings, reversed)."""
+        import numpy as np
+        created = self.columns["created_at"]
+        # descending stable sort: sort the reversed column ascending, then read it backwards
+        idx = (len(created) - 1 - np.argsort(created[::-1], kind="stable")[::-1])[:n]
+        return [self.record(int(i)) for i in idx]
+
+
+def _notes_column(notes):
+    import numpy as np
+    out = np.array(notes, dtype=object)
+    out[out == ""] = np.nan  # read_csv reads a blank note as NaN
+    return out
+
+
+def _with_raw(values, raw):
+    if not raw:
+        return values
+    out = values.astype(object)
+    for row, text in raw.items():
+        out[row] = text
+    return out
+
+
+class SurveyTable:
+    def __init__(self, backend=None, tail_rows=TAIL_ROWS):
+        self._backend = backend
+        self.tail_rows = tail_rows
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._stamp = None
+        self._names, self._codes = [], {}  # code -> username, username -> code
+        self._base = None
+        self._tail = {}          # name -> float64/int64 arrays with spare capacity
+        self._tail_n = 0
+        self._tail_notes = []
+        self._tail_rows = {}     # code -> [tail rows]
+        self._raw = {}           # name -> {survey id: original string} for values that are not numbers
+        self._last_id = None
+        self.loads = self.merges = 0
+
+    @property
+    def backend(self):
+        return self._backend or storage.get()
+
+    # building
+
+    def _code(self, username):
+        code = self._codes.get(username)
+        if code is None:
+            code = self._codes[username] = len(self._names)
+            self._names.append(username)
+        return code
+
+    def _load(self):
+        import numpy as np, pandas as pd
+        self._stamp = self.backend.surveys_stamp()
+        self._names, self._codes, self._raw, self._last_id = [], {}, {}, None
+        self._reset_tail()
+        df = self.backend.read_surveys()
+        for c in storage.SURVEY_FIELDS:
+            if c not in df.columns:
+                df[c] = np.nan
+        names, uniques = pd.factorize(df["username"])  # -1 for a missing username
+        for name in uniques:
+            self._code(str(name))
+        ids = _ints(df["id"])
+        cols = {"id": ids, "user_id": _ints(df["user_id"]), "username": names.astype(np.int32), "created_at": _epochs(df["created_at"])}
+        for c in NUMERIC:
+            values, raw = _floats(df[c])
+            cols[c] = values
+            if raw:
+                self._raw[c] = {int(ids[row]): text for row, text in raw.items()}
+        notes = ["" if not isinstance(v, str) else v.replace("\0", " ") for v in df["notes"].tolist()]
+        self._base = self._cluster(cols, np.arange(len(df), dtype=np.int32), *self._encode(notes))
+        if len(df) and ids[-1] != MISSING:
+            self._last_id = int(ids[-1])
+        self._loaded = True
+        self.loads += 1
+
+    @staticmethod
+    def _encode(notes, blob=b"", offsets=None):
+        """(blob, offsets) with `notes` (no NULs inside) appended; offsets come from one scan for the separators."""
+        import numpy as np
+        data = ("\0".join(notes) + "\0").encode("utf-8") if notes else b""
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0) + 1 + len(blob)
+        return blob + data, np.concatenate((offsets if offsets is not None else [0], ends)).astype(np.int64)
+
+    def _cluster(self, cols, pos, blob, offsets):
+        """Base with rows grouped by username code (NaN usernames first), file order inside each user."""
+        import numpy as np
+        perm = np.argsort(cols["username"], kind="stable")
+        clustered = {c: (v[perm] if c in ("id", "user_id", "created_at", "username") else _fit(v[perm])) for c, v in cols.items()}
+        codes = clustered["username"]
+        starts = np.searchsorted(codes, np.arange(len(self._names) + 1)).astype(np.int64)
+        return _Base(clustered, pos[perm], starts, blob, offsets)
+
+    def _reset_tail(self):
+        import numpy as np
+        size = max(16, min(self.tail_rows, 256))
+        self._tail = {c: np.empty(size, dtype=np.float64 if c in NUMERIC else np.int32 if c == "username" else np.int64) for c in COLUMNS}
+        self._tail_n, self._tail_notes, self._tail_rows = 0, [], {}
+
+    def _merge(self):
+        import numpy as np
+        b, n = self._base, self._tail_n
+        cols = {}
+        for c in COLUMNS:
+            # back to file order, then append the tail
+            cols[c] = np.concatenate((b.cols[c][b.order].astype(self._tail[c].dtype), self._tail[c][:n]))
+        blob, offsets = self._encode(self._tail_notes, b.blob, b.offsets)
+        self._base = self._cluster(cols, np.arange(b.n + n, dtype=np.int32), blob, offsets)
+        self._reset_tail()
+        self.merges += 1
+
+    def _append(self, rows):
+        import numpy as np, pandas as pd
+        n, k = self._tail_n, len(rows)
+        if n + k > len(self._tail["id"]):
+            size = max(2 * len(self._tail["id"]), n + k)
+            for c, v in self._tail.items():
+                grown = np.empty(size, dtype=v.dtype)
+                grown[:n] = v[:n]
+                self._tail[c] = grown
+        tail = self._tail
+        if k <= SMALL_APPEND:
+            for i, r in enumerate(rows):
+                tail["id"][n + i] = sid = _int(r.get("id"))
+                tail["user_id"][n + i] = _int(r.get("user_id"))
+                tail["created_at"][n + i] = _epoch(r.get("created_at"))
+                for c in NUMERIC:
+                    tail[c][n + i], raw = _number(r.get(c))
+                    if raw is not None:
+                        self._raw.setdefault(c, {})[sid] = raw
+        else:
+            df = pd.DataFrame(rows)
+            for c in storage.SURVEY_FIELDS:
+                if c not in df.columns:
+                    df[c] = np.nan
+            ids = _ints(df["id"])
+            tail["id"][n:n + k] = ids
+            tail["user_id"][n:n + k] = _ints(df["user_id"])
+            tail["created_at"][n:n + k] = _epochs(df["created_at"].astype(object))
+            for c in NUMERIC:
+                values, raw = _floats(df[c])
+                tail[c][n:n + k] = values
+                if raw:
+                    self._raw.setdefault(c, {}).update((int(ids[row]), text) for row, text in raw.items())
+        for i, r in enumerate(rows):
+            code = self._code(str(r["username"]))
+            self._tail["username"][n + i] = code
+            self._tail_rows.setdefault(code, []).append(n + i)
+            note = r.get("notes")
+            self._tail_notes.append(note.replace("\0", " ") if isinstance(note, str) else "")
+        self._tail_n = n + k
+        if self._tail_n >= self.tail_rows:
+            self._merge()
+
+    def _ensure(self):
+        if not self._loaded or self.backend.surveys_stamp() != self._stamp:
+            self._load()
+
+    # writing side
+
+    def add_many(self, rows):
+        """Append freshly stored surveys (consecutive ids), or reload when they do not follow ours."""
+        if not rows:
+            return
+        with self._lock:
+            first, last = int(rows[0]["id"]), int(rows[-1]["id"])
+            if self._loaded and self._last_id is not None and last <= self._last_id:
+                return  # already read from storage
+            if not self._loaded or self._last_id is None or first != self._last_id + 1 or last != first + len(rows) - 1:
+                self._load()
+                return
+            self._append(rows)
+            self._last_id = last
+            self._stamp = self.backend.surveys_stamp()
+
+    def invalidate(self):
+        """Reload from storage on next use."""
+        with self._lock:
+            self._loaded = False
+
+    # reading side
+
+    def view(self, username):
+        """SurveyView of one user's surveys (exact username)."""
+        import numpy as np
+        with self._lock:
+            self._ensure()
+            b, code = self._base, self._codes.get(username)
+            tail = list(self._tail_rows.get(code, ())) if code is not None else []
+            tail_cols = {c: v[tail] for c, v in self._tail.items() if c != "username"} if tail else None
+            tail_notes = [self._tail_notes[i] for i in tail]
+            raw = {c: dict(m) for c, m in self._raw.items()}
+        s, e = b.rows_of(code) if code is not None else (0, 0)
+        cols = {c: b.cols[c][s:e] for c in COLUMNS if c != "username"}
+        if tail_cols is not None:
+            cols = {c: np.concatenate((v.astype(tail_cols[c].dtype), tail_cols[c])) for c, v in cols.items()}
+        positions = b.pos[s:e]
+        notes = lambda: [b.note(p) for p in positions.tolist()] + tail_notes
+        rows_raw = {}
+        if raw:
+            index = {int(i): r for r, i in enumerate(cols["id"].tolist())}
+            rows_raw = {c: {index[i]: text for i, text in m.items() if i in index} for c, m in raw.items()}
+        return SurveyView(username, cols, notes, rows_raw)
+
+    def frame(self, columns=None, usernames=None):
+        """All surveys (or those of `usernames`) as a DataFrame shaped like storage.read_surveys."""
+        import numpy as np, pandas as pd
+        wanted = list(columns) if columns is not None else list(storage.SURVEY_FIELDS)
+        if usernames is not None:
+            frames = [self.view(u).frame(wanted) for u in dict.fromkeys(usernames)]
+            return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        with self._lock:
+            self._ensure()
+            b, n = self._base, self._tail_n
+            tail = {c: v[:n] for c, v in self._tail.items()}
+            tail_notes = self._tail_notes[:n]
+            names = np.array(self._names + [np.nan], dtype=object)  # code -1 (no username) -> NaN
+            raw = {c: dict(m) for c, m in self._raw.items()}
+        data = {}
+        for c in wanted:
+            if c == "notes":
+                data[c] = _notes_column(b.blob.decode("utf-8").split("\0")[:-1] + tail_notes)
+            elif c in COLUMNS:
+                values = np.concatenate((b.cols[c][b.order].astype(tail[c].dtype), tail[c]))
+                data[c] = names[values] if c == "username" else _to_frame_column(c, values)
+        if raw and any(c in data for c in raw):
+            ids = np.concatenate((b.cols["id"][b.order], tail["id"]))
+            for c, m in raw.items():
+                if c in data:
+                    rows = np.flatnonzero(np.isin(ids, list(m)))
+                    data[c] = _with_raw(data[c], {int(r): m[int(ids[r])] for r in rows})
+        return pd.DataFrame(data, columns=[c for c in wanted if c in data])
+
+    def __len__(self):
+        with self._lock:
+            self._ensure()
+            return self._base.n + self._tail_n
+
+    def nbytes(self):
+        """Bytes held by the columns, indexes and notes (not counting the name list)."""
+        with self._lock:
+            if not self._loaded:
+                return 0
+            b = self._base
+            arrays = list(b.cols.values()) + [b.pos, b.order, b.starts, b.offsets] + list(self._tail.values())
+            return sum(a.nbytes for a in arrays) + len(b.blob)
+
+    def stats(self):
+        with self._lock:
+            loaded = self._loaded
+            rows = self._base.n + self._tail_n if loaded else 0
+            out = {"loaded": loaded, "rows": rows, "users": len(self._names), "tail": self._tail_n, "loads": self.loads, "merges": self.merges}
+        out["bytes"] = self.nbytes()
+        return out
+
+
+surveys = SurveyTable()
+
+
+def _numbers_or_text(column):
+    import pandas as pd
+    numbers = pd.to_numeric(column, errors="coerce")
+    return numbers.astype(object).where(numbers.notna(), column)
+
+
+def check(survey_table=None):
+    """Compare the table's frame() with a fresh storage.read_surveys(); mismatch descriptions."""
+    import pandas as pd
+    t = survey_table or surveys
+    t.invalidate()
+    mine = t.frame()
+    stored = t.backend.read_surveys()
+    problems = [] if len(mine) == len(stored) else [f"rows: table={len(mine)} storage={len(stored)}"]
+    for c in storage.SURVEY_FIELDS:
+        if problems or c not in stored.columns:
+            break
+        a, b = mine[c].reset_index(drop=True), stored[c].reset_index(drop=True)
+        if c == "created_at":
+            b = pd.to_datetime(b, errors="coerce")
+        elif c == "notes":
+            b = b.where(b.notna() & (b != ""), None).astype(object)
+            a = a.where(a.notna(), None)
+        elif b.dtype != object:
+            a, b = pd.to_numeric(a, errors="coerce"), b.astype(float)
+        elif c in NUMERIC:
+            a, b = _numbers_or_text(a), _numbers_or_text(b)  # read_csv keeps a column with any text as strings
+        same = (a == b) | (a.isna() & b.isna())
+        if not same.all():
+            i = int((~same).to_numpy().nonzero()[0][0])
+            problems.append(f"{c}: {int((~same).sum())} rows differ, first at row {i}: table={a.iat[i]!r} storage={b.iat[i]!r}")
+    return problems
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2 or sys.argv[1] not in ("check", "stats"):
+        print("usage: python -m app.table check|stats")
+        sys.exit(1)
+    if sys.argv[1] == "stats":
+        len(surveys)
+        print(surveys.stats())
+    else:
+        problems = check()
+        print("\n".join(problems) if problems else f"table and storage agree ({len(surveys)} surveys)")
+        sys.exit(1 if problems else 0)
@@ -5,35 +5,73 @@ Utilities for EmoTrack
 """
 
 from pathlib import Path
-import csv, time, os
+from collections import OrderedDict
+import csv, time, os, threading
 from jose import jwt
 from datetime import datetime, timedelta
 
+from app import metrics
+
 BASE = Path(__file__).resolve().parent.parent
-DATA_DIR = BASE / "data"
+DATA_DIR = Path(os.environ.get("EMOTRACK_DATA_DIR", BASE / "data"))
 USERS_CSV = DATA_DIR / "users.csv"
 
 # JWT config (change SECRET_KEY for production)
 SECRET_KEY = "change_this_secret_for_production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+TOKEN_CACHE_SIZE = int(os.environ.get("EMOTRACK_TOKEN_CACHE", 1024))  # verified tokens kept; 0 disables
 
 def read_csv_rows(path):
     rows = []
     if not Path(path).exists():
         return rows
+    t0 = time.perf_counter()
     with open(path, encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for r in reader:
             rows.append(r)
+        nbytes = os.fstat(f.fileno()).st_size
+    metrics.io("read", path, len(rows), nbytes, time.perf_counter() - t0)
     return rows
 
 def write_csv_rows(path, rows, fieldnames):
     os.makedirs(Path(path).parent, exist_ok=True)
+    rows = rows if isinstance(rows, list) else list(rows)
+    t0 = time.perf_counter()
     with open(path, "w", encoding="utf-8", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(rows)
+        nbytes = f.tell()
+    metrics.io("write", path, len(rows), nbytes, time.perf_counter() - t0)
+
+def append_csv_rows(path, rows, fieldnames):
+    """Append rows to a CSV file without rewriting it.
+
+    Writes the header when the file is new or empty and repairs a missing
+    trailing newline left by manual edits, so appended rows never merge
+    with the last existing line.
+    """
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    rows = rows if isinstance(rows, list) else list(rows)
+    t0 = time.perf_counter()
+    size = path.stat().st_size if path.exists() else 0
+    needs_newline = False
+    if size:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) not in (b"\n", b"\r")
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        if needs_newline:
+            f.write("\r\n")
+        if not size:
+            writer.writeheader()
+        writer.writerows(rows)
+        nbytes = f.tell() - size
+    metrics.io("append", path, len(rows), nbytes, time.perf_counter() - t0)
 
 def create_access_token(data: dict, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES):
     to_encode = data.copy()
@@ -52,6 +90,61 @@ def decode_access_token(token: str):
         return None
 
 
+class TokenCache:
+    """Bounded LRU of already-verified tokens.
+
+    A token is verified once with jwt.decode; its payload is then served from
+    memory until the token's own `exp`, so an expired token is never a hit.
+    Tokens that fail verification or carry no numeric exp are not cached.
+    """
+
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # token -> (exp, payload)
+        self.hits = self.misses = self.expired = self.evictions = 0
+        self.decode_seconds = 0.0
+
+    def decode(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                if now < entry[0]:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[token]
+                self.expired += 1
+            self.misses += 1
+        t0 = time.perf_counter()
+        payload = decode_access_token(token)
+        elapsed = time.perf_counter() - t0
+        metrics.record("auth.decode", elapsed)
+        exp = payload.get("exp") if payload else None
+        with self._lock:
+            self.decode_seconds += elapsed
+            if self.max_entries > 0 and isinstance(exp, (int, float)) and now < exp:
+                self._entries[token] = (exp, payload)
+                self._entries.move_to_end(token)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"enabled": self.max_entries > 0, "entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses, "expired": self.expired, "evictions": self.evictions, "hit_rate": round(self.hits / lookups, 4) if lookups else None, "decodes": self.misses, "avg_decode_ms": round(self.decode_seconds / self.misses * 1000, 4) if self.misses else None}
+
+
+token_cache = TokenCache()
+
+
 def get_user_from_token(authorization: str | None):
     """Extract user metadata from an Authorization header or raw token.
 
@@ -67,7 +160,7 @@ def get_user_from_token(authorization: str | None):
         token = authorization.split(" ", 1)[1]
     else:
         token = authorization
-    payload = decode_access_token(token)
+    payload = token_cache.decode(token)
     if not payload:
         return None
     try:
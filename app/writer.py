@@ -0,0 +1,261 @@
+"""
+writer.py - Single-writer group commit for every mutation.
+
+Registrations and surveys (single or bulk) are queued to one writer
+thread. It takes whatever arrives within EMOTRACK_GROUP_COMMIT_MS of the
+first request (up to EMOTRACK_GROUP_COMMIT_MAX requests) and commits the
+group together:
+
+1. users: one duplicate check and one append for all new accounts;
+   surveys: one block of consecutive ids and one append;
+2. one fsync (backend.sync) so the group is durable;
+3. derived state updated once, in id order: survey table, daily rollup,
+   risk engine (affected users only), plot cache versions, live events;
+4. each caller's future resolved with its own stored rows (or its error).
+
+If the commit machinery itself fails (cluster lock, version counter,
+announcement), requests without an outcome fail with Unavailable and the
+thread carries on. Callers wait through wait(), bounded by
+EMOTRACK_WRITE_TIMEOUT seconds (default 30); the API answers 503 either way.
+
+Ids come from a single thread, so they are strictly increasing, and a
+caller only gets an answer once its rows are on disk.
+
+With several API workers (app.cluster) each commit holds the cross-worker
+write lock, and its surveys and new users are announced to the other
+workers, which replay steps 3 (without writing alerts) through replay()
+and take over the commit's store position (next survey id, table stamps)
+so their next write does not rescan storage.
+"""
+
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import os, queue, threading, time
+
+from app import store, cache, rollups, risk, events, metrics, cluster, table
+
+GROUP_COMMIT_MS = float(os.environ.get("EMOTRACK_GROUP_COMMIT_MS", 2))
+GROUP_COMMIT_MAX = int(os.environ.get("EMOTRACK_GROUP_COMMIT_MAX", 1000))
+WRITE_TIMEOUT = float(os.environ.get("EMOTRACK_WRITE_TIMEOUT", 30))
+
+
+class Unavailable(Exception):
+    """The write could not be committed now: the commit machinery failed, or no answer within WRITE_TIMEOUT."""
+
+
+def wait(future, timeout=None):
+    """future.result(), giving up after `timeout` seconds (default WRITE_TIMEOUT) with Unavailable.
+
+    A write given up on may still be committed later.
+    """
+    try:
+        return future.result(WRITE_TIMEOUT if timeout is None else timeout)
+    except FutureTimeout:
+        raise Unavailable("no answer from the writer") from None
+
+
+class _Request:
+    __slots__ = ("kind", "rows", "bulk", "future")
+
+    def __init__(self, kind, rows, bulk=False):
+        self.kind = kind
+        self.rows = rows
+        self.bulk = bulk
+        self.future = Future()
+
+
+class GroupWriter:
+    def __init__(self, window_ms=GROUP_COMMIT_MS, max_group=GROUP_COMMIT_MAX, surveys=None, users=None, engine=None, rollup=None, survey_table=None):
+        self.window = window_ms / 1000
+        self.max_group = max_group
+        self._surveys = surveys or store.surveys
+        self._users = users or store.users
+        self._engine = engine or risk.engine
+        self._rollup = rollup or rollups.daily_mood
+        self._table = survey_table or table.surveys
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.groups = self.requests = self.rows = self.failures = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="group-writer", daemon=True)
+                    self._thread.start()
+
+    def _submit(self, kind, rows, bulk=False):
+        req = _Request(kind, rows, bulk)
+        self._ensure_thread()
+        self._queue.put(req)
+        return req.future
+
+    def add_surveys(self, rows, bulk=False):
+        """Future resolving to the stored rows (ids assigned) once durable."""
+        return self._submit("surveys", list(rows), bulk)
+
+    def add_user(self, row):
+        """Future resolving to the stored user row, or failing with ValueError('username'|'email')."""
+        return self._submit("users", [row])
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            group, stop = [first], False
+            deadline = time.monotonic() + self.window
+            while len(group) < self.max_group:
+                remaining = deadline - time.monotonic()
+                try:
+                    req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if req is None:
+                    stop = True
+                    break
+                group.append(req)
+            self._commit(group)
+            if stop:
+                return
+
+    def _commit(self, group):
+        results = {}
+        try:
+            self._apply(group, results)
+        except Exception as e:
+            # cluster lock, version counter or announcement failed: requests
+            # without an outcome get the error; rows already durable are kept
+            self.failures += 1
+            err = Unavailable(f"commit failed: {e}")
+            err.__cause__ = e
+            for req in group:
+                results.setdefault(id(req), err)
+            stored = [r for req in group if req.kind == "surveys" and not isinstance(results[id(req)], Exception) for r in results[id(req)]]
+            if stored:
+                # durable but maybe not derived here: rebuild from storage
+                self._table.invalidate()
+                self._engine.invalidate()
+                self._rollup.invalidate()
+                for username in {r["username"] for r in stored}:
+                    cache.plots.bump(username)
+        self.groups += 1
+        self.requests += len(group)
+        self.rows += sum(len(r.rows) for r in group)
+        for req in group:
+            res = results[id(req)]
+            if req.future.cancelled():
+                continue
+            if isinstance(res, Exception):
+                req.future.set_exception(res)
+            else:
+                req.future.set_result(res)
+
+    def _apply(self, group, results):
+        """Commit one group, filling results (id(request) -> stored rows or error)."""
+        user_reqs = [r for r in group if r.kind == "users"]
+        survey_reqs = [r for r in group if r.kind == "surveys"]
+        stored, registered, tables = [], [], []
+        with cluster.node.lock():
+            if user_reqs:
+                try:
+                    for req, res in zip(user_reqs, self._users.add_many([r.rows[0] for r in user_reqs])):
+                        results[id(req)] = res
+                    registered = [res for res in results.values() if not isinstance(res, Exception)]
+                    tables.append("users")
+                except Exception as e:
+                    results.update((id(r), e) for r in user_reqs)
+            if survey_reqs:
+                try:
+                    stored = self._surveys.append_many([row for r in survey_reqs for row in r.rows])
+                    i = 0
+                    for req in survey_reqs:
+                        results[id(req)] = stored[i:i + len(req.rows)]
+                        i += len(req.rows)
+                    tables.append("surveys")
+                except Exception as e:
+                    results.update((id(r), e) for r in survey_reqs)
+            if tables:
+                try:
+                    with metrics.stage("writer.fsync"):
+                        self._surveys.backend.sync(tables)
+                except Exception as e:
+                    results.update((k, e) for k in list(results))
+                    stored, registered = [], []
+            if stored or registered:
+                groups = [(req.bulk, results[id(req)]) for req in survey_reqs] if stored else []
+                version = cluster.node.advance()
+                if stored:
+                    with metrics.stage("writer.derive"):
+                        self._derive(groups, stored)
+                cluster.node.announce(version, groups, registered, self._position(stored, registered))
+
+    def _derive(self, groups, stored, persist=True):
+        # the survey table first: rollup and risk rebuilds read from it
+        try:
+            self._table.add_many(stored)
+        except Exception:
+            self._table.invalidate()
+        try:
+            self._rollup.add_many(stored)
+        except Exception:
+            pass
+        # rows come in id order: the last one of each user is their newest survey
+        for username, newest in {r["username"]: int(r["id"]) for r in stored}.items():
+            cache.plots.bump(username, newest)
+        for bulk, rows in groups:
+            if bulk:
+                for (user_id, username), n in Counter((r["user_id"], r["username"]) for r in rows).items():
+                    events.hub.publish(events.surveys_imported(user_id, username, n))
+            else:
+                for r in rows:
+                    events.hub.publish(events.survey_created(r))
+        # after the survey events, so risk_changed follows the survey that caused it
+        try:
+            self._engine.add_many(stored, persist=persist)
+        except Exception:
+            pass
+
+    def _position(self, stored, registered):
+        """The stores' state after this commit, for peers to adopt (see replay)."""
+        state = {}
+        if stored and self._surveys.last_append:
+            state["surveys"] = self._surveys.last_append
+        if registered and self._users.last_append:
+            state["users"] = self._users.last_append
+        return state
+
+    def replay(self, groups, version, users=(), state=None):
+        """app.cluster listener: apply a commit made by another worker.
+
+        groups=None means commits were missed: derived state is dropped and
+        rebuilt from storage, and /ws clients are told to refetch.
+        """
+        if groups is None:
+            self._table.invalidate()
+            self._engine.invalidate()
+            self._rollup.invalidate()
+            cache.plots.rebase(cluster.node.token)
+            events.hub.publish(events.resync())
+            return
+        state = state or {}
+        if users and "users" in state:
+            self._users.adopt(users, *state["users"])
+        if "surveys" in state:
+            self._surveys.adopt(*state["surveys"])
+        if groups:
+            with metrics.stage("writer.replay"):
+                self._derive(groups, [r for _, rows in groups for r in rows], persist=False)
+
+    def stats(self):
+        return {"groups": self.groups, "requests": self.requests, "rows": self.rows, "failures": self.failures, "avg_group": round(self.requests / self.groups, 2) if self.groups else None, "queued": self._queue.qsize()}
+
+    def stop(self, timeout=5):
+        """Commit what is queued, then stop the thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+commits = GroupWriter()
@@ -0,0 +1,53 @@
+"""
+bench_auth.py - Per-request auth overhead with and without the token cache.
+
+Times get_user_from_token on its own and a full GET /me round trip through
+TestClient (dependency included), first with the verified-token cache
+disabled (every call runs jwt.decode) and then enabled.
+
+    python -m benchmarks.bench_auth [--calls 20000] [--requests 2000]
+"""
+
+import argparse, statistics, time
+
+from fastapi.testclient import TestClient
+
+from app import utils
+from app.api import app
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    header = "Bearer " + utils.create_access_token({"user_id": 1, "username": "bench", "role": "user"})
+    client = TestClient(app)
+    cache = utils.token_cache
+    size = cache.max_entries
+
+    print(f"{'':>30} {'p50 us':>9} {'p99 us':>9}")
+    for label, entries in (("cache off", 0), ("cache on", size or 1024)):
+        cache.max_entries = entries
+        cache.clear()
+        p50, p99 = timed(lambda: utils.get_user_from_token(header), args.calls)
+        print(f"{'get_user_from_token ' + label:>30} {p50:>9.1f} {p99:>9.1f}")
+        p50, p99 = timed(lambda: client.get("/me", headers={"Authorization": header}), args.requests)
+        print(f"{'GET /me ' + label:>30} {p50:>9.1f} {p99:>9.1f}")
+    cache.max_entries = size
+    print("cache stats:", cache.stats())
+
+
+if __name__ == "__main__":
+    main()
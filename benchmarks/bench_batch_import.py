@@ -0,0 +1,76 @@
+"""
+bench_batch_import.py - Bulk survey import vs one insert per row.
+
+Feeds synthetic rows through ingest.BatchImport's write path (one id block,
+one append, one risk update for the affected users) and through the
+per-row path POST /surveys uses, each against a fresh temporary CSV store.
+The risk tables of both runs are checked to be identical.
+
+    python -m benchmarks.bench_batch_import [--rows 100000] [--per-row-max 5000]
+"""
+
+import argparse, random, tempfile, time
+from pathlib import Path
+
+from app.risk import RiskEngine
+from app.rollups import DailyMoodRollup
+from app.storage import CSVStorage
+from app.store import SurveyStore
+from app.table import SurveyTable
+
+
+def synthetic_rows(n, users=200, seed=7):
+    rnd = random.Random(seed)
+    return [{"user_id": u, "username": f"user{u}", "mood": m, "mood_score": m * 10, "sleep_hours": round(rnd.uniform(3, 10), 1), "appetite": rnd.randint(0, 10), "concentration": "", "notes": rnd.choice(["", "triste", "bien"]), "created_at": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T{rnd.randint(0, 23):02d}:00:00"}
+            for u, m in ((rnd.randint(1, users), rnd.randint(1, 10)) for _ in range(n))]
+
+
+def components(tmp):
+    backend = CSVStorage(tmp)
+    table = SurveyTable(backend)
+    store, engine, rollup = SurveyStore(backend), RiskEngine(backend, table), DailyMoodRollup(backend, table)
+    engine.rebuild()
+    rollup.rebuild()
+    return store, table, engine, rollup
+
+
+def run_batch(tmp, rows):
+    store, table, engine, rollup = components(tmp)
+    t0 = time.perf_counter()
+    stored = store.append_many(rows)
+    table.add_many(stored)
+    rollup.add_many(stored)
+    engine.add_many(stored)
+    return time.perf_counter() - t0, engine.alerts()
+
+
+def run_per_row(tmp, rows):
+    store, table, engine, rollup = components(tmp)
+    t0 = time.perf_counter()
+    for row in rows:
+        stored = store.append(row)
+        table.add_many([stored])
+        rollup.add(stored)
+        engine.add(stored)
+    return time.perf_counter() - t0, engine.alerts()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--per-row-max", type=int, default=5000, help="rows timed on the per-row path (extrapolated)")
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows)
+    n = min(args.rows, args.per_row_max)
+    with tempfile.TemporaryDirectory() as a, tempfile.TemporaryDirectory() as b, tempfile.TemporaryDirectory() as c:
+        batch_s, _ = run_batch(Path(a), rows)
+        per_row_s, per_row_alerts = run_per_row(Path(b), rows[:n])
+        _, check_alerts = run_batch(Path(c), rows[:n])
+    print(f"batch:   {args.rows:>8} rows in {batch_s:.2f}s ({args.rows / batch_s:,.0f} rows/s)")
+    print(f"per-row: {n:>8} rows in {per_row_s:.2f}s ({n / per_row_s:,.0f} rows/s, ~{per_row_s * args.rows / n:.1f}s for {args.rows})")
+    print("risk tables identical:", per_row_alerts == check_alerts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+bench_composite.py - Columnar vs row-wise composite scoring.
+
+Times analytics.composite_scores against df.apply(compute_composite, axis=1)
+on synthetic survey frames and checks both give identical scores.
+
+    python -m benchmarks.bench_composite [--sizes 10000,100000,1000000]
+"""
+
+import argparse, time
+import numpy as np
+import pandas as pd
+
+from app import analytics
+
+NOTES = ["", "Muy triste hoy", "bien", "con estres", "ansiedad", "todo ok", None]
+
+
+def synthetic_frame(n, seed=42):
+    rng = np.random.default_rng(seed)
+    mood = rng.integers(1, 11, n)
+    mood_score = (mood * 10).astype(float)
+    mood_score[rng.random(n) < 0.1] = np.nan
+    sleep = np.round(rng.uniform(3, 11, n), 1)
+    sleep[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame({
+        "user_id": rng.integers(1, 1000, n),
+        "mood": mood,
+        "mood_score": mood_score,
+        "sleep_hours": sleep,
+        "appetite": rng.integers(0, 11, n),
+        "concentration": rng.integers(0, 11, n),
+        "notes": rng.choice(np.array(NOTES, dtype=object), n),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'row-wise s':>11} {'columnar s':>11} {'speedup':>8}  identical")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        df = synthetic_frame(n)
+        t0 = time.perf_counter()
+        rowwise = df.apply(analytics.compute_composite, axis=1)
+        t1 = time.perf_counter()
+        columnar = analytics.composite_scores(df)
+        t2 = time.perf_counter()
+        same = bool((rowwise == columnar).all())
+        print(f"{n:>9} {t1 - t0:>11.3f} {t2 - t1:>11.3f} {(t1 - t0) / (t2 - t1):>7.0f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
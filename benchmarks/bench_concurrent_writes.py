@@ -0,0 +1,129 @@
+"""
+bench_concurrent_writes.py - Concurrency stress test for survey/user writes.
+
+Many threads insert surveys (and race to register the same usernames)
+against a fresh temporary CSV store, through three paths:
+
+- legacy:   the original read-everything/rewrite-everything insert, no lock
+- per-call: locked append + fsync + risk update for every request
+- group:    app.writer.GroupWriter (group commit, one fsync per group)
+
+Afterwards the surveys file is checked for lost and duplicated rows and
+the users file for duplicated usernames. Legacy inserts that crash on a
+torn read are counted as failed calls. The exit status is 1 when the
+per-call or group path loses, duplicates or fails anything (the legacy path
+is expected to); tests/test_writer.py asserts the same for the group writer.
+
+    python -m benchmarks.bench_concurrent_writes [--threads 32] [--per-thread 50]
+"""
+
+import argparse, csv, sys, tempfile, threading, time
+from collections import Counter
+from pathlib import Path
+
+from app.risk import RiskEngine
+from app.rollups import DailyMoodRollup
+from app.storage import CSVStorage
+from app.store import SurveyStore, UserDirectory, SURVEY_FIELDS
+from app.table import SurveyTable
+from app.utils import read_csv_rows, write_csv_rows
+from app.writer import GroupWriter
+
+
+def survey(t, i):
+    return {"user_id": t + 1, "username": f"user{t}", "mood": i % 10 + 1, "mood_score": "", "sleep_hours": 7, "appetite": 5, "concentration": 5, "notes": f"t{t}-{i}", "created_at": "2025-11-05T19:06:09"}
+
+
+def user(t, i):
+    # every 5th registration collides with the same name from other threads
+    name = f"shared{i}" if i % 5 == 0 else f"u{t}-{i}"
+    return {"username": name, "email": f"{name}@x.com", "hashed_password": "pw", "role": "user", "created_at": "2025-11-05T19:06:09"}
+
+
+def legacy_insert(path, row):
+    rows = read_csv_rows(path)
+    next_id = max((int(r["id"]) for r in rows), default=0) + 1
+    rows.append({"id": next_id, **row})
+    write_csv_rows(path, rows, SURVEY_FIELDS)
+
+
+def run(mode, tmp, threads, per_thread):
+    backend = CSVStorage(tmp)
+    surveys, users = SurveyStore(backend), UserDirectory(backend)
+    table = SurveyTable(backend)
+    engine, rollup = RiskEngine(backend, table), DailyMoodRollup(backend, table)
+    group = GroupWriter(surveys=surveys, users=users, engine=engine, rollup=rollup, survey_table=table)
+    failed = Counter()
+
+    def worker(t):
+        for i in range(per_thread):
+            row = survey(t, i)
+            if mode == "legacy":
+                try:
+                    legacy_insert(backend.surveys_csv, row)
+                except Exception:
+                    # torn read of a file another thread is rewriting
+                    failed[t] += 1
+                continue
+            if mode == "group":
+                group.add_surveys([row]).result()
+                try:
+                    group.add_user(user(t, i)).result()
+                except ValueError:
+                    pass
+            else:
+                stored = surveys.append(row)
+                backend.sync(["surveys"])
+                engine.add(stored)
+                try:
+                    users.add(user(t, i))
+                    backend.sync(["users"])
+                except ValueError:
+                    pass
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    elapsed = time.perf_counter() - t0
+    group.stop()
+
+    with open(backend.surveys_csv, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    expected = threads * per_thread
+    ids = Counter(r["id"] for r in rows)
+    tags = {r["notes"] for r in rows}
+    lost = sum(1 for t in range(threads) for i in range(per_thread) if f"t{t}-{i}" not in tags)
+    names = Counter(r["username"] for r in read_csv_rows(backend.users_csv))
+    return {
+        "mode": mode,
+        "surveys/s": round(expected / elapsed),
+        "rows": len(rows),
+        "lost": lost,
+        "failed_calls": sum(failed.values()),
+        "duplicate_ids": sum(n - 1 for n in ids.values() if n > 1),
+        "duplicate_users": sum(n - 1 for n in names.values() if n > 1),
+        "groups": group.stats()["groups"] if mode == "group" else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--per-thread", type=int, default=50)
+    parser.add_argument("--modes", default="legacy,per-call,group")
+    args = parser.parse_args()
+    broken = []
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run(mode, Path(tmp), args.threads, args.per_thread)
+        print(result)
+        if mode != "legacy" and any(result[k] for k in ("lost", "failed_calls", "duplicate_ids", "duplicate_users")):
+            broken.append(mode)
+    sys.exit(1 if broken else 0)
+
+
+if __name__ == "__main__":
+    main()
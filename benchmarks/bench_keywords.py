@@ -0,0 +1,99 @@
+"""
+bench_keywords.py - Notes screening: app.keywords against the previous keyword loop.
+
+Generates seeded Spanish-like notes (short and long, a share with accents
+and upper case) and times, over the same column:
+
+- legacy loop:      notes.lower() and `kw in text` for every keyword, per row
+                    (the old analytics.notes_penalty)
+- legacy contains:  Series.str.lower().str.contains(alternation)
+                    (the old analytics._notes_penalty)
+- screen.penalties: app.keywords over the column (what compute_risk does)
+
+It also counts the notes the legacy matcher misses because of accents or
+case ("estrés", "DEPRESIÓN").
+
+    python -m benchmarks.bench_keywords [--rows 100000] [--max-words 60] [--accented 0.3] [--repeat 3]
+"""
+
+import argparse, random, statistics, time
+
+from app import keywords
+
+LEGACY_KEYWORDS = ["mal","triste","estres","depres","ansiedad","angusti","suicid","suicida","no puedo"]
+WORDS = ("hoy fue un dia tranquilo con trabajo familia amigos me siento bien cansado dormi poco comi estudie "
+         "examen clase salir caminar lluvia sol musica ansiedad triste mal estres depresion no puedo angustia").split()
+ACCENTED = {"dia": "día", "dormi": "dormí", "comi": "comí", "estudie": "estudié", "musica": "música", "estres": "estrés",
+            "depresion": "depresión", "angustia": "angustía", "tranquilo": "TRANQUILO", "mal": "MAL"}
+
+
+def notes(rows, max_words, accented, seed):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(rows):
+        n = rnd.choice([0, 0, 2, 5, 10, max_words])
+        words = [rnd.choice(WORDS) for _ in range(n)]
+        if rnd.random() < accented:
+            words = [ACCENTED.get(w, w) for w in words]
+        out.append(" ".join(words) if n or rnd.random() < 0.5 else None)
+    return out
+
+
+def legacy_penalty(notes):
+    if not isinstance(notes, str):
+        return 0.0
+    text = notes.lower()
+    for kw in LEGACY_KEYWORDS:
+        if kw in text:
+            return 0.12
+    return 0.0
+
+
+def legacy_contains(series):
+    import numpy as np, re
+    pattern = "|".join(re.escape(kw) for kw in LEGACY_KEYWORDS)
+    return np.where(series.str.lower().str.contains(pattern, regex=True, na=False).to_numpy(dtype=bool), 0.12, 0.0)
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--max-words", type=int, default=60)
+    parser.add_argument("--accented", type=float, default=0.3, help="share of notes with accents/upper case")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import pandas as pd
+    values = notes(args.rows, args.max_words, args.accented, args.seed)
+    series = pd.Series(values, dtype=object)
+    screen = keywords.KeywordScreen(path="/nonexistent")  # built-in list, whatever data/ holds
+    screen.penalties(values[:10])
+
+    cases = [
+        ("legacy loop", lambda: [legacy_penalty(v) for v in values]),
+        ("legacy contains", lambda: legacy_contains(series)),
+        ("screen.penalties", lambda: screen.penalties(values)),
+    ]
+    print(f"{args.rows} notes, {sum(len(v) for v in values if v) / 1e6:.1f}M characters")
+    print(f"{'matcher':<18} {'ms':>9} {'rows/s':>12} {'flagged':>8}")
+    results = {}
+    for name, fn in cases:
+        seconds, result = timed(fn, args.repeat)
+        results[name] = list(result)
+        print(f"{name:<18} {seconds * 1000:>9.1f} {args.rows / seconds:>12,.0f} {sum(1 for p in result if p):>8}")
+    missed = sum(1 for old, new in zip(results["legacy loop"], results["screen.penalties"]) if new and not old)
+    print(f"flagged only after accent/case folding: {missed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+bench_startup.py - Worker startup cost: import time, resident memory, heavy modules.
+
+Each mode runs in a fresh interpreter:
+
+- lazy:     import app.api (what a uvicorn worker does)
+- data:     import app.api + analytics.prewarm(plots=False)  (EMOTRACK_PREWARM=data)
+- all:      import app.api + analytics.prewarm()             (EMOTRACK_PREWARM=all)
+
+and reports wall time, RSS and which of numpy/pandas/matplotlib/seaborn got
+loaded, followed by a `python -X importtime` breakdown of the slowest
+top-level imports of app.api. Exits with status 1 if the lazy import loads
+a heavy module or takes longer than --max-import-ms.
+
+    python -m benchmarks.bench_startup [--repeat 3] [--top 15] [--max-import-ms 0] [--out startup.json]
+"""
+
+import argparse, json, os, re, statistics, subprocess, sys
+
+PROBE = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import app.api
+t1 = time.perf_counter()
+mode = sys.argv[1]
+if mode != "lazy":
+    from app import analytics
+    analytics.prewarm(plots=mode == "all")
+t2 = time.perf_counter()
+from app.metrics import HEAVY_MODULES, rss_bytes
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "prewarm_ms": (t2 - t1) * 1000, "rss_kib": (rss_bytes() or 0) // 1024,
+                  "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "heavy": [m for m in HEAVY_MODULES if m in sys.modules]}))
+"""
+
+
+def env():
+    # plot workers are not started by a bare import; keep the child from inheriting a prewarm switch
+    e = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    e.pop("EMOTRACK_PREWARM", None)
+    return e
+
+
+def probe(mode, repeat):
+    runs = [json.loads(subprocess.run([sys.executable, "-c", PROBE, mode], capture_output=True, text=True, check=True, env=env()).stdout) for _ in range(repeat)]
+    med = lambda k: round(statistics.median(r[k] for r in runs), 1)
+    return {"mode": mode, "import_ms": med("import_ms"), "prewarm_ms": med("prewarm_ms"), "rss_kib": med("rss_kib"), "max_rss_kib": med("max_rss_kib"), "heavy": runs[-1]["heavy"]}
+
+
+def importtime(top):
+    """Slowest top-level imports of app.api by cumulative time (ms)."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.api"], capture_output=True, text=True, check=True, env=env()).stderr
+    rows = []
+    for line in err.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)", line)
+        if m and len(m.group(3)) <= 2:   # direct imports of the probe and of app.* modules
+            rows.append((int(m.group(2)) / 1000, m.group(4)))
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for ms, name in sorted(rows, reverse=True)[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-import-ms", type=float, default=0, help="fail if the lazy import is slower (0 = no limit)")
+    parser.add_argument("--out", help="write the report JSON here")
+    args = parser.parse_args()
+
+    modes = [probe(mode, args.repeat) for mode in ("lazy", "data", "all")]
+    print(f"{'mode':<6} {'import ms':>10} {'prewarm ms':>11} {'RSS MiB':>8}  heavy modules")
+    for r in modes:
+        print(f"{r['mode']:<6} {r['import_ms']:>10.1f} {r['prewarm_ms']:>11.1f} {r['rss_kib'] / 1024:>8.1f}  {', '.join(r['heavy']) or '-'}")
+    breakdown = importtime(args.top)
+    print("\nslowest imports under `import app.api` (cumulative ms):")
+    for r in breakdown:
+        print(f"  {r['cumulative_ms']:>8.1f}  {r['module']}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"modes": modes, "importtime": breakdown}, f, indent=2)
+
+    lazy = modes[0]
+    problems = [f"import app.api loaded {', '.join(lazy['heavy'])}"] if lazy["heavy"] else []
+    if args.max_import_ms and lazy["import_ms"] > args.max_import_ms:
+        problems.append(f"import app.api took {lazy['import_ms']} ms (limit {args.max_import_ms})")
+    for p in problems:
+        print("REGRESSION", p)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
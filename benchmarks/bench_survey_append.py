@@ -0,0 +1,74 @@
+"""
+bench_survey_append.py - Insert latency of the append-only survey log.
+
+Builds temporary surveys CSVs of growing size and times SurveyStore.append
+against the old read-everything/rewrite-everything path. Append latency
+should stay flat from 1k to 1M rows.
+
+    python -m benchmarks.bench_survey_append [--sizes 1000,10000,100000,1000000]
+"""
+
+import argparse, statistics, tempfile, time
+from pathlib import Path
+
+from app.storage import CSVStorage
+from app.store import SurveyStore, SURVEY_FIELDS
+from app.utils import read_csv_rows, write_csv_rows
+
+ROW = {"user_id": 1, "username": "bench", "mood": 6, "mood_score": 60, "sleep_hours": 7.0, "appetite": 6, "concentration": 6, "notes": "", "created_at": "2025-11-05T19:06:09"}
+
+
+def build_csv(path, n):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(SURVEY_FIELDS) + "\r\n")
+        for i in range(1, n + 1):
+            f.write(f"{i},{i % 1000 + 1},user{i % 1000 + 1},6,60,7.0,6,6,,2025-11-05T19:06:09\r\n")
+
+
+def time_append(path, inserts):
+    store = SurveyStore(CSVStorage(path.parent))
+    store.next_id()  # one-time id scan, not part of the per-insert cost
+    samples = []
+    for _ in range(inserts):
+        t0 = time.perf_counter()
+        store.append(ROW)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def time_rewrite(path, inserts):
+    samples = []
+    for _ in range(inserts):
+        t0 = time.perf_counter()
+        rows = read_csv_rows(path)
+        next_id = max(int(r["id"]) for r in rows) + 1 if rows else 1
+        rows.append(dict(ROW, id=next_id))
+        write_csv_rows(path, rows, SURVEY_FIELDS)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--inserts", type=int, default=200)
+    parser.add_argument("--rewrite-max", type=int, default=100000, help="skip the legacy path above this size")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'append p50 ms':>14} {'append p99 ms':>14} {'rewrite p50 ms':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in [int(x) for x in args.sizes.split(",")]:
+            (Path(tmp) / str(n)).mkdir()
+            path = Path(tmp) / str(n) / "surveys.csv"
+            build_csv(path, n)
+            app = sorted(time_append(path, args.inserts))
+            rewrite = "-"
+            if n <= args.rewrite_max:
+                build_csv(path, n)
+                rewrite = f"{statistics.median(time_rewrite(path, 5)) * 1000:.2f}"
+            p99 = app[min(len(app) - 1, int(len(app) * 0.99))]
+            print(f"{n:>9} {statistics.median(app) * 1000:>14.3f} {p99 * 1000:>14.3f} {rewrite:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+bench_table.py - Memory and read latency of the in-memory survey table (app.table).
+
+Generates a seeded synthetic dataset (benchmarks.synthetic) and compares
+three ways of holding every survey:
+
+- read_csv_rows:  list of string dicts (what /stats streamed before)
+- read_surveys:   pandas DataFrame (what compute_risk, rollups and plots parsed)
+- SurveyTable:    typed numpy columns clustered by user
+
+Memory is what each keeps alive after loading (tracemalloc; DataFrame:
+memory_usage(deep=True)), also scaled to 1M surveys. Latency: one user's
+/stats work (count, mean mood, 5 latest) from a table view against a
+streaming scan of the file, a user's plot frame, and the full frame
+against read_surveys.
+
+    python -m benchmarks.bench_table [--users 10000] [--surveys-per-user 100] [--seed 42] [--lookups 200]
+"""
+
+import argparse, gc, random, statistics, tempfile, time, tracemalloc
+from pathlib import Path
+
+from benchmarks.synthetic import generate, username
+
+
+def retained(load):
+    """(result, bytes allocated by load() and still alive)."""
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--surveys-per-user", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--lookups", type=int, default=200, help="users looked up for the per-user timings")
+    args = parser.parse_args()
+
+    from app.analytics import PLOT_COLUMNS
+    from app.storage import CSVStorage
+    from app.table import SurveyTable
+    from app.utils import read_csv_rows
+
+    with tempfile.TemporaryDirectory(prefix="emotrack-table-") as tmp:
+        generate(Path(tmp), args.users, args.surveys_per_user, args.seed)
+        backend = CSVStorage(tmp)
+        rnd = random.Random(args.seed)
+        names = [username(rnd.randint(2, args.users)) for _ in range(args.lookups)]
+
+        def load_table():
+            t = SurveyTable(backend)
+            len(t)  # loads
+            return t
+
+        # first, so the pandas import and parser caches are not charged to the table
+        df = backend.read_surveys()
+        df_bytes = int(df.memory_usage(deep=True).sum())
+        del df
+        t0 = time.perf_counter()
+        table, table_bytes = retained(load_table)
+        load_s = time.perf_counter() - t0
+        n = len(table)
+        rows, rows_bytes = retained(lambda: read_csv_rows(backend.surveys_csv))
+        del rows
+
+        print(f"{n} surveys, {args.users} users")
+        print(f"{'representation':<16} {'MiB':>9} {'bytes/row':>10} {'MiB per 1M':>11}")
+        for name, nbytes in (("read_csv_rows", rows_bytes), ("read_surveys", df_bytes), ("SurveyTable", table_bytes)):
+            print(f"{name:<16} {nbytes / 2**20:>9.1f} {nbytes / n:>10.0f} {nbytes / n * 1e6 / 2**20:>11.1f}")
+        print(f"  (table arrays and notes blob: {table.nbytes() / 2**20:.1f} MiB; loaded in {load_s:.2f}s under tracemalloc)")
+
+        def stats_view(name):
+            v = table.view(name)
+            moods = v["mood"]
+            return len(v), float(moods[moods == moods].sum()), v.latest(5)
+
+        def stats_scan(name):
+            import heapq
+            rows = list(backend.iter_surveys(usernames=[name]))
+            return len(rows), sum(float(r["mood"]) for r in rows), heapq.nlargest(5, rows, key=lambda r: r["created_at"])
+
+        cases = [
+            ("/stats user: view", lambda: [stats_view(u) for u in names], len(names)),
+            ("/stats user: file scan", lambda: [stats_scan(u) for u in names[:5]], 5),
+            ("plot rows: view.frame", lambda: [table.view(u).frame(PLOT_COLUMNS) for u in names], len(names)),
+            ("all rows: table.frame", lambda: table.frame(), 1),
+            ("all rows: read_surveys", lambda: backend.read_surveys(), 1),
+        ]
+        print(f"\n{'read':<24} {'ms/call':>9}")
+        for name, fn, calls in cases:
+            print(f"{name:<24} {timed(fn, 3) / calls:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+bench_workers.py - Throughput and consistency of the multi-worker mode (main.py --workers N).
+
+For every worker count a fresh synthetic dataset (benchmarks.synthetic) is
+served by `python main.py --workers N` on a free port with its own
+EMOTRACK_RUN_DIR. --clients load processes then run a request mix for
+--seconds:
+
+- GET /recommendations, GET /stats (user), GET /all-alerts?limit=50 (admin)
+- POST /surveys for --write-ratio of the requests
+
+Clients reconnect every 50 requests so the kernel spreads them over the
+workers. The report gives requests/s, p50/p95 latency and the speed-up
+over the first worker count. Afterwards every run is checked:
+
+- each acknowledged survey is stored exactly once, ids are unique;
+- alerts.csv, written incrementally by whichever worker committed last,
+  matches a batch recompute (analytics.compute_risk);
+- with the `websockets` package installed, --ws admin /ws clients (spread
+  over the workers) each received the survey_created event of every
+  acknowledged survey, whichever worker stored it.
+
+Load and server share the machine: scaling is bounded by the cores left
+over for the workers.
+
+    python -m benchmarks.bench_workers [--workers 1,2,4] [--clients 8] [--seconds 10]
+        [--users 200] [--surveys-per-user 20] [--write-ratio 0.1] [--ws 8] [--out workers.json]
+"""
+
+import argparse, csv, http.client, json, multiprocessing, os, random, signal, socket, subprocess, sys, tempfile, threading, time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.suite import percentile
+from benchmarks.synthetic import PASSWORD, generate, username
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHECK = """
+import json
+from app import analytics, storage
+stored = {(a["user_id"], a["username"]): a for a in storage.get().read_alerts()}
+batch = {(int(a["user_id"]), a["username"]): a for a in analytics.compute_risk(write_alerts=False).get("alerts", [])}
+problems = [f"missing {k}" for k in batch.keys() ^ stored.keys()]
+for k in batch.keys() & stored.keys():
+    a, b = stored[k], batch[k]
+    if a["risk_level"] != b["risk_level"] or a["trend_negative"] != bool(b["trend_negative"]) or abs(a["avg_score"] - float(b["avg_score"])) > 1e-9:
+        problems.append(f"{k}: stored={a} batch={b}")
+print(json.dumps(problems))
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def call(conn, method, path, body=None, token=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = "Bearer " + token
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def env(data_dir):
+    e = dict(os.environ, EMOTRACK_DATA_DIR=str(data_dir), EMOTRACK_RUN_DIR=str(data_dir / "run"),
+             PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])))
+    e.pop("EMOTRACK_WORKERS", None)
+    return e
+
+
+def serve(workers, data_dir, port):
+    proc = subprocess.Popen([sys.executable, "main.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=ROOT, env=env(data_dir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    peers = data_dir / "run" / "peers"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"main.py --workers {workers} exited with {proc.returncode}")
+        try:
+            call(http.client.HTTPConnection("127.0.0.1", port, timeout=5), "GET", "/stats")
+            # every worker has joined the cluster once its socket exists
+            if workers == 1 or (peers.is_dir() and len(os.listdir(peers)) == workers):
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not come up")
+
+
+def client(port, tokens, admin, seconds, write_ratio, seed):
+    rnd = random.Random(seed)
+    conn, latencies, errors, written = None, [], 0, []
+    stop = time.monotonic() + seconds
+    while time.monotonic() < stop:
+        if len(latencies) % 50 == 0:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        token, pick = rnd.choice(tokens), rnd.random()
+        t0 = time.perf_counter()
+        if pick < write_ratio:
+            status, body = call(conn, "POST", "/surveys", {"mood": rnd.randint(1, 10), "sleep_hours": 7, "notes": f"c{seed}-{len(written)}"}, token)
+            if status == 200:
+                written.append(json.loads(body)["data"])
+        elif pick < write_ratio + (1 - write_ratio) / 3:
+            status, _ = call(conn, "GET", "/recommendations", token=token)
+        elif pick < write_ratio + 2 * (1 - write_ratio) / 3:
+            status, _ = call(conn, "GET", "/stats", token=token)
+        else:
+            status, _ = call(conn, "GET", "/all-alerts?limit=50", token=admin)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        errors += status != 200
+    return latencies, errors, written
+
+
+def _client(args):
+    return client(*args)
+
+
+def listen(port, token, received, ready):
+    from websockets.sync.client import connect
+    with connect(f"ws://127.0.0.1:{port}/ws?token={token}") as ws:
+        json.loads(ws.recv())  # hello
+        ready.release()
+        try:
+            while True:
+                event = json.loads(ws.recv())
+                if event["type"] == "survey_created":
+                    received.add(int(event["survey"]["id"]))
+        except Exception:
+            return
+
+
+def run(workers, args):
+    tmp = tempfile.TemporaryDirectory(prefix="emotrack-workers-")
+    data_dir = Path(tmp.name)
+    generate(data_dir, args.users, args.surveys_per_user, args.seed)
+    # a deployment starts with its alerts table in place; without it the first commit reports every user as changed
+    subprocess.run([sys.executable, "-m", "app.risk", "rebuild"], check=True, capture_output=True, env=env(data_dir), cwd=ROOT)
+    port = free_port()
+    proc = serve(workers, data_dir, port)
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        login = lambda name: json.loads(call(conn, "POST", "/login", {"username": name, "password": PASSWORD})[1])["access_token"]
+        admin, tokens = login("admin"), [login(username(i)) for i in range(2, min(args.users, 50) + 1)]
+
+        sockets, ready = [], threading.Semaphore(0)
+        try:
+            import websockets  # noqa: F401  (optional: enables the /ws fan-out check)
+            for _ in range(args.ws):
+                received = set()
+                t = threading.Thread(target=listen, args=(port, admin, received, ready), daemon=True)
+                t.start()
+                sockets.append(received)
+            for _ in sockets:
+                ready.acquire(timeout=30)
+        except ImportError:
+            pass
+
+        jobs = [(port, tokens, admin, args.seconds, args.write_ratio, args.seed * 1000 + i) for i in range(args.clients)]
+        t0 = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            results = pool.map(_client, jobs)
+        elapsed = time.perf_counter() - t0
+        time.sleep(1)  # let the last events reach the sockets
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(60)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    latencies = sorted(ms for r in results for ms in r[0])
+    written = [row for r in results for row in r[2]]
+    problems = []
+    with open(data_dir / "surveys.csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    ids, notes = Counter(r["id"] for r in rows), Counter(r["notes"] for r in rows)
+    problems += [f"duplicate survey id {i}" for i, n in ids.items() if n > 1][:5]
+    problems += [f"survey {w['notes']} stored {notes[w['notes']]} times" for w in written if notes[w["notes"]] != 1][:5]
+    check = subprocess.run([sys.executable, "-c", CHECK], capture_output=True, text=True, env=env(data_dir), cwd=ROOT)
+    problems += json.loads(check.stdout)[:5] if check.returncode == 0 else [f"alerts check failed: {check.stderr[-300:]}"]
+    expected = {int(w["id"]) for w in written}
+    for i, received in enumerate(sockets):
+        if expected - received:
+            problems.append(f"/ws client {i} missed {len(expected - received)} of {len(expected)} survey events")
+    tmp.cleanup()
+    return {"workers": workers, "requests": len(latencies), "rps": round(len(latencies) / elapsed, 1), "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2), "errors": sum(r[1] for r in results), "writes": len(written), "ws_clients": len(sockets), "problems": problems}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=8, help="load-generating processes")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--surveys-per-user", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--ws", type=int, default=8, help="admin /ws clients checked for fan-out (needs websockets)")
+    parser.add_argument("--out", help="write the results JSON here")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores; {args.clients} clients, {args.seconds:g}s per run, write ratio {args.write_ratio}")
+    print(f"{'workers':>7} {'req/s':>9} {'speed-up':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'writes':>7}  consistency")
+    runs = []
+    for workers in (int(w) for w in args.workers.split(",")):
+        r = run(workers, args)
+        r["speedup"] = round(r["rps"] / runs[0]["rps"], 2) if runs else 1.0
+        runs.append(r)
+        print(f"{r['workers']:>7} {r['rps']:>9.1f} {r['speedup']:>8.2f}x {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['errors']:>7} {r['writes']:>7}  {'; '.join(r['problems']) or 'ok'}")
+    if args.out:
+        Path(args.out).write_text(json.dumps({"cores": os.cpu_count(), "clients": args.clients, "seconds": args.seconds, "runs": runs}, indent=2), encoding="utf-8")
+    sys.exit(1 if any(r["problems"] or r["errors"] for r in runs) else 0)
+
+
+if __name__ == "__main__":
+    main()
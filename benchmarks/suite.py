@@ -0,0 +1,176 @@
+"""
+suite.py - Synthetic-load benchmark suite for the analytics and API hot paths.
+
+Builds a seeded dataset (benchmarks.synthetic) in a temporary directory,
+points the app at it (EMOTRACK_DATA_DIR, and EMOTRACK_SQLITE_PATH for
+--storage sqlite) and times:
+
+- analytics.compute_risk
+- analytics.generate_user_plot for every kind, and user_plot_data (the
+  JSON series of the same charts)
+- POST /register, /login, /surveys and GET /stats (user and global),
+  /recommendations, /all-alerts through TestClient
+
+Each case reports p50/p95/p99 latency in ms and the peak traced memory of
+one extra call. Results are printed and written as JSON (--out).
+
+With --baseline, every case is compared to a stored run: the suite exits
+with status 1 when a case's p95 (p50 for cases under 20 calls) or peak
+memory grows more than --threshold (default 25%) over the baseline; latency
+changes under --min-delta-ms are treated as noise. --save-baseline writes this run as the new baseline.
+
+    python -m benchmarks.suite [--users 1000] [--surveys-per-user 100] [--seed 42]
+        [--storage csv|sqlite] [--iterations 200] [--out bench.json]
+        [--baseline benchmarks/baseline.json [--save-baseline]] [--threshold 0.25]
+"""
+
+import argparse, itertools, json, os, platform, random, resource, sys, tempfile, time, tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+PLOT_KINDS = ["evolution", "hist", "sleep", "summary"]
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def measure(fn, iterations, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"n": iterations, "p50_ms": round(percentile(samples, 50), 3), "p95_ms": round(percentile(samples, 95), 3), "p99_ms": round(percentile(samples, 99), 3),
+            "mean_ms": round(sum(samples) / len(samples), 3), "peak_kib": round(peak / 1024, 1)}
+
+
+def cases(n_users, iterations, seed):
+    """(name, fn, iterations) for every benchmarked path; the app is imported here, after the env is set."""
+    from fastapi.testclient import TestClient
+    from app import analytics
+    from app.api import app
+    from benchmarks.synthetic import PASSWORD, username
+
+    rnd = random.Random(seed)
+    client = TestClient(app)
+    pick = lambda: username(rnd.randint(2, n_users))
+
+    def ok(response):
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.request.method} {response.request.url.path} -> {response.status_code}: {response.text[:200]}")
+        return response
+
+    def login(name):
+        return {"Authorization": "Bearer " + ok(client.post("/login", json={"username": name, "password": PASSWORD})).json()["access_token"]}
+
+    admin, users = login("admin"), [login(pick()) for _ in range(50)]
+    registered = itertools.count()
+
+    def register():
+        name = f"bench{seed}-{next(registered)}"
+        return ok(client.post("/register", json={"username": name, "email": f"{name}@example.com", "password": PASSWORD}))
+
+    heavy = max(3, iterations // 40)
+
+    yield "compute_risk", lambda: analytics.compute_risk(), heavy
+    for kind in PLOT_KINDS:
+        yield f"generate_user_plot[{kind}]", lambda kind=kind: analytics.generate_user_plot(pick(), kind), max(5, iterations // 10)
+    for kind in PLOT_KINDS:
+        yield f"user_plot_data[{kind}]", lambda kind=kind: analytics.user_plot_data(pick(), kind), iterations
+    yield "POST /register", register, iterations
+    yield "POST /login", lambda: ok(client.post("/login", json={"username": pick(), "password": PASSWORD})), iterations
+    yield "POST /surveys", lambda: ok(client.post("/surveys", json={"mood": rnd.randint(1, 10), "sleep_hours": 7, "notes": "bench"}, headers=rnd.choice(users))), iterations
+    yield "GET /stats (user)", lambda: ok(client.get("/stats", headers=rnd.choice(users))), iterations
+    yield "GET /stats (global)", lambda: ok(client.get("/stats")), iterations
+    yield "GET /recommendations", lambda: ok(client.get("/recommendations", headers=rnd.choice(users))), iterations
+    yield "GET /all-alerts", lambda: ok(client.get("/all-alerts", headers=admin)), max(5, iterations // 10)
+    yield "GET /all-alerts?limit=50", lambda: ok(client.get("/all-alerts", params={"limit": 50}, headers=admin)), iterations
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Lines describing each regression of `results` against `baseline`."""
+    regressions = []
+    for name, cur in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        # with few samples p95 is just the slowest call; compare medians there
+        key = "p95_ms" if min(cur["n"], base["n"]) >= 20 else "p50_ms"
+        if cur[key] > base[key] * (1 + threshold) and cur[key] - base[key] > min_delta_ms:
+            regressions.append(f"{name}: {key[:3]} {base[key]} -> {cur[key]} ms")
+        if cur["peak_kib"] > base["peak_kib"] * (1 + threshold) and cur["peak_kib"] - base["peak_kib"] > 64:
+            regressions.append(f"{name}: peak {base['peak_kib']} -> {cur['peak_kib']} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--surveys-per-user", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--storage", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--iterations", type=int, default=200, help="per endpoint; compute_risk and plots run fewer")
+    parser.add_argument("--only", help="comma-separated substrings of case names to run")
+    parser.add_argument("--out", help="write the results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory(prefix="emotrack-bench-")
+    data_dir = Path(tmp.name)
+    # must be set before anything under app/ is imported: paths are read at import time
+    os.environ.update({"EMOTRACK_DATA_DIR": str(data_dir), "EMOTRACK_STORAGE": args.storage, "EMOTRACK_SQLITE_PATH": str(data_dir / "emotrack.db")})
+    from benchmarks.synthetic import generate
+    from app import storage, writer
+
+    t0 = time.perf_counter()
+    n_users, n_surveys = generate(data_dir, args.users, args.surveys_per_user, args.seed)
+    if args.storage == "sqlite":
+        storage.migrate_csv_to_sqlite(data_dir / "emotrack.db", data_dir)
+    print(f"dataset: {n_users} users, {n_surveys} surveys ({args.storage}) in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    results = {"meta": {"users": n_users, "surveys_per_user": args.surveys_per_user, "surveys": n_surveys, "seed": args.seed, "storage": args.storage, "iterations": args.iterations,
+                        "python": platform.python_version(), "machine": platform.machine(), "created": datetime.now().isoformat(timespec="seconds")},
+               "results": {}}
+    only = args.only.split(",") if args.only else None
+    print(f"{'case':<32} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>10}")
+    for name, fn, iterations in cases(n_users, args.iterations, args.seed):
+        if only and not any(o in name for o in only):
+            continue
+        r = results["results"][name] = measure(fn, iterations)
+        print(f"{name:<32} {r['n']:>5} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['peak_kib']:>10.1f}")
+    writer.commits.stop()
+    results["meta"]["max_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tmp.cleanup()
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.baseline and args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"baseline saved to {args.baseline}")
+    elif args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        scale = ("users", "surveys_per_user", "seed", "storage")
+        if any(baseline["meta"].get(k) != results["meta"][k] for k in scale):
+            sys.exit(f"baseline {args.baseline} was recorded with a different dataset: " + ", ".join(f"{k}={baseline['meta'].get(k)}" for k in scale))
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
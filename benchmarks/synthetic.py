@@ -0,0 +1,70 @@
+"""
+synthetic.py - Seeded synthetic dataset in the data/ CSV layout.
+
+Writes users.csv, surveys.csv and recommendations.csv into a directory so the
+app can be pointed at it with EMOTRACK_DATA_DIR. The same seed always gives
+the same files. Every user gets a baseline mood and a drift, so the dataset
+has a mix of BAJO/MODERADO/ALTO users and negative trends; a share of notes
+contain negative keywords. User 1 is "admin". Passwords are PASSWORD.
+
+    python -m benchmarks.synthetic OUT_DIR [--users 1000] [--surveys-per-user 100] [--seed 42]
+"""
+
+import argparse, csv, random, shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app.storage import SURVEY_FIELDS, USER_FIELDS
+
+PASSWORD = "bench-pass"
+NOTES = ["", "", "", "bien", "tranquilo", "cansado", "mal día", "triste", "estres en el trabajo", "ansiedad", "no puedo dormir"]
+START = datetime(2025, 1, 1, 8, 0, 0)
+REPO_DATA = Path(__file__).resolve().parent.parent / "data"
+
+
+def username(i):
+    return "admin" if i == 1 else f"user{i}"
+
+
+def generate(out_dir, users=1000, surveys_per_user=100, seed=42):
+    """Write the dataset to `out_dir`; returns (n_users, n_surveys)."""
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    rnd = random.Random(seed)
+    with open(out / "users.csv", "w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=USER_FIELDS)
+        w.writeheader()
+        for i in range(1, users + 1):
+            w.writerow({"id": i, "username": username(i), "email": f"{username(i)}@example.com", "hashed_password": PASSWORD, "role": "admin" if i == 1 else "user", "created_at": START.strftime("%Y-%m-%dT%H:%M:%S")})
+    # surveys interleaved day by day across users, like real traffic (ids follow created_at)
+    profiles = [(rnd.uniform(2, 9), rnd.uniform(-0.05, 0.03)) for _ in range(users)]
+    sid = 0
+    with open(out / "surveys.csv", "w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=SURVEY_FIELDS)
+        w.writeheader()
+        for day in range(surveys_per_user):
+            for u in range(users):
+                base, drift = profiles[u]
+                mood = min(10, max(1, round(base + drift * day + rnd.gauss(0, 1.2))))
+                sid += 1
+                when = START + timedelta(days=day, minutes=rnd.randint(0, 12 * 60))
+                w.writerow({"id": sid, "user_id": u + 1, "username": username(u + 1), "mood": mood, "mood_score": mood * 10 if rnd.random() < 0.7 else "",
+                            "sleep_hours": round(rnd.uniform(3, 10), 1) if rnd.random() < 0.8 else "", "appetite": rnd.randint(0, 10) if rnd.random() < 0.8 else "",
+                            "concentration": rnd.randint(0, 10) if rnd.random() < 0.8 else "", "notes": rnd.choice(NOTES), "created_at": when.strftime("%Y-%m-%dT%H:%M:%S")})
+    shutil.copyfile(REPO_DATA / "recommendations.csv", out / "recommendations.csv")
+    return users, sid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--surveys-per-user", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    n_users, n_surveys = generate(args.out_dir, args.users, args.surveys_per_user, args.seed)
+    print(f"{n_users} users, {n_surveys} surveys -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,42 @@
 #!/usr/bin/env python3
 """
 Punto de entrada principal para EmoTrack (control de emociones)
+
+    python main.py                # desarrollo: un proceso con recarga automática
+    python main.py --workers 4    # producción: 4 procesos, sin recarga
+
+En producción los procesos coordinan escrituras, cachés y eventos de /ws
+a través de app.cluster (EMOTRACK_WORKERS se pasa a cada proceso).
 """
 
+import argparse, os
+
 import uvicorn
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EmoTrack API")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("EMOTRACK_WORKERS", 0)), help="procesos de uvicorn (producción); 0 = desarrollo con recarga")
+    parser.add_argument("--host", default=os.environ.get("EMOTRACK_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("EMOTRACK_PORT", 8000)))
+    args = parser.parse_args()
+
     print("🚀 Iniciando EmoTrack...")
-    print("📍 La aplicación estará disponible en: http://localhost:8000")
-    print("📖 Documentación interactiva en: http://localhost:8000/docs")
+    print(f"📍 La aplicación estará disponible en: http://localhost:{args.port}")
+    print(f"📖 Documentación interactiva en: http://localhost:{args.port}/docs")
     print("🔧 Para detener la aplicación: Ctrl+C")
-    
-    uvicorn.run(
-        "app.api:app",  # String de importación en lugar del objeto
-        host="0.0.0.0", 
-        port=8000,
-        reload=True,  # Recarga automática en desarrollo
-        log_level="info"
-    )
\ No newline at end of file
+
+    if args.workers > 0:
+        # los procesos hijos leen la configuración del entorno al importar app.*
+        os.environ["EMOTRACK_WORKERS"] = str(args.workers)
+        # repartir los núcleos entre los renderizadores de gráficos de todos los procesos
+        os.environ.setdefault("EMOTRACK_PLOT_WORKERS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+        print(f"⚙️  Modo producción: {args.workers} procesos")
+        uvicorn.run("app.api:app", host=args.host, port=args.port, workers=args.workers, log_level="info")
+    else:
+        uvicorn.run(
+            "app.api:app",  # String de importación en lugar del objeto
+            host=args.host,
+            port=args.port,
+            reload=True,  # Recarga automática en desarrollo
+            log_level="info"
+        )
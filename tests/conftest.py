@@ -0,0 +1,49 @@
+"""
+Test setup: the app runs against a throwaway EMOTRACK_DATA_DIR.
+
+The variables are set before anything under app is imported, so module
+paths and the storage/table singletons point at the temporary directory.
+The data_dir fixture empties it and drops in-memory state for each test;
+backend runs a test once per storage backend.
+"""
+
+import os, shutil, tempfile
+from pathlib import Path
+
+import pytest
+
+DATA_DIR = Path(tempfile.mkdtemp(prefix="emotrack-tests-"))
+os.environ["EMOTRACK_DATA_DIR"] = str(DATA_DIR)
+os.environ["EMOTRACK_RUN_DIR"] = str(DATA_DIR / "run")
+os.environ["EMOTRACK_STORAGE"] = "csv"
+for name in ("EMOTRACK_WORKERS", "EMOTRACK_KEYWORDS_FILE", "EMOTRACK_TREND_WINDOW", "EMOTRACK_TREND_SLOPE"):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture
+def data_dir():
+    from app import risk, rollups, store, table
+    for p in DATA_DIR.iterdir():
+        shutil.rmtree(p) if p.is_dir() else p.unlink()
+    table.surveys.invalidate()
+    risk.engine.invalidate()
+    rollups.daily_mood.invalidate()
+    store.surveys._next_id = None
+    yield DATA_DIR
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def backend(request, data_dir, monkeypatch):
+    """Each storage backend over the test data dir, installed as storage.get()."""
+    from app import storage
+    b = storage.CSVStorage(data_dir) if request.param == "csv" else storage.SQLiteStorage(data_dir / "emotrack.db")
+    monkeypatch.setattr(storage, "_storage", b)
+    yield b
+
+
+def survey(id, user_id, mood, created_at, **extra):
+    """A stored survey row as ingest.survey_row builds it."""
+    row = {"id": id, "user_id": user_id, "username": f"user{user_id}", "mood": mood, "mood_score": mood * 10,
+           "sleep_hours": 7, "appetite": 5, "concentration": 5, "notes": "", "created_at": created_at}
+    row.update(extra)
+    return row
@@ -0,0 +1,148 @@
+"""Batch analytics (app.analytics): columnar scores against the per-row formulas, plot data against the PNG."""
+
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+
+from app import analytics, storage
+from app.utils import write_csv_rows
+from tests.conftest import survey
+
+PLOT_ROWS = [
+    survey(1, 1, 6, "2024-01-01T09:00:00", sleep_hours=7.5),
+    survey(2, 1, 4, "2024-01-01T21:00:00", sleep_hours="", appetite=3),
+    survey(3, 1, 8, "2024-01-03T09:00:00", sleep_hours=9.0, concentration="alta"),  # no survey on the 2nd
+    survey(4, 1, "", "2024-01-04T09:00:00", sleep_hours=4.0),
+    survey(5, 1, 2, "2024-01-05T09:00:00", sleep_hours=6.5, appetite=8),
+    survey(6, 2, 5, "2024-01-05T09:00:00"),
+]
+
+
+@pytest.fixture
+def drawn(data_dir, monkeypatch):
+    """draw(kind): the figure generate_user_plot saves for user1."""
+    write_csv_rows(data_dir / "surveys.csv", PLOT_ROWS, storage.SURVEY_FIELDS)
+    figures, savefig = [], Figure.savefig
+
+    def keep(fig, *args, **kwargs):
+        figures.append(fig)
+        return savefig(fig, *args, **kwargs)
+    monkeypatch.setattr(Figure, "savefig", keep)
+
+    def draw(kind):
+        analytics.generate_user_plot("user1", kind)
+        return figures[-1]
+    return draw
+
+
+def _nan_to_none(values):
+    return [None if v != v else round(float(v), 3) for v in values]
+
+
+def test_plot_json_is_the_data_the_png_draws(drawn):
+    evolution = analytics.user_plot_data("user1", "evolution")
+    lines = drawn("evolution").axes[0].lines
+    assert evolution["dates"] == ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"]
+    assert evolution["mood"] == _nan_to_none(lines[0].get_ydata()) == [5.0, None, 8.0, None, 2.0]
+    assert evolution["rolling"] == _nan_to_none(lines[1].get_ydata())
+
+    hist = analytics.user_plot_data("user1", "hist")
+    bars = drawn("hist").axes[0].patches
+    assert hist["counts"] == [int(b.get_height()) for b in bars] and sum(hist["counts"]) == 4
+    assert hist["edges"] == _nan_to_none([b.get_x() for b in bars] + [bars[-1].get_x() + bars[-1].get_width()])
+
+    sleep = analytics.user_plot_data("user1", "sleep")
+    bars = drawn("sleep").axes[1].patches
+    assert sleep["counts"] == [int(b.get_height()) for b in bars] and sum(sleep["counts"]) == 4
+    assert (sleep["box"]["min"], sleep["box"]["max"]) == (4.0, 9.0)
+
+    summary = analytics.user_plot_data("user1", "summary")
+    ax = drawn("summary").axes[0]
+    assert [t.get_text() for t in ax.get_xticklabels()] == [analytics.SUMMARY_LABELS[c] for c in summary["means"]]
+    assert list(summary["means"].values()) == _nan_to_none([b.get_height() for b in ax.patches])
+    assert summary["means"]["concentration"] == 5.0  # "alta" is not a number
+
+
+def test_plot_json_without_surveys(data_dir):
+    assert analytics.user_plot_data("nobody", "evolution") == {"kind": "evolution", "count": 0, "dates": [], "mood": [], "rolling": None}
+    assert analytics.user_plot_data("nobody", "hist")["kde"] is None
+    assert analytics.user_plot_data("nobody", "sleep")["box"] is None
+    assert set(analytics.user_plot_data("nobody", "summary")["means"].values()) == {None}
+
+
+EDGE_ROWS = [
+    {"mood": 7, "mood_score": 70, "sleep_hours": 7.5, "appetite": 5, "concentration": 5, "notes": "bien"},
+    {"mood": 3, "mood_score": "", "sleep_hours": "", "appetite": None, "concentration": "alta", "notes": None},
+    {"mood": "x", "mood_score": "abc", "sleep_hours": "n/a", "appetite": "", "concentration": 11, "notes": "Mucho ESTRÉS"},
+    {"mood": None, "mood_score": None, "sleep_hours": None, "appetite": -2, "concentration": None, "notes": 4.5},
+    {"mood": float("nan"), "mood_score": float("nan"), "sleep_hours": float("nan"), "appetite": float("nan"),
+     "concentration": float("nan"), "notes": float("nan")},
+    {"mood": "8", "mood_score": "81.5", "sleep_hours": "12", "appetite": "10", "concentration": "0", "notes": "no puedo más"},
+    {"mood": 5, "mood_score": 150, "sleep_hours": 0, "appetite": 5, "concentration": 5, "notes": ""},
+]
+
+
+def _per_row(df):
+    return df.apply(analytics.compute_composite, axis=1).tolist() if len(df) else []
+
+
+def test_composite_scores_match_the_per_row_formula():
+    import pandas as pd
+    edge = pd.DataFrame(EDGE_ROWS)
+    assert analytics.composite_scores(edge).tolist() == _per_row(edge)
+    # as read from storage: numeric columns, blanks as NaN
+    rnd = np.random.default_rng(7)
+    n = 2000
+    numeric = pd.DataFrame({"mood": rnd.integers(1, 11, n), "mood_score": rnd.integers(0, 101, n).astype(float),
+                            "sleep_hours": rnd.choice([4.25, 6.5, 7.5, 8.75, 9.0, np.nan], n), "appetite": rnd.integers(0, 11, n),
+                            "concentration": rnd.choice([1.0, 5.0, 9.0, np.nan], n),
+                            "notes": rnd.choice(["", "me siento mal", "día tranquilo", None], n)})
+    numeric.loc[rnd.random(n) < 0.1, "mood_score"] = np.nan
+    assert analytics.composite_scores(numeric).tolist() == _per_row(numeric)
+    # a column missing altogether falls back like row.get(col, default)
+    partial = numeric.drop(columns=["appetite", "notes"])
+    assert analytics.composite_scores(partial).tolist() == _per_row(partial)
+    assert analytics.composite_scores(numeric.iloc[:0]).tolist() == []
+
+
+def _old_trend(df_user):
+    """The detector before negative_trends: the latest 3 readings, newest first, strictly rising backwards."""
+    if df_user.shape[0] < 3:
+        return False
+    vals = df_user.sort_values("created_at", ascending=False)["mood_score"].head(3).tolist()
+    return vals[0] < vals[1] < vals[2]
+
+
+def _trend_frame(readings):
+    import pandas as pd
+    rows = [{"user_id": uid, "created_at": pd.Timestamp("2024-01-01") + pd.Timedelta(hours=h), "mood_score": v}
+            for uid, values in readings.items() for h, v in enumerate(values)]
+    return pd.DataFrame(rows).sample(frac=1, random_state=3)  # storage order is not time order
+
+
+def test_negative_trends_match_the_per_user_detector():
+    rnd = np.random.default_rng(11)
+    readings = {uid: rnd.integers(0, 101, rnd.integers(1, 7)).tolist() for uid in range(1, 301)}
+    readings[301] = [90, 80, 70]
+    df = _trend_frame(readings)
+    flags = analytics.negative_trends(df, window=3, slope_threshold=None)
+    assert sorted(flags.index) == list(range(1, 302)) and flags[301]
+    for uid, group in df.groupby("user_id"):
+        assert flags[uid] == _old_trend(group) == analytics.trend_negative_for_user(group), uid
+
+
+def test_negative_trends_need_a_full_window():
+    df = _trend_frame({1: [90, 80], 2: [90, 80, 70], 3: [95, 90, float("nan")], 4: [99, 90, 80, 70, 75]})
+    assert analytics.negative_trends(df, window=3, slope_threshold=None).to_dict() == {1: False, 2: True, 3: False, 4: False}
+    assert analytics.negative_trends(df, window=2, slope_threshold=None).to_dict() == {1: True, 2: True, 3: False, 4: False}
+    assert not analytics.negative_trends(df, window=1, slope_threshold=None).any()
+
+
+def test_negative_trends_slope_threshold():
+    # least-squares slope over the latest 3 readings: 1: -2.5, 2: -10, 3: +5, 4: -5 (80, 70, 70)
+    df = _trend_frame({1: [80, 70, 75], 2: [90, 80, 70], 3: [60, 70, 70], 4: [99, 80, 70, 70]})
+    assert analytics.negative_trends(df, window=3, slope_threshold=2.5).to_dict() == {1: True, 2: True, 3: False, 4: True}
+    assert analytics.negative_trends(df, window=3, slope_threshold=5.5).to_dict() == {1: False, 2: True, 3: False, 4: False}
+    for uid, group in df.groupby("user_id"):
+        values = group.sort_values("created_at")["mood_score"].tolist()
+        assert analytics.negative_trends(df, window=3, slope_threshold=2.5)[uid] == analytics.is_negative_trend(values, 3, 2.5)
@@ -0,0 +1,145 @@
+"""HTTP and websocket endpoints (app.api) through Starlette's TestClient."""
+
+import base64, csv, io, json
+from concurrent.futures import Future
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import api, export, storage, writer
+from app.utils import create_access_token, read_csv_rows, write_csv_rows
+from tests.conftest import survey
+
+
+@pytest.fixture
+def client(data_dir):
+    # no lifespan: the render pool is not started
+    return TestClient(api.app)
+
+
+def token(username="ana", role="user", user_id=1):
+    return create_access_token({"user_id": user_id, "username": username, "role": role})
+
+
+def test_ws_rejects_bad_token_with_1008(client):
+    with client.websocket_connect("/ws?token=not-a-token") as ws:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 1008
+
+
+def test_ws_sends_hello(client):
+    with client.websocket_connect(f"/ws?token={token()}") as ws:
+        assert ws.receive_json() == {"type": "hello", "username": "ana", "role": "user"}
+
+
+def test_query_token_only_on_user_plot(client):
+    t = token()
+    assert client.get("/me", headers={"Authorization": f"Bearer {t}"}).status_code == 200
+    assert client.get(f"/me?token={t}").status_code == 401
+    assert client.post(f"/surveys?token={t}", json={"mood": 5}).status_code == 401
+    assert client.get(f"/user-plot?token={t}&format=json").status_code == 200
+    assert client.get("/user-plot?format=json").status_code == 401
+
+
+def test_user_stats_history_is_csv_rows(client, data_dir):
+    rows = [survey(i, 1, i, f"2024-01-0{i}T10:00:00", sleep_hours=6.5, appetite="") for i in range(1, 8)]
+    write_csv_rows(data_dir / "surveys.csv", rows, storage.SURVEY_FIELDS)
+    body = client.get("/stats", headers={"Authorization": f"Bearer {token('user1')}"}).json()
+    assert body["total_entries"] == 7 and body["average_mood"] == 4.0
+    assert body["history"] == sorted(read_csv_rows(data_dir / "surveys.csv"), key=lambda r: r["created_at"], reverse=True)[:5]
+
+
+def test_write_without_answer_is_503(client, monkeypatch):
+    monkeypatch.setattr(writer, "WRITE_TIMEOUT", 0.01)
+    monkeypatch.setattr(writer.commits, "add_surveys", lambda rows, bulk=False: Future())
+    auth = {"Authorization": f"Bearer {token()}"}
+    r = client.post("/surveys", json={"mood": 5}, headers=auth)
+    assert r.status_code == 503 and r.headers["retry-after"] == "2"
+    assert client.post("/surveys/batch", json=[{"mood": 5}], headers=auth).status_code == 503
+
+
+def test_batch_json_reports_bad_rows_and_converts_offsets(client, backend):
+    auth = {"Authorization": f"Bearer {token('user1')}"}
+    items = [
+        {"mood": 6, "created_at": "2024-03-01T23:30:00-05:00", "notes": "tarde"},
+        {"mood": 0},
+        "not an object",
+        {"mood": 4, "created_at": "ayer"},
+        {"mood": 7, "created_at": "2024-03-02T08:15:00.250"},
+        {"mood": 5, "username": "bob"},
+    ]
+    body = client.post("/surveys/batch", json=items, headers=auth).json()
+    assert (body["inserted"], body["rejected"]) == (2, 4)
+    assert [e["row"] for e in body["errors"]] == [1, 2, 3, 5]
+    assert "Fecha inválida" in body["errors"][2]["error"] and "administradores" in body["errors"][3]["error"]
+    stored = list(backend.iter_surveys())
+    assert [(int(r["id"]), r["username"], r["created_at"]) for r in stored] == [
+        (body["first_id"], "user1", "2024-03-02T04:30:00"), (body["last_id"], "user1", "2024-03-02T08:15:00")]
+    assert client.post("/surveys/batch", content="{", headers=auth).status_code == 400
+    assert client.post("/surveys/batch", json={"mood": 5}, headers=auth).status_code == 400
+
+
+def test_batch_ndjson_reports_line_numbers(client, backend):
+    auth = {"Authorization": f"Bearer {token('user1')}", "Content-Type": "application/x-ndjson"}
+    lines = ['{"mood": 3, "created_at": "2024-03-01T10:00:00+02:00"}', "", "{nope", '{"mood": 11}', '{"mood": 8}']
+    body = client.post("/surveys/batch", content="\n".join(lines) + "\n", headers=auth).json()
+    assert (body["inserted"], body["rejected"]) == (2, 2)
+    assert [(e["row"], e["error"]) for e in body["errors"]] == [(3, "JSON inválido"), (4, "Invalid mood value")]
+    stored = list(backend.iter_surveys())
+    assert [int(r["mood"]) for r in stored] == [3, 8]
+    assert stored[0]["created_at"] == "2024-03-01T08:00:00"
+
+
+def test_alert_pages_walk_every_user_once_while_surveys_arrive(client, backend):
+    def post(user_id, mood):
+        auth = {"Authorization": f"Bearer {token(f'user{user_id}', user_id=user_id)}"}
+        assert client.post("/surveys", json={"mood": mood}, headers=auth).status_code == 200
+
+    for user_id in range(1, 13):
+        post(user_id, user_id % 10 + 1)
+    admin = {"Authorization": f"Bearer {token('root', role='admin', user_id=99)}"}
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = client.get("/all-alerts", params={"limit": 5, **({"cursor": cursor} if cursor else {})}, headers=admin).json()
+        seen += [a["username"] for a in page["alerts"]]
+        pages += 1
+        if pages == 1:
+            post(3, 2)   # already listed: updated in place, not listed again
+            post(20, 1)  # new user after the cursor: shows up on a later page
+            post(7, 9)   # not listed yet: still listed once
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [f"user{i}" for i in list(range(1, 13)) + [20]]
+    assert page["total_alerts"] == 13
+
+
+def test_bad_alert_cursor_is_400(client):
+    admin = {"Authorization": f"Bearer {token('root', role='admin', user_id=99)}"}
+    good = export.encode_cursor({"user_id": 4, "username": "user4"})
+    assert client.get("/all-alerts", params={"limit": 2, "cursor": good}, headers=admin).status_code == 200
+    forged = [base64.urlsafe_b64encode(json.dumps(v).encode()).decode() for v in (["4x", "user4"], {"user_id": 4}, [4])]
+    for bad in ["not a cursor", good[:-3], good[::-1]] + forged:
+        assert client.get("/all-alerts", params={"limit": 2, "cursor": bad}, headers=admin).status_code == 400, bad
+
+
+def test_streamed_export_matches_the_stored_rows(client, backend, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 3)  # several chunks per response
+    rows = [survey(i, i % 3 + 1, i % 10 + 1, f"2024-02-{i:02d}T08:00:00", notes="línea, \"con\" comas" if i % 4 else "",
+                   sleep_hours="" if i % 5 == 0 else 7.5) for i in range(1, 21)]
+    backend.append_surveys(rows)
+    stored = [{k: str(v) for k, v in row.items()} for row in rows]  # as the CSV file holds them
+    admin = {"Authorization": f"Bearer {token('root', role='admin', user_id=99)}"}
+
+    r = client.get("/surveys/export", params={"format": "csv"}, headers=admin)
+    assert list(csv.DictReader(io.StringIO(r.text))) == stored
+
+    lines = client.get("/surveys/export", headers=admin).text.splitlines()
+    assert [json.loads(line) for line in lines] == [export._typed(row) for row in stored]
+    assert json.loads(lines[4])["sleep_hours"] is None and json.loads(lines[0])["mood"] == 2
+
+    mine = client.get("/surveys/export", headers={"Authorization": f"Bearer {token('user2', user_id=2)}"}).text.splitlines()
+    assert [json.loads(line)["id"] for line in mine] == [int(row["id"]) for row in stored if row["username"] == "user2"]
+    assert client.get("/surveys/export", params={"username": "user1"}, headers={"Authorization": f"Bearer {token('user2', user_id=2)}"}).status_code == 403
@@ -0,0 +1,57 @@
+"""Benchmark suite (benchmarks.suite): percentiles, the baseline check and the synthetic dataset."""
+
+import json, subprocess, sys
+from pathlib import Path
+
+from benchmarks import suite, synthetic
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _run(p50, p95, n=200, peak=100.0):
+    return {"n": n, "p50_ms": p50, "p95_ms": p95, "p99_ms": p95, "mean_ms": p50, "peak_kib": peak}
+
+
+def test_nearest_rank_percentiles():
+    ordered = list(range(1, 101))
+    assert [suite.percentile(ordered, q) for q in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert suite.percentile([7], 95) == 7
+
+
+def test_compare_flags_only_real_regressions():
+    baseline = {"results": {"slow": _run(10, 20), "few": _run(10, 50, n=5), "noise": _run(0.5, 1.0), "memory": _run(1, 2, peak=1000)}}
+    results = {"results": {"slow": _run(10, 26), "few": _run(14, 500, n=5), "noise": _run(0.9, 1.9), "memory": _run(1, 2, peak=1400),
+                           "new case": _run(99, 99)}}
+    assert suite.compare(results, baseline, threshold=0.25, min_delta_ms=1.0) == [
+        "slow: p95 20 -> 26 ms",   # 30% over
+        "few: p50 10 -> 14 ms",    # under 20 calls the median is compared, not the slowest call
+        "memory: peak 1000 -> 1400 KiB",
+    ]  # "noise" grew 90% but by less than min_delta_ms; "new case" has no baseline
+    assert suite.compare(results, baseline, threshold=0.5, min_delta_ms=1.0) == []
+
+
+def test_synthetic_dataset_is_seeded(tmp_path):
+    a, b, c = (tmp_path / name for name in "abc")
+    assert synthetic.generate(a, users=20, surveys_per_user=5, seed=3) == (20, 100)
+    synthetic.generate(b, users=20, surveys_per_user=5, seed=3)
+    synthetic.generate(c, users=20, surveys_per_user=5, seed=4)
+    assert (a / "users.csv").read_bytes() == (b / "users.csv").read_bytes()
+    assert (a / "surveys.csv").read_bytes() == (b / "surveys.csv").read_bytes() != (c / "surveys.csv").read_bytes()
+    assert (a / "users.csv").read_text(encoding="utf-8").splitlines()[1].split(",")[1] == "admin"
+
+
+def test_suite_exits_1_on_a_regression_against_its_baseline(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    cmd = [sys.executable, "-m", "benchmarks.suite", "--users", "5", "--surveys-per-user", "3", "--iterations", "3",
+           "--only", "POST /login", "--baseline", str(baseline)]
+    assert subprocess.run(cmd + ["--save-baseline"], cwd=ROOT, capture_output=True).returncode == 0
+    assert subprocess.run(cmd + ["--threshold", "100"], cwd=ROOT, capture_output=True).returncode == 0
+    stored = json.loads(baseline.read_text(encoding="utf-8"))
+    stored["results"]["POST /login"].update(p50_ms=0.001, p95_ms=0.001)
+    baseline.write_text(json.dumps(stored), encoding="utf-8")
+    run = subprocess.run(cmd + ["--min-delta-ms", "0"], cwd=ROOT, capture_output=True, text=True)
+    assert run.returncode == 1 and "REGRESSION POST /login: p50" in run.stdout
+    stored["meta"]["users"] = 6
+    baseline.write_text(json.dumps(stored), encoding="utf-8")
+    run = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    assert run.returncode == 1 and "different dataset" in run.stderr
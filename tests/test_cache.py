@@ -0,0 +1,41 @@
+"""Plot cache (app.cache): versions, invalidation and renderings that race a write."""
+
+from app.cache import PlotCache
+
+
+def test_bump_drops_cached_entries():
+    c = PlotCache(latest=lambda username: 3)
+    v0 = c.version("ana")
+    assert c.put("ana", "hist", v0, b"png")
+    assert c.get("ana", "hist", v0) == b"png"
+    c.bump("ana", 4)
+    v1 = c.version("ana")
+    assert v1 != v0
+    assert c.get("ana", "hist", v1) is None
+    assert c.stats()["entries"] == 0
+
+
+def test_rendering_from_a_stale_version_is_not_stored():
+    c = PlotCache(latest=lambda username: 3)
+    v0 = c.version("ana")   # read before rendering
+    c.bump("ana", 4)        # a survey is committed while it renders
+    assert not c.put("ana", "hist", v0, b"old png")
+    assert not c.put("ana", "hist", v0, b"{}", fmt="json")
+    assert c.stats()["entries"] == 0
+    assert c.get("ana", "hist", v0) is None
+
+
+def test_versions_come_from_storage_not_from_start_time():
+    newest = {"ana": 10, "bob": 4}
+    first, later = PlotCache(latest=newest.get), PlotCache(latest=newest.get)
+    first.rebase("epoch")
+    first.bump("ana", 12)           # a commit seen by the first worker...
+    newest["ana"] = 12              # ...is in storage when the later one starts
+    later.rebase("epoch")
+    assert first.version("ana") == later.version("ana") == "epoch.12"
+    assert first.version("bob") == later.version("bob") == "epoch.4"
+    assert not first.put("ana", "sleep", "epoch.10", b"x")
+    assert first.put("ana", "sleep", "epoch.12", b"x")
+    first.rebase("other")
+    assert first.get("ana", "sleep", "epoch.12") is None
+    assert first.version("ana") == "other.12"
@@ -0,0 +1,106 @@
+"""Commit replay between API workers (app.cluster + app.writer), without sockets.
+
+Worker A's announcements are captured as frames and fed to worker B's
+Node, as its listener thread would.
+"""
+
+import itertools, threading
+
+import pytest
+
+from app import cluster, risk, rollups, storage, store, table, writer
+from app.utils import write_csv_rows
+from tests.conftest import survey
+
+
+class CountingCSV(storage.CSVStorage):
+    """CSV backend counting the full-table reads the stores fall back to."""
+
+    def __init__(self, data_dir):
+        super().__init__(data_dir)
+        self.id_scans = self.user_loads = 0
+
+    def max_survey_id(self):
+        self.id_scans += 1
+        return super().max_survey_id()
+
+    def read_users(self):
+        self.user_loads += 1
+        return super().read_users()
+
+
+def _worker(backend):
+    surveys = table.SurveyTable(backend)
+    return writer.GroupWriter(window_ms=0, surveys=store.SurveyStore(backend), users=store.UserDirectory(backend),
+                              engine=risk.RiskEngine(backend, survey_table=surveys), rollup=rollups.DailyMoodRollup(backend, survey_table=surveys),
+                              survey_table=surveys)
+
+
+def _user(name):
+    return {"username": name, "email": f"{name}@x.org", "hashed_password": "x", "role": "user", "created_at": "2024-01-01T00:00:00"}
+
+
+@pytest.fixture
+def workers(data_dir, monkeypatch):
+    write_csv_rows(data_dir / "surveys.csv", [survey(i, 1, 5, "2024-01-01T10:00:00") for i in range(1, 4)], storage.SURVEY_FIELDS)
+    write_csv_rows(data_dir / "users.csv", [{"id": 1, **_user("user1")}], storage.USER_FIELDS)
+    a, b = _worker(CountingCSV(data_dir)), _worker(CountingCSV(data_dir))
+    peer = cluster.Node(run_dir=data_dir / "run", enabled=True)
+    peer.listeners.append(b.replay)
+    versions, announced = itertools.count(1), []
+    monkeypatch.setattr(cluster.node, "advance", lambda: next(versions))
+    monkeypatch.setattr(cluster.node, "announce", lambda version, groups, users=(), state=None:
+                        announced.append((threading.current_thread(), version, cluster.Node._frames(version, groups, users, state))))
+
+    def deliver():
+        with peer._applied:
+            for thread, version, frames in announced:
+                if thread is b._thread:
+                    peer.applied = version  # B's own commit, as announce() records it
+                    continue
+                for frame in frames:
+                    peer._receive(frame)
+        announced.clear()
+
+    yield a, b, deliver, peer
+    a.stop()
+    b.stop()
+
+
+def test_peer_write_after_replay_does_not_rescan(workers):
+    a, b, deliver, peer = workers
+    b_backend = b._surveys.backend
+    b.add_surveys([{**survey(0, 1, 6, "2024-01-02T10:00:00"), "notes": "b0"}]).result(10)
+    b.add_user(_user("first")).result(10)
+    scans_before = b_backend.id_scans, b_backend.user_loads
+    deliver()
+
+    for i in range(5):
+        a.add_surveys([{**survey(0, 2, 4, "2024-01-03T10:00:00"), "notes": f"a{i}"}]).result(10)
+        a.add_user(_user(f"from-a-{i}")).result(10)
+        deliver()
+        stored = b.add_surveys([{**survey(0, 1, 7, "2024-01-04T10:00:00"), "notes": f"b{i + 1}"}]).result(10)
+        assert stored[0]["id"] == 6 + 2 * i
+        assert b._users.by_username(f"from-a-{i}") is not None
+        with pytest.raises(ValueError):
+            b.add_user(_user(f"from-a-{i}")).result(10)
+        deliver()
+
+    assert (b_backend.id_scans, b_backend.user_loads) == scans_before
+    assert peer.gaps == 0
+    ids = storage.CSVStorage(b_backend.surveys_csv.parent).read_surveys()["id"].astype(int).tolist()
+    assert ids == list(range(1, len(ids) + 1))
+    assert b._engine.check() == []
+
+
+def test_outside_edit_still_reloads_users(workers, data_dir):
+    a, b, deliver, peer = workers
+    assert b._users.by_username("user1") is not None
+    loads = b._users.backend.user_loads
+    # a row added behind the API's back, then a registration on A
+    storage.CSVStorage(data_dir).append_users([{"id": 50, **_user("manual")}])
+    a.add_user(_user("from-a")).result(10)
+    deliver()
+    assert b._users.by_username("manual") is not None
+    assert b._users.by_username("from-a") is not None
+    assert b._users.backend.user_loads == loads + 1
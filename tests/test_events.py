@@ -0,0 +1,24 @@
+"""Live event fan-out (app.events): who gets which event."""
+
+import asyncio
+
+from app import events
+
+
+def _fanout(*published):
+    async def run():
+        hub = events.Broadcaster()
+        subs = {name: hub.subscribe(user) for name, user in
+                {"ana": {"user_id": 1, "username": "ana"}, "bob": {"user_id": 2, "username": "bob"},
+                 "admin": {"user_id": 3, "username": "admin", "role": "admin"}}.items()}
+        for event in published:
+            hub.publish(event)
+        return {name: [sub.queue.get_nowait()["type"] for _ in range(sub.queue.qsize())] for name, sub in subs.items()}
+    return asyncio.run(run())
+
+
+def test_users_get_their_own_events_and_resync():
+    row = {"id": 7, "user_id": 1, "username": "ana", "mood": 5, "mood_score": 50, "created_at": "2024-01-01T10:00:00"}
+    got = _fanout(events.survey_created(row), events.surveys_imported(2, "bob", 3), events.resync())
+    assert got == {"ana": ["survey_created", "resync"], "bob": ["surveys_imported", "resync"],
+                   "admin": ["survey_created", "surveys_imported", "resync"]}
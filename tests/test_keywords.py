@@ -0,0 +1,47 @@
+"""Notes screening (app.keywords): folding, weights and the keyword file."""
+
+import os, time
+
+from app import keywords
+
+
+def test_fold_drops_accents_and_case():
+    assert keywords.fold("Estrés DEPRESIÓN") == "estres depresion"
+    assert keywords.fold("Straße ﬁn") == "strasse fin"
+    assert keywords.fold("ñandú") == "nandu"
+    assert keywords.fold("水 café") == "水 cafe"
+
+
+def test_penalty_takes_the_heaviest_keyword(tmp_path):
+    path = tmp_path / "keywords.csv"
+    path.write_text("keyword,weight\nmal,0.5\nmalestar,0.1\nDepresión,0.3\nno puedo,\n", encoding="utf-8")
+    screen = keywords.KeywordScreen(path=path)
+    assert screen.keywords() == {"mal": 0.5, "malestar": 0.1, "depresion": 0.3, "no puedo": keywords.DEFAULT_WEIGHT}
+    assert screen.penalty("MALESTAR general") == 0.5      # "mal" overlaps "malestar"
+    assert screen.penalty("depresión y no puedo") == 0.3
+    assert screen.penalty("todo bien") == 0.0
+    assert screen.penalty(None) == 0.0 and screen.penalty("") == 0.0
+    assert list(screen.penalties(["Estrés", "DEPRESION", None, "no PUEDO"])) == [0.0, 0.3, 0.0, keywords.DEFAULT_WEIGHT]
+
+
+def test_defaults_and_reload(tmp_path):
+    path = tmp_path / "keywords.csv"
+    screen = keywords.KeywordScreen(path=path, recheck=0)
+    assert screen.penalty("Mucho ESTRÉS") == keywords.DEFAULT_WEIGHT
+    version = screen.version()
+    path.write_text("keyword,weight\nestres,0.4\n", encoding="utf-8")
+    os.utime(path, ns=(time.time_ns() + 10**9,) * 2)
+    assert screen.penalty("Mucho ESTRÉS") == 0.4
+    assert screen.penalty("triste") == 0.0
+    assert screen.version() != version
+
+
+def test_penalties_match_penalty_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(keywords, "FOLD_BLOCK", 16)  # a handful of notes per block
+    notes = ["Estrés", None, "", "ﬁn de MALESTAR", "a\0mal", "水 triste", "Straße", "todo bien", 3.5] * 5
+    for n, rows in enumerate(["mal,0.5\nestres,0.2\nss,0.1", "水,0.3\ntriste,0.1"]):  # then a keyword outside Latin-1
+        path = tmp_path / f"keywords{n}.csv"
+        path.write_text("keyword,weight\n" + rows + "\n", encoding="utf-8")
+        screen = keywords.KeywordScreen(path=path)
+        expected = [screen.penalty(note) for note in notes]
+        assert list(screen.penalties(notes)) == expected and any(expected)
@@ -0,0 +1,58 @@
+"""In-memory lookups (app.lookups): alerts by user, recommendations by risk level."""
+
+import os, time
+
+from fastapi.testclient import TestClient
+
+from app import api, lookups, storage
+from app.utils import create_access_token
+
+ALERTS = [{"user_id": 1, "username": "ana", "avg_score": 55.0, "trend_negative": True, "risk_level": "ALTO"},
+          {"user_id": 2, "username": "bob", "avg_score": 85.0, "trend_negative": False, "risk_level": "BAJO"},
+          {"user_id": 9, "username": "ana", "avg_score": 70.0, "trend_negative": False, "risk_level": "MODERADO"}]
+
+
+def test_alerts_by_username_and_id(backend):
+    backend.save_alerts(ALERTS)
+    table = lookups.AlertTable(backend, recheck=0)
+    assert table.for_username("ana")["user_id"] == 9  # shared username: highest (user_id, username) key
+    assert table.for_user_id("1")["risk_level"] == "ALTO"
+    assert table.for_username("nobody") is None and table.reloads == 1
+
+    # writes through the API hand their rows over: no reload
+    changed = dict(ALERTS[1], risk_level="ALTO", trend_negative=True)
+    backend.save_alerts(ALERTS[:1] + [changed] + ALERTS[2:], changed=[changed])
+    table.saved(ALERTS[:1] + [changed] + ALERTS[2:], changed=[changed])
+    assert table.for_username("bob")["risk_level"] == "ALTO" and table.reloads == 1
+
+    # changes made elsewhere show up at the next check
+    backend.save_alerts(ALERTS[1:2])
+    if backend.name == "csv":
+        os.utime(backend.alerts_csv, ns=(time.time_ns() + 10**9,) * 2)
+    assert table.for_username("ana") is None and table.for_user_id(2)["risk_level"] == "BAJO"
+    assert table.reloads == 2
+
+
+def test_recommendations_by_normalized_level(tmp_path):
+    path = tmp_path / "recommendations.csv"
+    recs = lookups.RecommendationMap(path, recheck=0)
+    assert recs.get("ALTO") == ""
+    path.write_text("risk_level,recommendation\n alto ,Buscar ayuda\nALTO,duplicada\nBAJO,Seguir así\n", encoding="utf-8")
+    os.utime(path, ns=(time.time_ns() + 10**9,) * 2)
+    assert recs.get("Alto") == "Buscar ayuda"  # first row wins
+    assert recs.get(" bajo") == "Seguir así" and recs.get(None) == "" and recs.get("MODERADO") == ""
+    reloads = recs.reloads
+    recs.get("ALTO")
+    assert recs.reloads == reloads
+
+
+def test_recommendations_endpoint_uses_the_lookups(data_dir, monkeypatch):
+    monkeypatch.setattr(lookups, "alerts", lookups.AlertTable(recheck=0))
+    monkeypatch.setattr(lookups, "recommendations", lookups.RecommendationMap(data_dir / "recommendations.csv", recheck=0))
+    storage.get().save_alerts(ALERTS)
+    (data_dir / "recommendations.csv").write_text("risk_level,recommendation\nMODERADO,Monitoreo semanal\n", encoding="utf-8")
+    client = TestClient(api.app)
+    for username, level, text in (("ana", "MODERADO", "Monitoreo semanal"), ("carl", "BAJO", "")):
+        token = create_access_token({"user_id": 1, "username": username, "role": "user"})
+        body = client.get("/recommendations", headers={"Authorization": f"Bearer {token}"}).json()
+        assert (body["risk_level"], body["recommendation"]) == (level, text)
@@ -0,0 +1,105 @@
+"""Metrics (app.metrics): the Prometheus text format and what GET /metrics records."""
+
+import re
+
+from fastapi.testclient import TestClient
+
+from app import api, metrics, storage
+from app.utils import create_access_token, write_csv_rows
+from tests.conftest import survey
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{[a-z_]+="(?:[^"\\]|\\.)*"(?:,[a-z_]+="(?:[^"\\]|\\.)*")*\})? (-?[0-9.e+-]+)$')
+
+
+def _samples(text):
+    """{(name, labels text): value}, checking every line as it goes."""
+    out, declared = {}, set()
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith("# HELP "):
+            name = line.split()[2]
+            assert lines[i + 1].startswith(f"# TYPE {name} "), line
+            declared.add(name)
+        elif not line.startswith("# TYPE "):
+            m = SAMPLE.match(line)
+            assert m, line
+            assert re.sub(r"_(bucket|sum|count)$", "", m[1]) in declared or m[1] in declared, line
+            out[m[1], m[2] or ""] = float(m[3])
+    return out
+
+
+def test_counters_and_histograms_render_as_prometheus_text():
+    reg = metrics.Registry()
+    hits = reg.counter("t_hits_total", "Hits.", ("path",))
+    latency = reg.histogram("t_seconds", "Latency.", ("path",), buckets=(0.1, 1.0))
+    hits.inc(('a"b\\c\n',))
+    hits.inc(("plain",), 2.5)
+    for v in (0.05, 0.1, 0.5, 3.0):
+        reg.observe(latency, ("x",), v)
+    assert reg.render().splitlines() == [
+        "# HELP t_hits_total Hits.", "# TYPE t_hits_total counter",
+        't_hits_total{path="a\\"b\\\\c\\n"} 1',
+        't_hits_total{path="plain"} 2.5',
+        "# HELP t_seconds Latency.", "# TYPE t_seconds histogram",
+        't_seconds_bucket{path="x",le="0.1"} 2',  # le is inclusive
+        't_seconds_bucket{path="x",le="1"} 3',
+        't_seconds_bucket{path="x",le="+Inf"} 4',
+        't_seconds_sum{path="x"} 3.65',
+        't_seconds_count{path="x"} 4',
+    ]
+    assert reg.render().endswith("\n")
+
+
+def test_worker_recordings_merge_into_the_parent():
+    worker, parent = metrics.Registry(), metrics.Registry()
+    for reg in (worker, parent):
+        reg.counter("t_total", "T.", ("op",))
+        reg.histogram("t_seconds", "T.", ("op",), buckets=(1.0,))
+    worker._metrics["t_total"].inc(("plot",), 3)
+    worker.observe(worker._metrics["t_seconds"], ("plot",), 0.5)
+    parent.observe(parent._metrics["t_seconds"], ("plot",), 2.0)
+    parent.merge(worker.drain())
+    assert worker.drain() == {}  # drained means reset
+    samples = _samples(parent.render())
+    assert samples["t_total", '{op="plot"}'] == 3
+    assert samples["t_seconds_bucket", '{op="plot",le="1"}'] == 1
+    assert samples["t_seconds_count", '{op="plot"}'] == 2 and samples["t_seconds_sum", '{op="plot"}'] == 2.5
+
+
+def test_collectors_skip_missing_values_and_failures():
+    reg = metrics.Registry()
+
+    @reg.collector
+    def gauges():
+        yield "t_queue", "gauge", "Queue.", {("a",): 4, ("b",): None}, ("name",)
+
+    @reg.collector
+    def broken():
+        raise RuntimeError("not ready")
+    assert reg.render().splitlines() == ["# HELP t_queue Queue.", "# TYPE t_queue gauge", 't_queue{name="a"} 4']
+
+
+def test_metrics_endpoint_reports_routes_stages_and_csv_io(data_dir):
+    client = TestClient(api.app)
+    write_csv_rows(data_dir / "surveys.csv", [survey(1, 1, 6, "2024-01-01T10:00:00")], storage.SURVEY_FIELDS)
+    before = _samples(client.get("/metrics").text)
+    admin = create_access_token({"user_id": 90, "username": "metrics", "role": "admin"})  # not cached yet
+    assert client.get("/metrics/profiles/abc123", headers={"Authorization": f"Bearer {admin}"}).status_code == 404
+    write_csv_rows(data_dir / "surveys.csv", [survey(1, 1, 6, "2024-01-01T10:00:00"), survey(2, 1, 7, "2024-01-02T10:00:00")],
+                   storage.SURVEY_FIELDS)
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = _samples(resp.text)
+
+    def grew(name, labels):
+        return after.get((name, labels), 0) - before.get((name, labels), 0)
+    # route templates, never raw paths
+    assert grew("emotrack_http_requests_total", '{method="GET",route="/metrics/profiles/{profile_id}",status="404"}') == 1
+    assert not any("abc123" in labels for _, labels in after)
+    assert grew("emotrack_http_request_duration_seconds_count", '{method="GET",route="/metrics"}') == 1
+    assert grew("emotrack_stage_duration_seconds_count", '{stage="auth.decode"}') == 1
+    assert grew("emotrack_csv_rows_total", '{op="write",file="surveys.csv"}') == 2
+    assert grew("emotrack_csv_bytes_total", '{op="write",file="surveys.csv"}') == (data_dir / "surveys.csv").stat().st_size
+    assert after["emotrack_module_loaded", '{module="pandas"}'] in (0, 1)
+    assert ("emotrack_token_cache_lookups_total", '{result="hit"}') in after
@@ -0,0 +1,81 @@
+"""Plot render pool (app.render): hung jobs, dead workers and queue slots."""
+
+import asyncio, os, threading, time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import render
+
+
+@pytest.fixture
+def renderer(monkeypatch):
+    r = render.PlotRenderer(workers=0, queue_size=2, timeout=0.2)
+    yield r
+    r.shutdown()
+
+
+def test_hung_render_releases_its_slot(renderer, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(render, "_render", lambda username, kind: (release.wait(5), None))
+    for user in ("ana", "bob"):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(renderer.render(user, "hist", "v1"))
+    assert renderer.stats()["in_flight"] == 0
+    assert renderer.stats()["recycled"] == 2
+
+    monkeypatch.setattr(render, "_render", lambda username, kind: (b"png", None))
+    assert asyncio.run(renderer.render("carl", "hist", "v1")) == b"png"
+    release.set()
+
+
+def test_queued_job_is_cancelled_on_timeout(renderer, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(render, "_render", lambda username, kind: (release.wait(5), None))
+    running = renderer.submit("ana", "hist", "v1")   # occupies the single render thread
+
+    async def wait_queued():
+        with pytest.raises(asyncio.TimeoutError):
+            await renderer.render("bob", "hist", "v1")
+    asyncio.run(wait_queued())
+    assert renderer.stats()["recycled"] == 0
+    assert renderer.stats()["in_flight"] == 1
+    release.set()
+    running.result(5)
+    assert renderer.stats()["in_flight"] == 0
+
+
+def test_dead_worker_is_retried_on_a_fresh_pool(renderer, monkeypatch):
+    calls = []
+
+    def flaky(username, kind):
+        calls.append(username)
+        if len(calls) == 1:
+            raise BrokenProcessPool("worker died")
+        return b"png", None
+
+    monkeypatch.setattr(render, "_render", flaky)
+    assert asyncio.run(renderer.render("ana", "hist", "v1")) == b"png"
+    assert calls == ["ana", "ana"]
+    assert renderer.stats()["recycled"] == 1
+    assert renderer.stats()["in_flight"] == 0
+
+
+def test_recycle_kills_the_workers_it_started():
+    r = render.PlotRenderer(workers=1, queue_size=2, timeout=0.2)
+    pool = r._executor()
+    try:
+        pid = pool.submit(os.getpid).result(60)  # the worker is up and has reported in
+        hung = pool.submit(time.sleep, 60)
+        while not hung.running():  # handed to the worker, too late to cancel
+            time.sleep(0.01)
+        r._recycle(pool)
+        with pytest.raises(BrokenProcessPool):
+            hung.result(10)
+        assert r.stats()["recycled"] == 1 and r._pids == {}
+        with pytest.raises(OSError):
+            for _ in range(100):  # gone once the executor has reaped it
+                os.kill(pid, 0)
+                time.sleep(0.05)
+    finally:
+        r.shutdown()
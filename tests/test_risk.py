@@ -0,0 +1,86 @@
+"""Incremental risk engine (app.risk) against the batch analytics.compute_risk."""
+
+import pandas as pd
+
+from app import analytics, risk, storage
+from app.utils import write_csv_rows
+from tests.conftest import survey
+
+FIXTURE = [
+    # user1: falling mood on distinct days
+    survey(1, 1, 8, "2024-01-01T09:00:00"),
+    survey(2, 1, 6, "2024-01-02T09:00:00"),
+    survey(3, 1, 4, "2024-01-03T09:00:00"),
+    # user2: same timestamp three times, falling in file order
+    survey(4, 2, 9, "2024-01-05T10:00:00"),
+    survey(5, 2, 7, "2024-01-05T10:00:00"),
+    survey(6, 2, 5, "2024-01-05T10:00:00"),
+    # user3: same timestamp three times, rising in file order
+    survey(7, 3, 3, "2024-01-05T10:00:00"),
+    survey(8, 3, 5, "2024-01-05T10:00:00"),
+    survey(9, 3, 7, "2024-01-05T10:00:00"),
+    # user4: blanks, keyword notes and a survey dated before the previous one
+    survey(10, 4, 5, "2024-01-04T08:00:00", sleep_hours="", notes="Estrés en el trabajo"),
+    survey(11, 4, 9, "2024-01-02T08:00:00", appetite="", concentration=""),
+    survey(12, 4, 2, "2024-01-06T08:00:00", notes="me siento MAL"),
+]
+
+# appended one by one after the first rebuild, ties and out-of-order dates included
+LATER = [
+    survey(13, 1, 3, "2024-01-03T09:00:00"),
+    survey(14, 2, 8, "2024-01-05T10:00:00"),
+    survey(15, 3, 2, "2024-01-01T10:00:00"),
+    survey(16, 5, 6, "2024-01-07T12:00:00"),
+    survey(17, 4, 1, "2024-01-06T08:00:00", notes="no puedo dormir"),
+]
+
+
+def _engine(rows):
+    write_csv_rows(storage.get().surveys_csv, rows, storage.SURVEY_FIELDS)
+    engine = risk.RiskEngine()
+    engine.rebuild()
+    return engine
+
+
+def _batch():
+    return {(int(a["user_id"]), a["username"]): a for a in analytics.compute_risk(write_alerts=False)["alerts"]}
+
+
+def test_rebuild_matches_batch(data_dir):
+    engine = _engine(FIXTURE)
+    assert engine.check() == []
+
+
+def test_incremental_adds_match_batch(data_dir):
+    engine = _engine(FIXTURE)
+    backend = storage.get()
+    for row in LATER:
+        backend.append_surveys([row])
+        engine.add(row)
+        assert engine.check() == []
+    batch = _batch()
+    mine = {(a["user_id"], a["username"]): a for a in engine.alerts()}
+    assert mine.keys() == batch.keys()
+    for key, alert in mine.items():
+        assert alert["avg_score"] == batch[key]["avg_score"]
+        assert alert["trend_negative"] == bool(batch[key]["trend_negative"])
+        assert alert["risk_level"] == batch[key]["risk_level"]
+
+
+def test_block_add_matches_batch(data_dir):
+    engine = _engine(FIXTURE)
+    storage.get().append_surveys(LATER)
+    engine.add_many(LATER)
+    assert engine.check() == []
+
+
+def test_tied_timestamps_later_row_is_newer(data_dir):
+    engine = _engine(FIXTURE)
+    batch = _batch()
+    assert engine.alert_for(2, "user2")["trend_negative"] and batch[(2, "user2")]["trend_negative"]
+    assert not engine.alert_for(3, "user3")["trend_negative"] and not batch[(3, "user3")]["trend_negative"]
+    df = pd.DataFrame(FIXTURE)
+    df["created_at"] = pd.to_datetime(df["created_at"])
+    assert analytics.trend_negative_for_user(df[df["user_id"] == 2])
+    assert not analytics.trend_negative_for_user(df[df["user_id"] == 3])
+    assert analytics.negative_trends(df).to_dict() == {uid: analytics.trend_negative_for_user(g) for uid, g in df.groupby("user_id")}
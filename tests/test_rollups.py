@@ -0,0 +1,44 @@
+"""Daily mood rollup (app.rollups) against the original resample('D').mean().ffill()."""
+
+import pandas as pd
+
+from app import rollups, storage
+from app.utils import write_csv_rows
+from tests.conftest import survey
+
+ROWS = [
+    survey(1, 1, 4, "2024-03-01T08:00:00"),
+    survey(2, 2, 8, "2024-03-01T20:00:00"),
+    survey(3, 1, 7, "2024-03-04T09:00:00"),
+    {**survey(4, 2, 2, "2024-03-06T09:00:00"), "mood": ""},
+    survey(5, 1, 5, "2024-03-08T09:00:00"),
+]
+
+
+def _rollup():
+    write_csv_rows(storage.get().surveys_csv, ROWS, storage.SURVEY_FIELDS)
+    return rollups.DailyMoodRollup()
+
+
+def test_full_range_matches_resample(data_dir):
+    df = pd.DataFrame(ROWS)
+    df["mood"] = pd.to_numeric(df["mood"], errors="coerce")
+    df["created_at"] = pd.to_datetime(df["created_at"])
+    ts = df.set_index("created_at").resample("D")["mood"].mean().ffill()
+    avg, total, history = _rollup().summary()
+    assert total == 4 and avg == df["mood"].mean()
+    assert history == [{"date": d.strftime("%Y-%m-%d"), "mood": m} for d, m in ts.items()]
+
+
+def test_window_carries_the_previous_mood_in(data_dir):
+    avg, total, history = _rollup().summary("2024-03-02", "2024-03-05")
+    assert (avg, total) == (7, 1)
+    assert [h["mood"] for h in history] == [6.0, 6.0, 7.0, 7.0]
+    assert history[0]["date"] == "2024-03-02" and history[-1]["date"] == "2024-03-05"
+
+
+def test_window_without_moods_is_empty(data_dir):
+    r = _rollup()
+    assert r.summary("2024-03-05", "2024-03-07") == (0, 0, [])   # only a blank mood inside
+    assert r.summary("2024-04-01", "2024-04-30") == (0, 0, [])
+    assert r.summary("2024-03-09", None) == (0, 0, [])
@@ -0,0 +1,72 @@
+"""Storage backends (app.storage): the CSV files and SQLite (WAL) behave alike."""
+
+import sqlite3
+
+import pytest
+
+from app import storage
+from app.utils import write_csv_rows
+from tests.conftest import survey
+
+USERS = [{"id": 1, "username": "user1", "email": "u1@x.org", "hashed_password": "p", "role": "user", "created_at": "2024-01-01T00:00:00"},
+         {"id": 2, "username": "user2", "email": "", "hashed_password": "q", "role": "admin", "created_at": "2024-01-02T00:00:00"}]
+SURVEYS = [survey(1, 1, 6, "2024-01-02T10:00:00", notes="bien, \"gracias\""),
+           survey(2, 2, 3, "2024-01-01T09:00:00", sleep_hours="", appetite=""),
+           survey(3, 1, 9, "2024-01-03T08:00:00", sleep_hours=6.5)]
+ALERTS = [{"user_id": 2, "username": "user2", "avg_score": 30.0, "trend_negative": True, "risk_level": "ALTO"},
+          {"user_id": 1, "username": "user1", "avg_score": 75.0, "trend_negative": False, "risk_level": "BAJO"}]
+
+
+def _text(row):
+    """A row as CSV text; sleep_hours compared as a number (SQLite stores REAL: 7 reads back as 7.0)."""
+    return {k: "" if v is None or v == "" else str(float(v) if k == "sleep_hours" else v) for k, v in row.items()}
+
+
+def test_rows_read_back_the_same(backend):
+    backend.append_users(USERS)
+    backend.append_surveys(SURVEYS)
+    assert backend.read_users() == [_text(u) for u in USERS]
+    assert backend.max_survey_id() == 3
+    assert [_text(r) for r in backend.iter_surveys()] == [_text(r) for r in SURVEYS]
+    assert [r["id"] for r in map(_text, backend.iter_surveys(usernames=["user1"]))] == ["1", "3"]
+    assert [r["id"] for r in map(_text, backend.iter_surveys(user_ids=[2]))] == ["2"]
+    df = backend.read_surveys(["mood", "sleep_hours"], usernames=["user1"])
+    assert df["mood"].tolist() == [6, 9] and df["sleep_hours"].tolist() == [7.0, 6.5]
+
+
+def test_stamps_move_on_writes(backend):
+    users, surveys = backend.users_stamp(), backend.surveys_stamp()
+    backend.append_surveys(SURVEYS[:1])
+    assert backend.surveys_stamp() != surveys and backend.users_stamp() == users
+    backend.append_users(USERS[:1])
+    assert backend.users_stamp() != users
+
+
+def test_alert_pages_and_partial_saves(backend):
+    backend.save_alerts(ALERTS)
+    assert [(a["user_id"], a["trend_negative"]) for a in sorted(backend.read_alerts(), key=storage.alert_key)] == [(1, False), (2, True)]
+    total, rows = backend.page_alerts(limit=1)
+    assert total == 2 and [a["username"] for a in rows] == ["user1"]
+    total, rows = backend.page_alerts(after=storage.alert_key(rows[0]), limit=1)
+    assert [a["username"] for a in rows] == ["user2"]
+    assert backend.page_alerts(risk_level="alto")[0] == 1
+    changed = dict(ALERTS[1], risk_level="MEDIO")
+    backend.save_alerts([ALERTS[0], changed], changed=[changed])
+    assert {a["username"]: a["risk_level"] for a in backend.read_alerts()} == {"user1": "MEDIO", "user2": "ALTO"}
+
+
+def test_migration_round_trip(data_dir):
+    write_csv_rows(data_dir / "users.csv", USERS, storage.USER_FIELDS)
+    write_csv_rows(data_dir / "surveys.csv", SURVEYS, storage.SURVEY_FIELDS)
+    write_csv_rows(data_dir / "alerts.csv", ALERTS, storage.ALERT_FIELDS)
+    path = data_dir / "migrated.db"
+    assert storage.migrate_csv_to_sqlite(path, data_dir) == {"users": 2, "surveys": 3, "alerts": 2, "path": str(path)}
+
+    src, dst = storage.CSVStorage(data_dir), storage.SQLiteStorage(path)
+    assert dst.read_users() == src.read_users()
+    assert [_text(r) for r in dst.iter_surveys()] == [_text(r) for r in src.iter_surveys()]  # ids and created_at stamps as written
+    assert dst.max_survey_id() == src.max_survey_id() == 3
+    assert sorted(dst.read_alerts(), key=storage.alert_key) == sorted(src.read_alerts(), key=storage.alert_key)
+    assert sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with pytest.raises(RuntimeError):
+        storage.migrate_csv_to_sqlite(path, data_dir)  # never twice into the same database
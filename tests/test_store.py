@@ -0,0 +1,91 @@
+"""Append-only stores (app.store): survey ids and appends."""
+
+import os, time
+
+from app import storage, store
+from app.utils import read_csv_rows, write_csv_rows
+from tests.conftest import survey
+
+
+def _touch(path):
+    os.utime(path, ns=(time.time_ns() + 10**9,) * 2)
+
+
+def test_surveys_are_appended_not_rewritten(data_dir):
+    path = data_dir / "surveys.csv"
+    write_csv_rows(path, [survey(1, 1, 5, "2024-01-01T10:00:00"), survey(5, 2, 6, "2024-01-02T10:00:00"),
+                          survey(3, 1, 7, "2024-01-03T10:00:00")], storage.SURVEY_FIELDS)
+    before, inode = path.read_bytes(), path.stat().st_ino
+    s = store.SurveyStore(storage.CSVStorage(data_dir))
+    assert s.next_id() == 6  # highest id, not the last line's
+    assert s.append(survey(None, 1, 4, "2024-01-04T10:00:00"))["id"] == 6
+    assert [r["id"] for r in s.append_many([survey(None, 2, 3, "2024-01-05T10:00:00"), survey(None, 2, 2, "2024-01-06T10:00:00")])] == [7, 8]
+    after = path.read_bytes()
+    assert after.startswith(before) and path.stat().st_ino == inode
+    assert after.count(b"id,user_id") == 1
+    assert [r["id"] for r in read_csv_rows(path)] == ["1", "5", "3", "6", "7", "8"]
+
+
+def test_appends_start_a_new_file_and_repair_a_missing_newline(data_dir):
+    path = data_dir / "surveys.csv"
+    s = store.SurveyStore(storage.CSVStorage(data_dir))
+    assert s.append(survey(None, 1, 5, "2024-01-01T10:00:00"))["id"] == 1
+    path.write_bytes(path.read_bytes().rstrip(b"\r\n"))  # edited by hand, last newline lost
+    _touch(path)
+    assert s.append(survey(None, 1, 6, "2024-01-02T10:00:00"))["id"] == 2
+    assert [(r["id"], r["mood"]) for r in read_csv_rows(path)] == [("1", "5"), ("2", "6")]
+
+
+def test_outside_changes_are_picked_up_and_compact_sorts(data_dir):
+    path = data_dir / "surveys.csv"
+    s = store.SurveyStore(storage.CSVStorage(data_dir))
+    s.append_many([survey(None, 1, m, "2024-01-01T10:00:00") for m in (5, 6)])
+    write_csv_rows(path, read_csv_rows(path) + [survey(10, 1, 9, "2024-01-03T10:00:00"), survey(2, 1, 7, "2024-01-02T10:00:00")],
+                   storage.SURVEY_FIELDS)
+    _touch(path)
+    assert s.append(survey(None, 1, 4, "2024-01-04T10:00:00"))["id"] == 11
+    assert s.compact() == {"rows": 4, "dropped": 1}  # id 2 twice: the later row wins
+    assert [(r["id"], r["mood"]) for r in read_csv_rows(path)] == [("1", "5"), ("2", "7"), ("10", "9"), ("11", "4")]
+
+
+def _user(name, email=None, id=None):
+    return {"id": id, "username": name, "email": email or f"{name.lower()}@x.org", "hashed_password": "pw", "role": "user",
+            "created_at": "2024-01-01T00:00:00"}
+
+
+def test_user_index_lookups_and_duplicates(data_dir, monkeypatch):
+    write_csv_rows(data_dir / "users.csv", [_user("Ana", id=1), _user("bob", id=7)], storage.USER_FIELDS)
+    backend = storage.CSVStorage(data_dir)
+    reads = []
+    monkeypatch.setattr(backend, "read_users", lambda real=backend.read_users: reads.append(1) or real())
+    users = store.UserDirectory(backend)
+    assert [u["id"] for u in users.by_username("ANA")] == ["1"]
+    assert users.by_email("BOB@X.ORG")["username"] == "bob"
+    assert users.by_id(7)["username"] == "bob" and users.by_id(2) is None
+    assert len(reads) == 1  # lookups come from the index
+
+    results = users.add_many([_user("carl"), _user("ana", "new@x.org"), _user("dora", "Bob@x.org"), _user("Carl", "c2@x.org")])
+    assert results[0]["id"] == 8
+    assert [str(r) for r in results[1:]] == ["username", "email", "username"]
+    assert users.add(_user("eve"))["id"] == 9
+    assert users.by_username("carl")[0]["id"] == "8" and len(reads) == 1  # our own appends are indexed, not re-read
+    assert [u["username"] for u in read_csv_rows(data_dir / "users.csv")] == ["Ana", "bob", "carl", "eve"]
+
+
+def test_user_index_reloads_after_outside_edits(data_dir):
+    path = data_dir / "users.csv"
+    users = store.UserDirectory(storage.CSVStorage(data_dir))
+    assert users.by_username("ana") == []
+    write_csv_rows(path, [_user("ana", id=1), _user("zoe", id=4)], storage.USER_FIELDS)
+    _touch(path)
+    assert users.by_id(4)["username"] == "zoe"
+    assert users.add(_user("max"))["id"] == 5
+
+    # a peer worker's registration is adopted when our index was current before it
+    peer_backend = storage.CSVStorage(data_dir)
+    peer = store.UserDirectory(peer_backend)
+    peer.by_id(1)
+    row = users.add(_user("ivy"))
+    peer.adopt([row], *users.last_append)
+    peer_backend.read_users = None  # adopted rows need no reload
+    assert peer.by_email("ivy@x.org")["id"] == "6"
@@ -0,0 +1,76 @@
+"""In-memory survey table (app.table): clustering, latest() and reloads."""
+
+import os, time
+
+from app import storage, table
+from app.utils import read_csv_rows, write_csv_rows
+from tests.conftest import survey
+
+ROWS = [
+    survey(1, 1, 6, "2024-01-02T10:00:00", sleep_hours=7.5, notes="bien"),
+    survey(2, 2, 3, "2024-01-01T09:00:00", sleep_hours=7.0),
+    survey(3, 1, 5, "2024-01-03T08:00:00", sleep_hours="", appetite="", mood_score=""),
+    survey(4, 1, 4, "2024-01-02T10:00:00", sleep_hours=6.25, concentration="alta"),   # tied with id 1
+    survey(5, 2, 8, "", sleep_hours=8.0),                                            # unreadable date
+    survey(6, 1, 7, "2024-01-01T23:59:59", sleep_hours=7.0, notes="muy, \"raro\""),
+    survey(7, 2, 2, "2024-01-04T12:00:00", sleep_hours=5.5),
+    survey(8, 1, 9, "2024-01-02T10:00:00", sleep_hours=9.0),                         # tied again
+]
+
+
+def _write(data_dir, rows):
+    write_csv_rows(data_dir / "surveys.csv", rows, storage.SURVEY_FIELDS)
+
+
+def test_views_are_clustered_in_file_order(data_dir):
+    _write(data_dir, ROWS)
+    assert table.surveys.view("user1")["id"].tolist() == [1, 3, 4, 6, 8]
+    assert table.surveys.view("user2")["id"].tolist() == [2, 5, 7]
+    assert len(table.surveys.view("nobody")) == 0
+    assert table.surveys.view("user1").notes() == ["bien", "", "", "muy, \"raro\"", ""]
+    assert table.surveys.frame(usernames=["user2", "user1"])["id"].tolist() == [2, 5, 7, 1, 3, 4, 6, 8]
+    assert table.surveys.frame(["concentration"])["concentration"].tolist() == [5, 5, 5, "alta", 5, 5, 5, 5]
+    assert table.check() == []  # frame() reads like storage.read_surveys
+
+
+def test_latest_returns_the_csv_rows_newest_first(data_dir):
+    _write(data_dir, ROWS)
+    on_disk = read_csv_rows(data_dir / "surveys.csv")
+    for user in ("user1", "user2"):
+        # what /stats returned before the table: the CSV rows sorted by their created_at text
+        expected = sorted([r for r in on_disk if r["username"] == user], key=lambda r: r["created_at"], reverse=True)
+        assert table.surveys.view(user).latest(5) == expected[:5]
+    assert [r["id"] for r in table.surveys.view("user1").latest(3)] == ["3", "1", "4"]
+
+
+def test_appends_merge_into_the_base(data_dir):
+    _write(data_dir, ROWS[:2])
+    t = table.SurveyTable(storage.CSVStorage(data_dir), tail_rows=4)
+    assert len(t) == 2
+    for r in ROWS[2:]:
+        t.backend.append_surveys([r])
+        t.add_many([r])
+    assert (t.loads, t.merges) == (1, 1)
+    assert t.stats()["tail"] == 2
+    assert t.view("user1")["id"].tolist() == [1, 3, 4, 6, 8]
+    assert [r["id"] for r in t.view("user2").latest(3)] == ["7", "2", "5"]
+    t.add_many(ROWS[-2:])  # already appended: nothing to do
+    assert (t.loads, len(t)) == (1, len(ROWS))
+    assert table.check(t) == []
+
+
+def test_gaps_and_outside_edits_reload(data_dir):
+    _write(data_dir, ROWS[:3])
+    t = table.SurveyTable(storage.CSVStorage(data_dir))
+    assert len(t) == 3 and t.loads == 1
+    # ids that do not follow ours: read storage instead of guessing
+    t.backend.append_surveys(ROWS[3:5])
+    t.add_many(ROWS[4:5])
+    assert t.loads == 2 and len(t) == 5
+    # surveys.csv rewritten behind our back
+    _write(data_dir, ROWS[:2])
+    os.utime(data_dir / "surveys.csv", ns=(time.time_ns() + 10**9,) * 2)
+    assert t.view("user1")["id"].tolist() == [1]
+    assert t.loads == 3
+    t.invalidate()
+    assert len(t) == 2 and t.loads == 4
@@ -0,0 +1,68 @@
+"""Token helpers (app.utils): the verified-token cache."""
+
+import pytest
+from jose import jwt
+
+from app import utils
+from app.utils import create_access_token
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """Tokens that reached jwt.decode, in order."""
+    seen, real = [], utils.decode_access_token
+    monkeypatch.setattr(utils, "decode_access_token", lambda token: seen.append(token) or real(token))
+    return seen
+
+
+def test_a_verified_token_is_decoded_once(decodes):
+    cache = utils.TokenCache(max_entries=4)
+    token = create_access_token({"user_id": 1, "username": "ana", "role": "user"})
+    assert cache.decode(token)["username"] == "ana"
+    assert cache.decode(token) is cache.decode(token)
+    assert decodes == [token]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["hit_rate"]) == (2, 1, 1, 0.6667)
+
+
+def test_cached_tokens_expire_with_their_exp(decodes, monkeypatch):
+    cache = utils.TokenCache(max_entries=4)
+    token = create_access_token({"user_id": 1, "username": "ana"}, expires_minutes=1)
+    exp = jwt.get_unverified_claims(token)["exp"]
+    now = [exp - 30]
+    monkeypatch.setattr(utils.time, "time", lambda: now[0])
+    cache.decode(token)
+    cache.decode(token)
+    now[0] = exp  # exp itself is past: never served from memory
+    cache.decode(token)
+    assert decodes == [token, token]
+    assert (cache.stats()["expired"], cache.stats()["entries"]) == (1, 0)
+
+
+def test_failed_or_expiryless_tokens_are_not_cached(decodes):
+    cache = utils.TokenCache(max_entries=4)
+    forever = jwt.encode({"user_id": 1, "username": "ana"}, utils.SECRET_KEY, algorithm=utils.ALGORITHM)
+    forged = jwt.encode({"user_id": 1, "username": "ana", "exp": 2**40}, "another secret", algorithm=utils.ALGORITHM)
+    for token in (forever, forever, forged, forged, "not-a-token"):
+        cache.decode(token)
+    assert cache.decode(forged) is None and cache.decode(forever)["username"] == "ana"
+    assert len(decodes) == 7 and cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_clear_and_disabled(decodes):
+    cache = utils.TokenCache(max_entries=2)
+    a, b, c = (create_access_token({"user_id": i, "username": name}) for i, name in enumerate("abc"))
+    for token in (a, b, a, c):  # a was used last: b is the oldest
+        cache.decode(token)
+    assert cache.stats()["evictions"] == 1
+    decodes.clear()
+    cache.decode(a), cache.decode(c), cache.decode(b)
+    assert decodes == [b]
+
+    cache.clear()
+    cache.decode(a)
+    assert decodes == [b, a]
+
+    off = utils.TokenCache(max_entries=0)
+    off.decode(a), off.decode(a)
+    assert off.stats()["enabled"] is False and off.stats()["hits"] == 0 and decodes[-2:] == [a, a]
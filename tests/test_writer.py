@@ -0,0 +1,111 @@
+"""Group commit (app.writer) under concurrent submitters: nothing lost, duplicated or mixed up."""
+
+import contextlib, threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from app import cluster, risk, rollups, store, table, writer
+
+THREADS = 16
+PER_THREAD = 25
+
+
+@pytest.fixture
+def commits(backend):
+    surveys = table.SurveyTable(backend)
+    w = writer.GroupWriter(window_ms=5, max_group=64, surveys=store.SurveyStore(backend), users=store.UserDirectory(backend),
+                           engine=risk.RiskEngine(backend, survey_table=surveys), rollup=rollups.DailyMoodRollup(backend, survey_table=surveys),
+                           survey_table=surveys)
+    yield w
+    w.stop()
+
+
+def _row(tag, i):
+    return {"user_id": i % 7 + 1, "username": f"user{i % 7 + 1}", "mood": i % 10 + 1, "mood_score": (i % 10 + 1) * 10,
+            "sleep_hours": 7, "appetite": "", "concentration": 5, "notes": tag, "created_at": f"2024-01-{i % 28 + 1:02d}T10:00:00"}
+
+
+def test_concurrent_surveys_are_stored_once_with_consecutive_ids(commits, backend):
+    start = threading.Barrier(THREADS)
+
+    def submit(t):
+        start.wait()
+        out = []
+        for j in range(PER_THREAD):
+            # every third request is a small block, like /surveys/batch
+            rows = [_row(f"t{t}-{j}-{k}", t * 100 + j) for k in range(3 if j % 3 == 0 else 1)]
+            out.append((rows, commits.add_surveys(rows, bulk=len(rows) > 1)))
+        return out
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        submitted = [req for reqs in pool.map(submit, range(THREADS)) for req in reqs]
+
+    expected = 0
+    for rows, fut in submitted:
+        stored = fut.result(30)
+        # each caller gets its own rows back, in order, with consecutive ids
+        assert [r["notes"] for r in stored] == [r["notes"] for r in rows]
+        assert [r["id"] for r in stored] == list(range(stored[0]["id"], stored[0]["id"] + len(rows)))
+        expected += len(rows)
+
+    on_disk = list(backend.iter_surveys())
+    ids = [int(r["id"]) for r in on_disk]
+    assert ids == list(range(1, expected + 1))
+    assert sorted(r["notes"] for r in on_disk) == sorted(r["notes"] for rows, _ in submitted for r in rows)
+    assert {int(r["id"]): r["notes"] for r in on_disk} == {r["id"]: r["notes"] for _, fut in submitted for r in fut.result()}
+    assert commits.stats()["rows"] == expected
+    assert commits.stats()["groups"] < len(submitted)  # requests were actually grouped
+
+    # derived state saw every row once
+    assert len(commits._table) == expected
+    assert commits._engine.check() == []
+
+
+def test_concurrent_registrations_reject_duplicates_once(commits):
+    names = [f"person{i % 20}" for i in range(80)]  # each name submitted 4 times
+
+    def register(i):
+        return commits.add_user({"username": names[i].upper() if i % 2 else names[i], "email": f"{names[i]}@x.org",
+                                 "hashed_password": "x", "role": "user", "created_at": "2024-01-01T00:00:00"})
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        futures = list(pool.map(register, range(len(names))))
+    ok = [f.result(30) for f in futures if f.exception(30) is None]
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    assert len(ok) == 20 and len(errors) == 60
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert sorted(int(u["id"]) for u in ok) == list(range(1, 21))
+    assert sorted(u["username"].lower() for u in ok) == sorted(set(names))
+
+
+def test_failed_lock_fails_the_group_but_not_the_writer(commits, monkeypatch):
+    @contextlib.contextmanager
+    def broken():
+        raise OSError("flock failed")
+        yield
+
+    monkeypatch.setattr(cluster.node, "lock", broken)
+    with pytest.raises(writer.Unavailable):
+        writer.wait(commits.add_surveys([_row("lost", 1)]), 10)
+    monkeypatch.undo()
+    assert writer.wait(commits.add_surveys([_row("kept", 2)]), 10)[0]["id"] == 1
+    assert commits.stats()["failures"] == 1
+
+
+def test_failed_announce_still_answers_stored_rows(commits, monkeypatch):
+    def broken(*args, **kwargs):
+        raise OSError("peer socket gone")
+
+    monkeypatch.setattr(cluster.node, "announce", broken)
+    stored = writer.wait(commits.add_surveys([_row("a", 1), _row("b", 2)], bulk=True), 10)
+    user = commits.add_user({"username": "ana", "email": "ana@x.org", "hashed_password": "x", "role": "user", "created_at": "2024-01-01T00:00:00"})
+    assert [r["id"] for r in stored] == [1, 2]
+    assert writer.wait(user, 10)["id"] == 1  # on disk: the caller gets its rows
+    assert commits.stats()["failures"] == 2
+    assert len(commits._table) == 2  # derived state reloads from storage
+
+
+def test_wait_gives_up_after_the_timeout():
+    with pytest.raises(writer.Unavailable):
+        writer.wait(Future(), 0.01)